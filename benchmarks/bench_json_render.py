@@ -0,0 +1,83 @@
+'''
+Vendors with devices (VendorSchemaOut): ORM hydration + pydantic
+serialization against json assembled by Postgres (json_agg).
+
+    python benchmarks/bench_json_render.py --seed 100000
+
+--seed N inserts 100 vendors and N devices first (into the database from
+.env, use a scratch one). Both paths read the same rows, the response
+bodies are compared before timing.
+'''
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.getcwd() + '/source')  # noqa #isort:skip
+
+from db.db import async_session_maker, engine  # noqa: E402
+from db.models.devices import Device  # noqa: E402
+from db.models.vendors import Vendor  # noqa: E402
+from db.sa_crud import CRUDSA  # noqa: E402
+from offload import dump_json_many  # noqa: E402
+from schemas.vendors import VendorSchemaOut  # noqa: E402
+from sqlalchemy import insert, select  # noqa: E402
+from sqlalchemy.orm import selectinload  # noqa: E402
+
+VENDORS = 100
+REPEAT = 5
+
+
+async def seed(devices: int) -> None:
+    async with async_session_maker() as session, session.begin():
+        vendor_ids = list(await session.scalars(
+            insert(Vendor).returning(Vendor.id),
+            [{'name': f'bench vendor {i}'} for i in range(VENDORS)]))
+        for start in range(0, devices, 10000):
+            await session.execute(insert(Device), [
+                {'serial': f'bench-{i}', 'name': f'device {i}',
+                 'type': 'device', 'vendor_id': vendor_ids[i % VENDORS]}
+                for i in range(start, min(start + 10000, devices))])
+
+
+async def orm() -> bytes:
+    async with async_session_maker() as session:
+        vendors = (await session.scalars(
+            select(Vendor).options(selectinload(Vendor.devices))
+            .order_by(Vendor.id))).all()
+        return dump_json_many(VendorSchemaOut, vendors)
+
+
+async def db() -> bytes:
+    async with async_session_maker() as session:
+        chunks = [chunk async for chunk in CRUDSA(Vendor).stream_json(
+            session, VendorSchemaOut)]
+        return b''.join(chunks)
+
+
+async def timed(name: str, function) -> bytes:
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        body = await function()
+        timings.append(time.perf_counter() - start)
+    print(f'{name}: best {min(timings) * 1000:8.1f} ms, '
+          f'{len(body) / 1e6:.1f} MB')
+    return body
+
+
+async def main(devices: int) -> None:
+    if devices:
+        await seed(devices)
+    orm_body = await timed('orm', orm)
+    db_body = await timed('db ', db)
+    assert json.loads(orm_body) == json.loads(db_body), 'bodies differ'
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seed', type=int, default=0)
+    asyncio.run(main(parser.parse_args().seed))
@@ -0,0 +1,50 @@
+'''
+Logging overhead per call on the request path.
+
+    python benchmarks/bench_logging.py
+
+Compares eager f-string and lazy debug records with DEBUG disabled, and
+inline vs queue-backed (enqueue) sinks with INFO enabled.
+'''
+import os
+import sys
+import tempfile
+from timeit import timeit
+
+sys.path.append(os.getcwd() + '/source')  # noqa #isort:skip
+
+from loguru import logger  # noqa: E402
+
+NUMBER = 20000
+data = {'name': 'vendor', 'devices': list(range(100))}
+
+
+def per_call(function) -> str:
+    return f'{timeit(function, number=NUMBER) / NUMBER * 1e6:8.2f} us'
+
+
+def bench_disabled() -> None:
+    logger.remove()
+    logger.add(lambda _: None, level='INFO')
+    print('debug disabled, f-string:',
+          per_call(lambda: logger.debug(f'create data: {data}')))
+    print('debug disabled, lazy:    ',
+          per_call(lambda: logger.opt(lazy=True).debug(
+              'create data: {}', lambda: data)))
+
+
+def bench_sinks() -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        for enqueue in (False, True):
+            logger.remove()
+            logger.add(f'{directory}/log_{enqueue}', level='INFO',
+                       enqueue=enqueue)
+            print(f'info file sink, enqueue={enqueue}:',
+                  per_call(lambda: logger.info('create data: {}', data)))
+            logger.complete()
+    logger.remove()
+
+
+if __name__ == '__main__':
+    bench_disabled()
+    bench_sinks()
@@ -8,11 +8,13 @@ sys.path.append(current_dir + "/source")  # noqa #isort:skip
 
 from alembic import context
 from config import settings
+from db.models.aggregates import AggregateRefresh
+from db.models.audit import AuditRecord
 from db.models.base import BaseCommon
-from db.models.buildings import Building
+from db.models.cartridges import Cartridge, Model
 from db.models.devices import Device
-from db.models.persons import Person
-from db.models.rooms import Room
+from db.models.idempotency import IdempotencyKey
+from db.models.jobs import Job
 from db.models.users import User
 from db.models.vendors import Vendor
 from sqlalchemy import pool
@@ -81,6 +83,10 @@ async def run_async_migrations() -> None:
 def run_migrations_online() -> None:
     """Run migrations in 'online' mode."""
 
+    if (connection := config.attributes.get('connection')) is not None:
+        # Connection of the caller (tests/conftest.py migrated fixture).
+        do_run_migrations(connection)
+        return
     asyncio.run(run_async_migrations())
 
 
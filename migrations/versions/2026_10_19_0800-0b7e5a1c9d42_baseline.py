@@ -0,0 +1,83 @@
+"""baseline: user, vendor, device, model, cartridge
+
+Revision ID: 0b7e5a1c9d42
+Revises: 
+Create Date: 2026-10-19 08:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '0b7e5a1c9d42'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'user',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('email', sa.String(length=320), nullable=False),
+        sa.Column('hashed_password', sa.String(length=1024), nullable=False),
+        sa.Column('is_active', sa.Boolean(), nullable=False),
+        sa.Column('is_superuser', sa.Boolean(), nullable=False),
+        sa.Column('is_verified', sa.Boolean(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(op.f('ix_user_email'), 'user', ['email'], unique=True)
+    op.create_table(
+        'vendor',
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(op.f('ix_vendor_name'), 'vendor', ['name'], unique=True)
+    op.create_table(
+        'device',
+        sa.Column('serial', sa.String(), nullable=False),
+        sa.Column('name', sa.String(), nullable=True),
+        sa.Column('type', sa.String(), nullable=False),
+        sa.Column('created', sa.DateTime(timezone=True),
+                  server_default=sa.text('now()'), nullable=False),
+        sa.Column('vendor_id', sa.Integer(), nullable=True),
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['vendor_id'], ['vendor.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(op.f('ix_device_serial'), 'device', ['serial'],
+                    unique=True)
+    op.create_table(
+        'model',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('vendor_id', sa.Integer(), nullable=True),
+        sa.Column('original_id', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['original_id'], ['model.id']),
+        sa.ForeignKeyConstraint(['vendor_id'], ['vendor.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(op.f('ix_model_name'), 'model', ['name'], unique=True)
+    op.create_table(
+        'cartridge',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('model_id', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['id'], ['device.id']),
+        sa.ForeignKeyConstraint(['model_id'], ['model.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('cartridge')
+    op.drop_index(op.f('ix_model_name'), table_name='model')
+    op.drop_table('model')
+    op.drop_index(op.f('ix_device_serial'), table_name='device')
+    op.drop_table('device')
+    op.drop_index(op.f('ix_vendor_name'), table_name='vendor')
+    op.drop_table('vendor')
+    op.drop_index(op.f('ix_user_email'), table_name='user')
+    op.drop_table('user')
@@ -0,0 +1,45 @@
+"""add job table
+
+Revision ID: 3f1c2a9b7d10
+Revises: 0b7e5a1c9d42
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1c2a9b7d10'
+down_revision: Union[str, None] = '0b7e5a1c9d42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'job',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(), nullable=False),
+        sa.Column('target', sa.String(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('options', postgresql.JSONB(), nullable=False),
+        sa.Column('payload', postgresql.JSONB(), nullable=False),
+        sa.Column('total', sa.Integer(), nullable=False),
+        sa.Column('processed', sa.Integer(), nullable=False),
+        sa.Column('result', postgresql.JSONB(), nullable=False),
+        sa.Column('error', sa.String(), nullable=True),
+        sa.Column('created', sa.DateTime(), server_default=sa.text('now()'),
+                  nullable=False),
+        sa.Column('updated', sa.DateTime(), server_default=sa.text('now()'),
+                  nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(op.f('ix_job_status'), 'job', ['status'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_job_status'), table_name='job')
+    op.drop_table('job')
@@ -0,0 +1,62 @@
+"""add aggregate views
+
+Revision ID: 8b4e6d2c1a57
+Revises: 3f1c2a9b7d10
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '8b4e6d2c1a57'
+down_revision: Union[str, None] = '3f1c2a9b7d10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+VIEWS = {
+    'device_count_by_vendor': (
+        '''
+        SELECT vendor.id AS vendor_id, vendor.name AS vendor_name,
+               count(device.id) AS count
+        FROM vendor LEFT JOIN device ON device.vendor_id = vendor.id
+        GROUP BY vendor.id, vendor.name
+        ''', 'vendor_id'),
+    'cartridge_count_by_model': (
+        '''
+        SELECT model.id AS model_id, model.name AS model_name,
+               count(cartridge.id) AS count
+        FROM model LEFT JOIN cartridge ON cartridge.model_id = model.id
+        GROUP BY model.id, model.name
+        ''', 'model_id'),
+    'device_count_by_type': (
+        '''
+        SELECT device.type AS type, count(*) AS count
+        FROM device
+        GROUP BY device.type
+        ''', 'type'),
+}
+
+
+def upgrade() -> None:
+    op.create_table(
+        'aggregate_refresh',
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('refreshed_at', sa.DateTime(timezone=True),
+                  nullable=False),
+        sa.PrimaryKeyConstraint('name'),
+    )
+    for name, (query, key) in VIEWS.items():
+        op.execute(f'CREATE MATERIALIZED VIEW {name} AS {query}')
+        # REFRESH ... CONCURRENTLY requires a unique index.
+        op.execute(f'CREATE UNIQUE INDEX ix_{name}_{key} ON {name} ({key})')
+        op.execute(f"INSERT INTO aggregate_refresh (name, refreshed_at) "
+                   f"VALUES ('{name}', now())")
+
+
+def downgrade() -> None:
+    for name in VIEWS:
+        op.execute(f'DROP MATERIALIZED VIEW {name}')
+    op.drop_table('aggregate_refresh')
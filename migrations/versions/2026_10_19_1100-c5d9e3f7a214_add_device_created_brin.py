@@ -0,0 +1,27 @@
+"""add device created brin index
+
+Revision ID: c5d9e3f7a214
+Revises: 8b4e6d2c1a57
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5d9e3f7a214'
+down_revision: Union[str, None] = '8b4e6d2c1a57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_device_created_brin', 'device', ['created'],
+                    unique=False, postgresql_using='brin',
+                    postgresql_with={'pages_per_range': 32})
+
+
+def downgrade() -> None:
+    op.drop_index('ix_device_created_brin', table_name='device',
+                  postgresql_using='brin')
@@ -0,0 +1,37 @@
+"""add idempotency key
+
+Revision ID: e2a7c4b9d318
+Revises: c5d9e3f7a214
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2a7c4b9d318'
+down_revision: Union[str, None] = 'c5d9e3f7a214'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'idempotency_key',
+        sa.Column('key', sa.String(), nullable=False),
+        sa.Column('fingerprint', sa.LargeBinary(), nullable=False),
+        sa.Column('status', sa.Integer(), nullable=True),
+        sa.Column('body', sa.LargeBinary(), nullable=True),
+        sa.Column('expires', sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint('key'),
+    )
+    op.create_index(op.f('ix_idempotency_key_expires'), 'idempotency_key',
+                    ['expires'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_idempotency_key_expires'),
+                  table_name='idempotency_key')
+    op.drop_table('idempotency_key')
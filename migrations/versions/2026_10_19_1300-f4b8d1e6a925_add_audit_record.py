@@ -0,0 +1,41 @@
+"""add audit record
+
+Revision ID: f4b8d1e6a925
+Revises: e2a7c4b9d318
+Create Date: 2026-10-19 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = 'f4b8d1e6a925'
+down_revision: Union[str, None] = 'e2a7c4b9d318'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'audit_record',
+        sa.Column('table_name', sa.String(), nullable=False),
+        sa.Column('row_id', sa.Integer(), nullable=False),
+        sa.Column('operation', sa.String(), nullable=False),
+        sa.Column('diff', postgresql.JSONB(astext_type=sa.Text()),
+                  nullable=False),
+        sa.Column('actor', sa.String(), nullable=True),
+        sa.Column('time', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_audit_record_table_name_row_id_time', 'audit_record',
+                    ['table_name', 'row_id', 'time'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_audit_record_table_name_row_id_time',
+                  table_name='audit_record')
+    op.drop_table('audit_record')
@@ -0,0 +1,26 @@
+"""add job lease
+
+Revision ID: a7c3e9d2b614
+Revises: f4b8d1e6a925
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7c3e9d2b614'
+down_revision: Union[str, None] = 'f4b8d1e6a925'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('job', sa.Column('lease', sa.DateTime(timezone=True),
+                                   nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('job', 'lease')
@@ -0,0 +1,124 @@
+"""incremental aggregates
+
+Revision ID: d6f2a8c4b913
+Revises: a7c3e9d2b614
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'd6f2a8c4b913'
+down_revision: Union[str, None] = 'a7c3e9d2b614'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# name: counted table, group column, its type (see db.aggregates).
+AGGREGATES = {
+    'device_count_by_vendor': ('device', 'vendor_id', sa.Integer()),
+    'cartridge_count_by_model': ('cartridge', 'model_id', sa.Integer()),
+    'device_count_by_type': ('device', 'type', sa.String()),
+}
+
+# Statement-level: one delta row per group and statement, bulk writes
+# do not pay per row. Writers only insert, they never wait for each
+# other on a count row.
+COUNT_FUNCTION = '''
+CREATE FUNCTION {name}_count() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO {name}_delta ({key}, delta)
+        SELECT {key}, count(*) FROM new_rows
+        WHERE {key} IS NOT NULL GROUP BY {key};
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO {name}_delta ({key}, delta)
+        SELECT {key}, -count(*) FROM old_rows
+        WHERE {key} IS NOT NULL GROUP BY {key};
+    ELSE
+        INSERT INTO {name}_delta ({key}, delta)
+        SELECT {key}, sum(delta) FROM (
+            SELECT {key}, 1 AS delta FROM new_rows
+            UNION ALL
+            SELECT {key}, -1 AS delta FROM old_rows) AS changed
+        WHERE {key} IS NOT NULL GROUP BY {key} HAVING sum(delta) <> 0;
+    END IF;
+    RETURN NULL;
+END
+$$
+'''
+
+TRANSITION_TABLES = {
+    'INSERT': 'NEW TABLE AS new_rows',
+    'UPDATE': 'OLD TABLE AS old_rows NEW TABLE AS new_rows',
+    'DELETE': 'OLD TABLE AS old_rows',
+}
+
+VIEWS = {
+    'device_count_by_vendor': (
+        '''
+        SELECT vendor.id AS vendor_id, vendor.name AS vendor_name,
+               count(device.id) AS count
+        FROM vendor LEFT JOIN device ON device.vendor_id = vendor.id
+        GROUP BY vendor.id, vendor.name
+        ''', 'vendor_id'),
+    'cartridge_count_by_model': (
+        '''
+        SELECT model.id AS model_id, model.name AS model_name,
+               count(cartridge.id) AS count
+        FROM model LEFT JOIN cartridge ON cartridge.model_id = model.id
+        GROUP BY model.id, model.name
+        ''', 'model_id'),
+    'device_count_by_type': (
+        '''
+        SELECT device.type AS type, count(*) AS count
+        FROM device
+        GROUP BY device.type
+        ''', 'type'),
+}
+
+
+def upgrade() -> None:
+    for name, (table, key, type_) in AGGREGATES.items():
+        op.execute(f'DROP MATERIALIZED VIEW {name}')
+        op.create_table(
+            name,
+            sa.Column(key, type_, nullable=False),
+            sa.Column('count', sa.BigInteger(), nullable=False),
+            sa.PrimaryKeyConstraint(key),
+        )
+        op.create_table(
+            f'{name}_delta',
+            sa.Column('id', sa.BigInteger(), sa.Identity(), nullable=False),
+            sa.Column(key, type_, nullable=False),
+            sa.Column('delta', sa.BigInteger(), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        op.execute(COUNT_FUNCTION.format(name=name, key=key))
+        for event, transition_tables in TRANSITION_TABLES.items():
+            op.execute(
+                f'CREATE TRIGGER {name}_{event.lower()} AFTER {event} '
+                f'ON {table} REFERENCING {transition_tables} '
+                f'FOR EACH STATEMENT EXECUTE FUNCTION {name}_count()')
+        # After the triggers: writes committed from now on are deltas,
+        # earlier ones are counted here.
+        op.execute(f'INSERT INTO {name} ({key}, count) '
+                   f'SELECT {key}, count(*) FROM {table} '
+                   f'WHERE {key} IS NOT NULL GROUP BY {key}')
+        op.execute(f"UPDATE aggregate_refresh SET refreshed_at = now() "
+                   f"WHERE name = '{name}'")
+
+
+def downgrade() -> None:
+    for name, (table, key, type_) in AGGREGATES.items():
+        for event in TRANSITION_TABLES:
+            op.execute(f'DROP TRIGGER {name}_{event.lower()} ON {table}')
+        op.execute(f'DROP FUNCTION {name}_count()')
+        op.drop_table(f'{name}_delta')
+        op.drop_table(name)
+        query, view_key = VIEWS[name]
+        op.execute(f'CREATE MATERIALIZED VIEW {name} AS {query}')
+        op.execute(
+            f'CREATE UNIQUE INDEX ix_{name}_{view_key} ON {name} ({view_key})')
@@ -0,0 +1,25 @@
+"""autosummarize device created brin index
+
+Revision ID: e8b3c5d7f142
+Revises: d6f2a8c4b913
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'e8b3c5d7f142'
+down_revision: Union[str, None] = 'd6f2a8c4b913'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute('ALTER INDEX ix_device_created_brin SET (autosummarize = on)')
+    op.execute("SELECT brin_summarize_new_values('ix_device_created_brin')")
+
+
+def downgrade() -> None:
+    op.execute('ALTER INDEX ix_device_created_brin RESET (autosummarize)')
@@ -0,0 +1,26 @@
+from enum import Enum
+
+from db.aggregates import AGGREGATES, read
+from db.db import get_async_session
+from fastapi import APIRouter, Depends
+from schemas.aggregates import AggregateSchemaOut
+from sqlalchemy.ext.asyncio import AsyncSession
+
+AggregateName = Enum('AggregateName', {name: name for name in AGGREGATES},
+                     type=str)
+
+router_aggregates = APIRouter(prefix='/aggregates', tags=['aggregates'])
+
+
+@router_aggregates.get('/{name}/', response_model=AggregateSchemaOut,
+                       summary="Get precomputed counts")
+async def get_aggregate(name: AggregateName,
+                        session: AsyncSession = Depends(get_async_session)):
+    '''
+        Counts per group as of refreshed_at, kept incrementally (see
+        db.aggregates).
+    '''
+    async with session:
+        refreshed_at, groups = await read(session, AGGREGATES[name.value])
+    return {'name': name.value, 'refreshed_at': refreshed_at,
+            'groups': groups}
@@ -1,5 +1,15 @@
+from api.v1.aggregates import router_aggregates
+from api.v1.batch import router_batch
+from api.v1.devices import router_devices
+from api.v1.jobs import router_jobs
+from api.v1.profiles import router_profiles
+from api.v1.slow_queries import router_slow_queries
+from api.v1.vendors import router_vendors
+from auth.users import auth_backend, fastapi_users
 from config import settings
 from fastapi import APIRouter, FastAPI
+from openapi_cache import install_openapi_cache
+from profiling import install_profiling
 from utils import URLBuilder
 
 url_builder = URLBuilder(
@@ -19,3 +29,16 @@ tags_metadata = [
 ]
 
 app = FastAPI(openapi_tags=tags_metadata)
+install_openapi_cache(app)
+install_profiling(app)
+
+app.include_router(fastapi_users.get_auth_router(auth_backend),
+                   prefix='/auth/jwt', tags=['auth'])
+app.include_router(router_vendors)
+app.include_router(router_devices)
+app.include_router(router_jobs)
+app.include_router(router_aggregates)
+app.include_router(router_profiles)
+app.include_router(router_slow_queries)
+# After the routers: operations are allowed on their models.
+app.include_router(router_batch)
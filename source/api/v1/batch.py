@@ -0,0 +1,8 @@
+from auth.users import current_active_user
+from crud_router.audit import audit_actor
+from crud_router.batch import batch_router
+from fastapi import Depends
+
+router_batch = batch_router(dependencies=[
+    Depends(current_active_user),
+    Depends(audit_actor(current_active_user))])
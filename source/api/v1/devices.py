@@ -1,3 +1,26 @@
+from auth.users import current_active_user
+from crud_router.audit import audit_actor
 from crud_router.router_generator import RouterGenerator
+from db.db import get_async_session
 from db.models.devices import Device
 from db.sa_crud import CRUDSA
+from fastapi import Depends
+from schemas.device_base import DeviceBaseSchemaIn, DeviceListSchemaOut
+
+router_devices = RouterGenerator(
+    prefix='/devices',
+    schema_basic_out=DeviceListSchemaOut,
+    db_crud=CRUDSA(model=Device),
+    session=get_async_session,
+    schema_create=DeviceBaseSchemaIn,
+    schema_update=DeviceBaseSchemaIn,
+    deps_all_routes=[Depends(current_active_user),
+                     Depends(audit_actor(current_active_user))],
+    range_filters=['created'],
+    route_get_all=True,
+    route_get_by_id=True,
+    route_get_by_ids=True,
+    route_counts=True,
+    route_export=True,
+    route_history=True,
+)
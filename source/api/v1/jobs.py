@@ -0,0 +1,15 @@
+from exceptions.http_exceptions import HTTPObjectNotExist
+from fastapi import APIRouter
+from jobs.executor import job_executor
+from schemas.jobs import JobSchemaOut
+
+router_jobs = APIRouter(prefix='/jobs', tags=['jobs'])
+
+
+@router_jobs.get('/{job_id}/', response_model=JobSchemaOut,
+                 summary="Get job status")
+async def get_job(job_id: int):
+    job = await job_executor.get(job_id)
+    if not job:
+        raise HTTPObjectNotExist
+    return job
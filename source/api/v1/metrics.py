@@ -0,0 +1,11 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from metrics import metrics
+
+router_metrics = APIRouter(tags=['metrics'])
+
+
+@router_metrics.get('/metrics', response_class=PlainTextResponse,
+                    summary="Process metrics")
+async def get_metrics():
+    return metrics.render()
@@ -0,0 +1,26 @@
+import asyncio
+import os
+
+from auth.admin import admin_token
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import FileResponse
+from profiling import profile_store
+
+
+router_profiles = APIRouter(prefix='/profiles', tags=['profiles'],
+                            dependencies=[Depends(admin_token)])
+
+
+@router_profiles.get('/', summary="List request profiles")
+async def list_profiles():
+    return await asyncio.to_thread(profile_store.list)
+
+
+@router_profiles.get('/{profile_id}/', response_class=FileResponse,
+                     summary="Download request profile (pstats)")
+async def get_profile(profile_id: str):
+    path = profile_store.path(profile_id, 'prof')
+    if not profile_id.isalnum() or not os.path.isfile(path):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    return FileResponse(path, media_type='application/octet-stream',
+                        filename=f'{profile_id}.prof')
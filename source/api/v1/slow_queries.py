@@ -0,0 +1,33 @@
+from enum import Enum
+
+from auth.admin import admin_token
+from db.db import slow_query_recorder
+from fastapi import APIRouter, Depends, Query, status
+
+
+class SlowQueryOrder(str, Enum):
+    total = 'total'
+    mean = 'mean'
+    max = 'max'
+    count = 'count'
+
+
+router_slow_queries = APIRouter(prefix='/slow-queries', tags=['admin'],
+                                dependencies=[Depends(admin_token)])
+
+
+@router_slow_queries.get('/', summary="Top slow queries")
+async def list_slow_queries(order: SlowQueryOrder = SlowQueryOrder.total,
+                            limit: int = Query(default=20, ge=1, le=200)):
+    '''
+        Statements over SLOW_QUERY_THRESHOLD seconds grouped by
+        fingerprint, with the route and CRUDSA method that ran them and
+        the plan when EXPLAIN has finished.
+    '''
+    return slow_query_recorder.top(limit, order.value)
+
+
+@router_slow_queries.delete('/', status_code=status.HTTP_204_NO_CONTENT,
+                            summary="Reset slow queries")
+async def reset_slow_queries():
+    slow_query_recorder.records.clear()
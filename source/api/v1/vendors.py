@@ -1,6 +1,10 @@
-from apps.users import current_active_user
+from auth.users import current_active_user
+from crud_router.audit import audit_actor
 from crud_router.router_generator import RouterGenerator
 from db.db import get_async_session
+# Related models of Vendor, mapped before its relationships are resolved.
+from db.models.cartridges import Model  # noqa: F401
+from db.models.devices import Device  # noqa: F401
 from db.models.vendors import Vendor
 from db.sa_crud import CRUDSA
 from fastapi import Depends
@@ -15,12 +19,19 @@ router_vendors = RouterGenerator(
     session=get_async_session,
     schema_create=VendorBaseSchema,
     schema_update=VendorBaseSchema,
-    deps_all_routes=[Depends(current_active_user)],
+    deps_all_routes=[Depends(current_active_user),
+                     Depends(audit_actor(current_active_user))],
     route_get_all=True,
     route_get_all_with_related=True,
     route_get_by_id=True,
+    route_get_by_ids=True,
     route_create=True,
     route_create_batch=True,
     route_update=True,
     route_delete=True,
+    route_export=True,
+    route_jobs=True,
+    route_changes=True,
+    route_relations=True,
+    route_history=True,
 )
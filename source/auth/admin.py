@@ -0,0 +1,11 @@
+from config import settings
+from fastapi import Header, HTTPException, status
+
+
+def admin_token(x_admin_token: str = Header(default='')) -> None:
+    '''
+        Guard of the admin routes (slow queries, profiles): X-Admin-Token
+        has to match ADMIN_TOKEN, they are closed while it is unset.
+    '''
+    if not settings.ADMIN_TOKEN or x_admin_token != settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
@@ -0,0 +1,29 @@
+from fastapi.security import OAuth2PasswordRequestForm
+from fastapi_users import exceptions
+from offload import offload
+
+
+class OffloadPasswordMixin:
+    '''
+        Mixin for the UserManager: password hashing and verification of
+        authenticate run in the offload pool instead of the event loop,
+        a login burst no longer stalls other requests.
+    '''
+
+    async def authenticate(self, credentials: OAuth2PasswordRequestForm):
+        try:
+            user = await self.get_by_email(credentials.username)
+        except exceptions.UserNotExists:
+            # Run the hasher to mitigate timing attack
+            await offload(self.password_helper.hash, credentials.password)
+            return None
+
+        verified, updated_password_hash = await offload(
+            self.password_helper.verify_and_update,
+            credentials.password, user.hashed_password)
+        if not verified:
+            return None
+        if updated_password_hash is not None:
+            await self.user_db.update(
+                user, {"hashed_password": updated_password_hash})
+        return user
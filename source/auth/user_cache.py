@@ -0,0 +1,175 @@
+import time
+from collections import OrderedDict
+from typing import Any, Callable
+
+import jwt
+from config import settings
+from db.notifications import change_listener
+from db.write_events import WriteEvent
+from fastapi import Depends, HTTPException, status
+from fastapi_users import BaseUserManager
+from fastapi_users.authentication import AuthenticationBackend
+from loguru import logger
+from metrics import metrics
+
+# Table of the fastapi-users user model, names invalidation notifications.
+USERS_TABLE = 'user'
+
+hits_total = metrics.counter('user_cache_hits_total',
+                             'Users resolved from the token cache.')
+misses_total = metrics.counter('user_cache_misses_total',
+                               'Users resolved with JWT decode and DB lookup.')
+
+
+class UserCache:
+    '''
+        LRU cache token -> user with TTL. An entry never outlives the
+        token exp claim. invalidate_user drops every token of the user,
+        it has to be called when the user is changed or deactivated.
+        The cache is per process, UserCacheInvalidationMixin notifies
+        the other workers (see invalidate_remote).
+    '''
+
+    def __init__(self, ttl: float, maxsize: int):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.entries: OrderedDict[str, tuple[Any, float]] = OrderedDict()
+        # User ids as str: ids from notifications arrive as str.
+        self.tokens: dict[str, set[str]] = {}
+
+    def get(self, token: str) -> Any | None:
+        if (entry := self.entries.get(token)) is None:
+            return None
+        user, expires = entry
+        if expires < time.monotonic():
+            self._drop(token)
+            return None
+        self.entries.move_to_end(token)
+        return user
+
+    def set(self, token: str, user: Any, ttl: float | None = None) -> None:
+        ttl = self.ttl if ttl is None else min(self.ttl, ttl)
+        if ttl <= 0:
+            return
+        self.entries[token] = (user, time.monotonic() + ttl)
+        self.entries.move_to_end(token)
+        self.tokens.setdefault(str(user.id), set()).add(token)
+        while len(self.entries) > self.maxsize:
+            self._drop(next(iter(self.entries)))
+
+    def invalidate_user(self, user_id: Any) -> None:
+        for token in self.tokens.pop(str(user_id), set()):
+            self.entries.pop(token, None)
+
+    def invalidate_remote(self, write_event: WriteEvent) -> None:
+        '''
+            Change listener subscriber: a user changed in another worker.
+        '''
+        if USERS_TABLE not in write_event.tables:
+            return
+        if not write_event.ids:
+            self.clear()
+        for user_id in write_event.ids:
+            self.invalidate_user(user_id)
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.tokens.clear()
+
+    def _drop(self, token: str) -> None:
+        user, _ = self.entries.pop(token)
+        if tokens := self.tokens.get(str(user.id)):
+            tokens.discard(token)
+            if not tokens:
+                del self.tokens[str(user.id)]
+
+
+user_cache = UserCache(ttl=settings.USER_CACHE_TTL,
+                       maxsize=settings.USER_CACHE_SIZE)
+change_listener.subscribe(user_cache.invalidate_remote)
+# Invalidations may have been missed while the listener was down.
+change_listener.on_reset(user_cache.clear)
+
+
+def cached_current_user(backend: AuthenticationBackend,
+                        get_user_manager: Callable,
+                        active: bool = True,
+                        verified: bool = False,
+                        cache: UserCache = user_cache) -> Callable:
+    '''
+        Drop-in replacement of fastapi_users.current_user(active=...,
+        verified=...) for a single backend. A cached token costs neither
+        JWT decode nor DB lookup, a new token is verified by the backend
+        strategy once and cached until TTL or its exp claim.
+    '''
+    async def dependency(
+            token: str | None = Depends(backend.transport.scheme),
+            user_manager: BaseUserManager = Depends(get_user_manager),
+            strategy=Depends(backend.get_strategy)):
+        if token is None:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+        if (user := cache.get(token)) is not None:
+            hits_total.inc()
+        else:
+            misses_total.inc()
+            user = await strategy.read_token(token, user_manager)
+            if user is None:
+                raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+            cache.set(token, user, ttl=_token_ttl(token))
+        if active and not user.is_active:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+        if verified and not user.is_verified:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
+        return user
+    return dependency
+
+
+def _token_ttl(token: str) -> float | None:
+    '''
+        Seconds until the exp claim, None for tokens that are not JWT
+        (database strategy) or carry no exp.
+    '''
+    try:
+        claims = jwt.decode(token, options={'verify_signature': False})
+    except jwt.PyJWTError:
+        return None
+    if not isinstance(exp := claims.get('exp'), (int, float)):
+        return None
+    return exp - time.time()
+
+
+async def invalidate_user(user_id: Any, cache: UserCache = user_cache
+                          ) -> None:
+    '''
+        Drop the tokens of the user here and, with NOTIFY, in the other
+        workers. If the LISTEN connection is down they keep the user for
+        at most USER_CACHE_TTL.
+    '''
+    cache.invalidate_user(user_id)
+    try:
+        await change_listener.notify(
+            WriteEvent(tables=(USERS_TABLE,), operation='update',
+                       ids=(user_id,)))
+    except Exception as e:
+        logger.warning('User cache invalidation of {} not sent: {}',
+                       user_id, e)
+
+
+class UserCacheInvalidationMixin:
+    '''
+        Mixin for the UserManager: drops cached tokens of a user after
+        update (including deactivation), password reset and delete, in
+        every worker.
+    '''
+
+    async def on_after_update(self, user, update_dict, request=None):
+        await invalidate_user(user.id)
+        await super().on_after_update(user, update_dict, request)
+
+    async def on_after_reset_password(self, user, request=None):
+        await invalidate_user(user.id)
+        await super().on_after_reset_password(user, request)
+
+    async def on_after_delete(self, user, request=None):
+        await invalidate_user(user.id)
+        await super().on_after_delete(user, request)
@@ -0,0 +1,52 @@
+from typing import AsyncIterator
+
+from auth.password import OffloadPasswordMixin
+from auth.user_cache import UserCacheInvalidationMixin, cached_current_user
+from config import settings
+from db.db import get_async_session
+from db.models.users import User
+from fastapi import Depends
+from fastapi_users import BaseUserManager, FastAPIUsers, IntegerIDMixin
+from fastapi_users.authentication import (
+    AuthenticationBackend,
+    BearerTransport,
+    JWTStrategy,
+)
+from fastapi_users_db_sqlalchemy import SQLAlchemyUserDatabase
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+class UserManager(UserCacheInvalidationMixin,
+                  OffloadPasswordMixin,
+                  IntegerIDMixin,
+                  BaseUserManager[User, int]):
+    reset_password_token_secret = settings.AUTH_SECRET
+    verification_token_secret = settings.AUTH_SECRET
+
+
+async def get_user_db(session: AsyncSession = Depends(get_async_session)
+                      ) -> AsyncIterator[SQLAlchemyUserDatabase]:
+    yield SQLAlchemyUserDatabase(session, User)
+
+
+async def get_user_manager(
+        user_db: SQLAlchemyUserDatabase = Depends(get_user_db)
+) -> AsyncIterator[UserManager]:
+    yield UserManager(user_db)
+
+
+def get_jwt_strategy() -> JWTStrategy:
+    return JWTStrategy(secret=settings.AUTH_SECRET,
+                       lifetime_seconds=settings.AUTH_TOKEN_LIFETIME)
+
+
+auth_backend = AuthenticationBackend(
+    name='jwt',
+    transport=BearerTransport(tokenUrl='auth/jwt/login'),
+    get_strategy=get_jwt_strategy)
+
+fastapi_users = FastAPIUsers[User, int](get_user_manager, [auth_backend])
+
+# Route dependency for the hot paths: the user is resolved from the
+# token cache, see auth.user_cache.
+current_active_user = cached_current_user(auth_backend, get_user_manager)
@@ -0,0 +1,144 @@
+import asyncio
+from collections import OrderedDict
+from typing import Iterable
+
+from config import settings
+from metrics import metrics
+
+evictions_total = metrics.counter(
+    'response_cache_evictions_total', 'Entries evicted to fit the size limit.')
+
+
+class CacheBackend:
+    '''
+        Storage of serialized responses and of per-table versions.
+        Versions are part of the cache key, bump makes every cached
+        response built from the table unreachable.
+        shared: versions are seen by every worker, so bumps of other
+        workers need no notification.
+    '''
+    shared = False
+
+    async def get(self, key: str) -> bytes | None:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: bytes) -> None:
+        raise NotImplementedError
+
+    async def versions(self, tables: Iterable[str]) -> tuple[int, ...]:
+        raise NotImplementedError
+
+    def bump(self, tables: Iterable[str]) -> None:
+        '''
+            Called from commit hooks, so it is not a coroutine.
+        '''
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        '''
+            Make every cached response unreachable.
+        '''
+        raise NotImplementedError
+
+
+class MemoryBackend(CacheBackend):
+    '''
+        In-process LRU bounded by the total size of keys and values.
+        Entries of old versions are never looked up again and age out.
+    '''
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries: OrderedDict[str, bytes] = OrderedDict()
+        self.table_versions: dict[str, int] = {}
+
+    async def get(self, key: str) -> bytes | None:
+        if (value := self.entries.get(key)) is not None:
+            self.entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: bytes) -> None:
+        if len(key) + len(value) > self.max_bytes:
+            return
+        self._drop(key)
+        self.entries[key] = value
+        self.size += len(key) + len(value)
+        while self.size > self.max_bytes:
+            self._drop(next(iter(self.entries)))
+            evictions_total.inc()
+
+    async def versions(self, tables: Iterable[str]) -> tuple[int, ...]:
+        return tuple(self.table_versions.get(table, 0) for table in tables)
+
+    def bump(self, tables: Iterable[str]) -> None:
+        for table in tables:
+            self.table_versions[table] = self.table_versions.get(table, 0) + 1
+
+    def clear(self) -> None:
+        # Renders in progress must not store under the current versions.
+        self.bump(list(self.table_versions))
+        self.entries.clear()
+        self.size = 0
+
+    def _drop(self, key: str) -> None:
+        if (value := self.entries.pop(key, None)) is not None:
+            self.size -= len(key) + len(value)
+
+
+class RedisBackend(CacheBackend):
+    '''
+        Redis-compatible server shared by all workers. Entries expire
+        after ttl seconds, eviction is left to the server maxmemory
+        policy. Bumps are sent in the background: a request served right
+        after the commit may still see the previous version.
+    '''
+    prefix = 'response_cache:'
+    shared = True
+
+    def __init__(self, url: str, ttl: int):
+        # Optional dependency, only needed with CACHE_BACKEND=redis.
+        from redis import asyncio as redis
+        self.redis = redis.from_url(url)
+        self.ttl = ttl
+        self.tasks: set[asyncio.Task] = set()
+
+    async def get(self, key: str) -> bytes | None:
+        return await self.redis.get(self.prefix + key)
+
+    async def set(self, key: str, value: bytes) -> None:
+        await self.redis.set(self.prefix + key, value, ex=self.ttl)
+
+    async def versions(self, tables: Iterable[str]) -> tuple[int, ...]:
+        tables = list(tables)
+        if not tables:
+            return ()
+        values = await self.redis.mget(
+            [self._version_key(table) for table in tables])
+        return tuple(int(value or 0) for value in values)
+
+    def bump(self, tables: Iterable[str]) -> None:
+        keys = [self._version_key(table) for table in tables]
+        task = asyncio.get_running_loop().create_task(self._incr(keys))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def clear(self) -> None:
+        pass
+
+    async def _incr(self, keys: list[str]) -> None:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.incr(key)
+            await pipe.execute()
+
+    def _version_key(self, table: str) -> str:
+        return f'{self.prefix}version:{table}'
+
+
+def create_backend() -> CacheBackend:
+    match settings.CACHE_BACKEND:
+        case 'redis':
+            return RedisBackend(settings.CACHE_REDIS_URL, settings.CACHE_TTL)
+        case _:
+            return MemoryBackend(settings.CACHE_MAX_BYTES)
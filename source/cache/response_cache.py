@@ -0,0 +1,121 @@
+import gzip
+from typing import Awaitable, Callable, Iterable
+
+from cache.backends import CacheBackend, MemoryBackend, create_backend
+from config import settings
+from db.notifications import change_listener
+from db.write_events import WriteEvent, on_commit
+from fastapi import Request, Response
+from metrics import metrics
+from offload import offload
+
+hits_total = metrics.counter('response_cache_hits_total',
+                             'GET responses served from the cache.')
+misses_total = metrics.counter('response_cache_misses_total',
+                               'GET responses rendered and cached.')
+
+# Compress bigger bodies in the offload pool.
+OFFLOAD_BYTES = 1 << 20
+
+RAW = b'r'
+GZIP = b'g'
+
+
+class ResponseCache:
+    '''
+        Serialized GET responses keyed by path, query parameters and the
+        versions of the tables the response is built from. Every
+        committed write bumps versions of its tables (see write_events),
+        stale entries are never served.
+        Bodies of gzip_min_size bytes and more are stored compressed and
+        sent as is to clients accepting gzip.
+    '''
+
+    def __init__(self,
+                 backend: CacheBackend,
+                 gzip_min_size: int,
+                 gzip_level: int):
+        self.backend = backend
+        self.gzip_min_size = gzip_min_size
+        self.gzip_level = gzip_level
+
+    async def respond(self,
+                      request: Request,
+                      tables: Iterable[str],
+                      render: Callable[[], Awaitable[bytes]]) -> Response:
+        key = await self.key(request, tables)
+        accepts_gzip = 'gzip' in request.headers.get('accept-encoding', '')
+        if (entry := await self.backend.get(key)) is not None:
+            hits_total.inc()
+            return self._response(entry[:1], entry[1:], accepts_gzip, 'HIT')
+        misses_total.inc()
+        body = await render()
+        encoding, stored = RAW, body
+        if len(body) >= self.gzip_min_size:
+            encoding = GZIP
+            stored = await offload(gzip.compress, body, self.gzip_level,
+                                   size=len(body), threshold=OFFLOAD_BYTES)
+        await self.backend.set(key, encoding + stored)
+        if accepts_gzip:
+            return self._response(encoding, stored, accepts_gzip, 'MISS')
+        return self._response(RAW, body, accepts_gzip, 'MISS')
+
+    async def key(self, request: Request, tables: Iterable[str]) -> str:
+        tables = sorted(tables)
+        versions = await self.backend.versions(tables)
+        query = sorted(request.query_params.multi_items())
+        return '|'.join((
+            request.url.path,
+            '&'.join(f'{name}={value}' for name, value in query),
+            ','.join(f'{table}:{version}'
+                     for table, version in zip(tables, versions))))
+
+    def invalidate(self, events: list[WriteEvent]) -> None:
+        self.backend.bump({table for event in events
+                           for table in event.tables})
+
+    def invalidate_remote(self, event: WriteEvent) -> None:
+        '''
+            Write committed by another worker or node (see notifications).
+        '''
+        if not self.backend.shared:
+            self.backend.bump(event.tables)
+
+    def reset(self) -> None:
+        if not self.backend.shared:
+            self.backend.clear()
+
+    @staticmethod
+    def _response(encoding: bytes,
+                  body: bytes,
+                  accepts_gzip: bool,
+                  status: str) -> Response:
+        headers = {'Vary': 'Accept-Encoding', 'X-Cache': status}
+        if encoding == GZIP:
+            if accepts_gzip:
+                headers['Content-Encoding'] = 'gzip'
+            else:
+                body = gzip.decompress(body)
+        return Response(body, media_type='application/json', headers=headers)
+
+
+response_cache = ResponseCache(create_backend(),
+                               gzip_min_size=settings.CACHE_GZIP_MIN_SIZE,
+                               gzip_level=settings.CACHE_GZIP_LEVEL)
+on_commit(response_cache.invalidate)
+change_listener.subscribe(response_cache.invalidate_remote)
+change_listener.on_reset(response_cache.reset)
+
+
+def _stats() -> dict[tuple, float]:
+    hits, misses = hits_total.get(), misses_total.get()
+    stats = {(('stat', 'hit_ratio'),):
+             hits / (hits + misses) if hits + misses else 0}
+    if isinstance(backend := response_cache.backend, MemoryBackend):
+        stats[(('stat', 'bytes'),)] = backend.size
+        stats[(('stat', 'entries'),)] = len(backend.entries)
+    return stats
+
+
+metrics.gauge('response_cache', 'Response cache hit ratio and size.',
+              callback=_stats)
@@ -30,9 +30,124 @@ class Settings(BaseSettings):
     DB_NAME: str = Field(default='DB_NAME')
     DB_PORT_CONTAINER: str = Field(default='DB_PORT_CONTAINER')
     DB_URL: str = Field(default='DB_URL')
+    DB_BACKEND: str = Field(default='postgresql')
+    DB_SQLITE_PATH: str = Field(default='catalog.sqlite3')
+    DB_ECHO: bool = Field(default=False)
+    DB_POOL_SIZE: int = Field(default=5)
+    DB_MAX_OVERFLOW: int = Field(default=10)
+    DB_POOL_TIMEOUT: int = Field(default=30)
+
+    SERVER_WORKERS: int | None = Field(default=None)
+    SERVER_GRACEFUL_SHUTDOWN: int = Field(default=30)
+    SERVER_WARMUP: bool = Field(default=True)
+
+    LOG_LEVEL: str = Field(default='INFO')
+    LOG_LEVELS: dict[str, str] = Field(
+        default={'sqlalchemy.engine': 'WARNING'})
+    LOG_SQL_SAMPLE: int = Field(default=1)
+    LOG_DEBUG_SAMPLE: int = Field(default=1)
+    LOG_ENQUEUE: bool = Field(default=True)
+
+    EXPORT_CHUNK_SIZE: int = Field(default=1000)
+    EXPORT_GZIP_LEVEL: int = Field(default=6)
+
+    JOBS_WORKERS: int = Field(default=2)
+    JOBS_DB_CONCURRENCY: int = Field(default=2)
+    JOBS_CHUNK_SIZE: int = Field(default=1000)
+    JOBS_QUEUE_SIZE: int = Field(default=100)
+    JOBS_LEASE: float = Field(default=60)
+    JOBS_POLL_INTERVAL: float = Field(default=1)
+    JOBS_MAX_ERRORS: int = Field(default=1000)
+
+    ADMISSION_READ_LIMIT: int = Field(default=20)
+    ADMISSION_READ_QUEUE: int = Field(default=100)
+    ADMISSION_WRITE_LIMIT: int = Field(default=10)
+    ADMISSION_WRITE_QUEUE: int = Field(default=50)
+    ADMISSION_HEAVY_LIMIT: int = Field(default=3)
+    ADMISSION_HEAVY_QUEUE: int = Field(default=10)
+    ADMISSION_RETRY_AFTER: int = Field(default=1)
+
+    AUTH_SECRET: str = Field(default='AUTH_SECRET')
+    AUTH_TOKEN_LIFETIME: int = Field(default=3600)
+
+    USER_CACHE_TTL: float = Field(default=60)
+    USER_CACHE_SIZE: int = Field(default=10000)
+
+    OFFLOAD_POOL: str = Field(default='thread')
+    OFFLOAD_WORKERS: int = Field(default=4)
+    OFFLOAD_THRESHOLD: int = Field(default=1000)
+    OFFLOAD_LAG_INTERVAL: float = Field(default=0.5)
+    OFFLOAD_LAG_WARNING: float = Field(default=0.1)
+
+    DEADLINE_READ: float = Field(default=5)
+    DEADLINE_WRITE: float = Field(default=10)
+    DEADLINE_HEAVY: float = Field(default=60)
+    DEADLINE_DISCONNECT_POLL: float = Field(default=0.5)
+
+    RETRY_ATTEMPTS: int = Field(default=3)
+    RETRY_BACKOFF_BASE: float = Field(default=0.05)
+    RETRY_BACKOFF_CAP: float = Field(default=1)
+
+    CACHE_ENABLED: bool = Field(default=True)
+    CACHE_BACKEND: str = Field(default='memory')
+    CACHE_REDIS_URL: str = Field(default='redis://localhost:6379/0')
+    CACHE_MAX_BYTES: int = Field(default=64 * 1024 * 1024)
+    CACHE_TTL: int = Field(default=300)
+    CACHE_GZIP_MIN_SIZE: int = Field(default=1024)
+    CACHE_GZIP_LEVEL: int = Field(default=6)
+
+    NOTIFY_ENABLED: bool = Field(default=True)
+    NOTIFY_CHANNEL: str = Field(default='catalog_changes')
+    NOTIFY_RECONNECT: float = Field(default=1)
+    NOTIFY_HEALTHCHECK: float = Field(default=10)
+
+    FEED_BUFFER_SIZE: int = Field(default=1000)
+    FEED_CLIENT_QUEUE: int = Field(default=100)
+    FEED_HEARTBEAT: float = Field(default=15)
+
+    AGGREGATES_REFRESH_DELAY: float = Field(default=1)
+    AGGREGATES_REFRESH_INTERVAL: float = Field(default=300)
+
+    PAGE_LIMIT: int = Field(default=100)
+    PAGE_LIMIT_MAX: int = Field(default=1000)
+
+    PROFILE_ENABLED: bool = Field(default=False)
+    PROFILE_SAMPLE: int = Field(default=0)
+    PROFILE_DIR: str = Field(default='profiles')
+    PROFILE_KEEP: int = Field(default=50)
+
+    SLOW_QUERY_ENABLED: bool = Field(default=True)
+    SLOW_QUERY_THRESHOLD: float = Field(default=0.5)
+    SLOW_QUERY_KEEP: int = Field(default=200)
+    SLOW_QUERY_EXPLAIN: bool = Field(default=True)
+    SLOW_QUERY_REDACT: list[str] = Field(
+        default=['password', 'token', 'secret', 'hash', 'email'])
+
+    ADMIN_TOKEN: str = Field(default='')
+
+    BATCH_MAX_OPERATIONS: int = Field(default=1000)
+
+    IDEMPOTENCY_ENABLED: bool = Field(default=True)
+    IDEMPOTENCY_TTL: float = Field(default=24 * 60 * 60)
+    IDEMPOTENCY_LEASE: float = Field(default=60)
+    IDEMPOTENCY_WAIT: float = Field(default=10)
+    IDEMPOTENCY_POLL: float = Field(default=0.2)
+    IDEMPOTENCY_PURGE_INTERVAL: float = Field(default=60 * 60)
+
+    AUDIT_ENABLED: bool = Field(default=True)
+    AUDIT_DURABILITY: str = Field(default='buffered')
+    AUDIT_BUFFER_SIZE: int = Field(default=100000)
+    AUDIT_BATCH_SIZE: int = Field(default=1000)
+    AUDIT_FLUSH_INTERVAL: float = Field(default=1)
+    AUDIT_REDACT: list[str] = Field(
+        default=['password', 'token', 'secret', 'hash'])
 
     @model_validator(mode='before')
     def get_database_url(cls, values):
+        if values.get('DB_BACKEND') == 'sqlite':
+            path = values.get('DB_SQLITE_PATH', 'catalog.sqlite3')
+            values['DB_URL'] = f'sqlite+aiosqlite:///{path}'
+            return values
         values['DB_URL'] = (
             f'postgresql+asyncpg://{values["DB_USER"]}:{values["DB_PASS"]}'
             + f'@{values["DB_HOST"]}:{values["DB_PORT"]}/{values["DB_NAME"]}'
@@ -43,5 +158,6 @@ class Settings(BaseSettings):
         validate_assignment = True
 
 
+ENVIRONMENT = getenv('ENVIRONMENT', 'dev')
 envs = find_dotenv('.env', raise_error_if_not_found=True)
 settings = Settings(env_file=envs)
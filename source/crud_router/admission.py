@@ -0,0 +1,186 @@
+import asyncio
+from collections import deque
+from enum import Enum
+from functools import wraps
+from typing import AsyncIterator, Callable
+
+from config import settings
+from exceptions.http_exceptions import HTTPServiceOverloaded
+from fastapi.responses import StreamingResponse
+from metrics import metrics
+from starlette.background import BackgroundTask
+
+
+class RouteClass(str, Enum):
+    read = 'read'
+    write = 'write'
+    heavy = 'heavy'
+
+
+class Priority(str, Enum):
+    high = 'high'
+    normal = 'normal'
+
+
+shed_total = metrics.counter(
+    'admission_shed_total',
+    'Requests rejected because the route class queue was full.')
+
+
+class AdmissionController:
+    '''
+        Concurrency limit with bounded wait queues for one route class.
+        Up to limit requests run at the same time, next queue_size requests
+        of each priority wait, the rest is rejected at once.
+        Released slots are handed to high priority waiters first.
+    '''
+
+    def __init__(self, name: str, limit: int, queue_size: int):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.active = 0
+        self.waiters: dict[Priority, deque[asyncio.Future]] = {
+            priority: deque() for priority in Priority}
+
+    def queued(self, priority: Priority | None = None) -> int:
+        if priority:
+            return len(self.waiters[priority])
+        return sum(len(waiters) for waiters in self.waiters.values())
+
+    async def acquire(self, priority: Priority = Priority.normal) -> None:
+        if self.active < self.limit:
+            self.active += 1
+            return
+        if self.queued(priority) >= self.queue_size:
+            shed_total.inc(route_class=self.name, priority=priority.value)
+            raise HTTPServiceOverloaded
+        future = asyncio.get_running_loop().create_future()
+        self.waiters[priority].append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Slot was already handed over, pass it on.
+                self.release()
+            else:
+                self.waiters[priority].remove(future)
+            raise
+
+    def release(self) -> None:
+        for priority in Priority:
+            waiters = self.waiters[priority]
+            while waiters:
+                future = waiters.popleft()
+                if not future.done():
+                    future.set_result(None)
+                    return
+        self.active -= 1
+
+
+controllers = {
+    RouteClass.read: AdmissionController(
+        RouteClass.read.value,
+        settings.ADMISSION_READ_LIMIT,
+        settings.ADMISSION_READ_QUEUE),
+    RouteClass.write: AdmissionController(
+        RouteClass.write.value,
+        settings.ADMISSION_WRITE_LIMIT,
+        settings.ADMISSION_WRITE_QUEUE),
+    RouteClass.heavy: AdmissionController(
+        RouteClass.heavy.value,
+        settings.ADMISSION_HEAVY_LIMIT,
+        settings.ADMISSION_HEAVY_QUEUE),
+}
+
+
+def admission(route_class: RouteClass,
+              priority: Priority = Priority.normal) -> Callable:
+    controller = controllers[route_class]
+
+    async def dependency() -> AsyncIterator[None]:
+        await controller.acquire(priority)
+        try:
+            yield
+        finally:
+            controller.release()
+    return dependency
+
+
+def admit_stream(endpoint: Callable,
+                 route_class: RouteClass,
+                 priority: Priority = Priority.normal) -> Callable:
+    '''
+        Endpoint wrapper for routes returning StreamingResponse, whose
+        body is sent after the dependencies have exited: the slot is
+        held until the body is sent (or the transfer fails). Other
+        responses release it when the endpoint returns.
+    '''
+    controller = controllers[route_class]
+
+    @wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        await controller.acquire(priority)
+        release = _once(controller.release)
+        try:
+            response = await endpoint(*args, **kwargs)
+        except BaseException:
+            release()
+            raise
+        if not isinstance(response, StreamingResponse):
+            release()
+            return response
+        response.body_iterator = _holding(response.body_iterator, release)
+        # The body may never be iterated (send failed before).
+        response.background = _chain(response.background, release)
+        return response
+    return wrapper
+
+
+async def _holding(chunks: AsyncIterator, release: Callable
+                   ) -> AsyncIterator:
+    try:
+        async for chunk in chunks:
+            yield chunk
+    finally:
+        release()
+
+
+def _once(release: Callable) -> Callable:
+    released = False
+
+    def wrapper() -> None:
+        nonlocal released
+        if not released:
+            released = True
+            release()
+    return wrapper
+
+
+def _chain(background: BackgroundTask | None, release: Callable
+           ) -> BackgroundTask:
+    async def run() -> None:
+        try:
+            if background is not None:
+                await background()
+        finally:
+            release()
+    return BackgroundTask(run)
+
+
+def _queue_depth() -> dict[tuple, float]:
+    return {(('priority', priority.value), ('route_class', name.value)):
+            controller.queued(priority)
+            for name, controller in controllers.items()
+            for priority in Priority}
+
+
+def _active() -> dict[tuple, float]:
+    return {(('route_class', name.value),): controller.active
+            for name, controller in controllers.items()}
+
+
+metrics.gauge('admission_queue_depth',
+              'Requests waiting for a slot.', callback=_queue_depth)
+metrics.gauge('admission_active',
+              'Requests holding a slot.', callback=_active)
@@ -0,0 +1,15 @@
+from typing import Any, Callable
+
+from db.audit import current_actor
+from fastapi import Depends
+
+
+def audit_actor(user_dependency: Callable) -> Callable:
+    '''
+        Route dependency: changes made by the request are recorded in
+        the audit log as made by the user user_dependency returns.
+    '''
+    async def dependency(user: Any = Depends(user_dependency)) -> None:
+        current_actor.set(str(getattr(user, 'email', None)
+                              or getattr(user, 'id', user)))
+    return dependency
@@ -0,0 +1,260 @@
+from contextlib import AsyncExitStack
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+from config import settings
+from crud_router.admission import RouteClass, admission
+from crud_router.deadline import deadline
+from crud_router.idempotency import idempotent
+from crud_router.router_generator import RouterGenerator
+from db.db import get_async_session
+from db.retry import retryable
+from db.slow_queries import query_route
+from exceptions.http_exceptions import HttpExceptionsHandler
+from exceptions.sa_handler_manager import (
+    ErrorHandler,
+    ForeignKeyNotPresent,
+    ItemNotUnique,
+)
+from fastapi import APIRouter, Body, Depends, HTTPException, Request, status
+from fastapi.dependencies.models import Dependant
+from fastapi.dependencies.utils import (
+    get_parameterless_sub_dependant,
+    solve_dependencies,
+)
+from fastapi.exceptions import RequestValidationError
+from fastapi.params import Depends as DependsParam
+from pydantic import ValidationError
+from schemas.batch import (
+    BatchOperationKind,
+    BatchOperationSchemaIn,
+    BatchResultSchemaOut,
+)
+from sqlalchemy.ext.asyncio import AsyncSession
+
+REF = '$ref'
+
+
+class BatchError(Exception):
+    def __init__(self, index: int, status_code: int, detail: Any):
+        self.index = index
+        self.status_code = status_code
+        self.detail = detail
+
+
+@dataclass(eq=False)
+class Group:
+    '''
+        Consecutive operations of one kind on one model, executed as one
+        bulk statement (create, delete) or back to back (update).
+    '''
+    kind: BatchOperationKind
+    router: RouterGenerator
+    operations: list[tuple[int, BatchOperationSchemaIn]] = field(
+        default_factory=list)
+    refs: set[str] = field(default_factory=set)
+
+
+def _refs(operation: BatchOperationSchemaIn) -> set[str]:
+    values = [operation.id, *operation.data.values()]
+    return {value[REF] for value in values
+            if isinstance(value, dict) and REF in value}
+
+
+class Batch:
+    '''
+        Ordered operations run in one transaction: all of them are
+        applied or none. Consecutive creates (deletes) of one model
+        become one multi-row INSERT (DELETE) unless an operation refers
+        to an id created in the same group.
+    '''
+
+    def __init__(self,
+                 operations: list[BatchOperationSchemaIn],
+                 registry: dict[str, RouterGenerator]):
+        self.groups = self._group(operations, registry)
+
+    @retryable
+    async def run(self, session: AsyncSession) -> list[dict[str, Any]]:
+        refs: dict[str, int] = {}
+        results = []
+        async with session:
+            async with session.begin():
+                for group in self.groups:
+                    results += await self._execute(group, refs, session)
+        return results
+
+    @staticmethod
+    def _group(operations: list[BatchOperationSchemaIn],
+               registry: dict[str, RouterGenerator]) -> list[Group]:
+        groups: list[Group] = []
+        defined: set[str] = set()
+        for index, operation in enumerate(operations):
+            router = registry.get(operation.model)
+            if router is None or operation.op not in router.batch_operations:
+                raise BatchError(
+                    index, status.HTTP_422_UNPROCESSABLE_ENTITY,
+                    f'{operation.op.value} of {operation.model} '
+                    f'is not allowed')
+            if (operation.op != BatchOperationKind.create
+                    and operation.id is None):
+                raise BatchError(index, status.HTTP_422_UNPROCESSABLE_ENTITY,
+                                 'id is required')
+            if unknown := _refs(operation) - defined:
+                raise BatchError(index, status.HTTP_422_UNPROCESSABLE_ENTITY,
+                                 f'Unknown refs {sorted(unknown)}')
+            if operation.ref is not None:
+                if (operation.op != BatchOperationKind.create
+                        or operation.ref in defined):
+                    raise BatchError(
+                        index, status.HTTP_422_UNPROCESSABLE_ENTITY,
+                        f'ref {operation.ref} must name one create')
+                defined.add(operation.ref)
+            group = groups[-1] if groups else None
+            if (group is None or group.kind != operation.op
+                    or group.router is not router
+                    or _refs(operation) & group.refs):
+                group = Group(operation.op, router)
+                groups.append(group)
+            group.operations.append((index, operation))
+            if operation.ref is not None:
+                group.refs.add(operation.ref)
+        return groups
+
+    async def _execute(self, group: Group, refs: dict[str, int],
+                       session: AsyncSession) -> list[dict[str, Any]]:
+        router = group.router
+        db_crud = router.db_crud
+        first = group.operations[0][0]
+        rows = [self._row(group, index, operation, refs)
+                for index, operation in group.operations]
+        try:
+            with ErrorHandler():
+                match group.kind:
+                    case BatchOperationKind.create:
+                        ids = await db_crud.insert_many(rows, session)
+                    case BatchOperationKind.update:
+                        ids = await db_crud.update_many(rows, session)
+                    case BatchOperationKind.delete:
+                        ids = await db_crud.delete_many(
+                            [row['id'] for row in rows], session)
+        except ItemNotUnique:
+            raise BatchError(first, status.HTTP_409_CONFLICT,
+                             'Unique attribute exists.')
+        except ForeignKeyNotPresent:
+            raise BatchError(first, status.HTTP_422_UNPROCESSABLE_ENTITY,
+                             'Foreign key not present.')
+        if group.kind != BatchOperationKind.create:
+            found = set(ids)
+            for (index, _), row in zip(group.operations, rows):
+                if row['id'] not in found:
+                    raise BatchError(index, status.HTTP_404_NOT_FOUND,
+                                     'Item not found.')
+            ids = [row['id'] for row in rows]
+        results = []
+        for (index, operation), id in zip(group.operations, ids):
+            if operation.ref is not None:
+                refs[operation.ref] = id
+            results.append({'index': index, 'op': operation.op,
+                            'model': operation.model, 'id': id,
+                            'ref': operation.ref})
+        return results
+
+    @staticmethod
+    def _row(group: Group, index: int, operation: BatchOperationSchemaIn,
+             refs: dict[str, int]) -> dict[str, Any]:
+        def resolve(value: Any) -> Any:
+            if isinstance(value, dict) and REF in value:
+                return refs[value[REF]]
+            return value
+
+        data = {key: resolve(value) for key, value in operation.data.items()}
+        router = group.router
+        try:
+            match group.kind:
+                case BatchOperationKind.create:
+                    return router.schema_create.model_validate(
+                        data).model_dump()
+                case BatchOperationKind.update:
+                    schema = router.schema_update.optional_fields()
+                    return schema.model_validate(data).model_dump(
+                        exclude_unset=True) | {'id': resolve(operation.id)}
+                case BatchOperationKind.delete:
+                    return {'id': resolve(operation.id)}
+        except ValidationError as e:
+            raise BatchError(index, status.HTTP_422_UNPROCESSABLE_ENTITY,
+                             e.errors(include_url=False,
+                                      include_context=False))
+
+
+async def authorize(request: Request, batch: Batch,
+                    stack: AsyncExitStack,
+                    dependants: dict[tuple[int, str], Dependant]
+                    ) -> None:
+    '''
+        Run the dependencies of the routes each operation of the batch
+        stands for (deps_all_routes and deps_route_<op> of the model's
+        RouterGenerator): the batch is authorized as the single
+        operations would be. A dependency resolved for one model is not
+        run again for the next.
+    '''
+    cache: dict = {}
+    # Routers compare by routes (Starlette), keyed by identity.
+    groups = {(id(group.router), group.kind): group for group in batch.groups}
+    for key, group in groups.items():
+        if (dependant := dependants.get(key)) is None:
+            dependant = dependants[key] = Dependant(dependencies=[
+                get_parameterless_sub_dependant(depends=depends, path='/')
+                for depends in group.router.batch_operations[group.kind]])
+        solved = await solve_dependencies(
+            request=request, dependant=dependant, dependency_cache=cache,
+            dependency_overrides_provider=request.app,
+            async_exit_stack=stack, embed_body_fields=False)
+        if solved.errors:
+            raise RequestValidationError(solved.errors)
+        cache = solved.dependency_cache
+
+
+def batch_router(session: Callable = get_async_session,
+                 dependencies: list[DependsParam] = [],
+                 prefix: str = '/batch',
+                 idempotency: bool = settings.IDEMPOTENCY_ENABLED
+                 ) -> APIRouter:
+    '''
+        POST <prefix>/ with an ordered list of operations on the models
+        of RouterGenerator.registry, see Batch and authorize. With
+        idempotency a repeated Idempotency-Key gets the stored response.
+    '''
+    router = APIRouter(prefix=prefix, tags=['batch'])
+    dependants: dict[tuple[int, str], Dependant] = {}
+
+    async def endpoint(request: Request,
+                       operations: list[BatchOperationSchemaIn] = Body(),
+                       session: AsyncSession = Depends(session)):
+        if len(operations) > settings.BATCH_MAX_OPERATIONS:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f'At most {settings.BATCH_MAX_OPERATIONS} operations.')
+        try:
+            batch = Batch(operations, RouterGenerator.registry)
+            async with AsyncExitStack() as stack:
+                await authorize(request, batch, stack, dependants)
+                with HttpExceptionsHandler():
+                    return await batch.run(session)
+        except BatchError as e:
+            raise HTTPException(status_code=e.status_code,
+                                detail={'index': e.index, 'error': e.detail})
+
+    response_model = list[BatchResultSchemaOut]
+    router.add_api_route(
+        '/',
+        idempotent(endpoint, response_model) if idempotency else endpoint,
+        methods=['POST'],
+        response_model=response_model,
+        summary="Run operations in one transaction",
+        dependencies=[
+            Depends(query_route(f'POST {prefix}/')),
+            Depends(admission(RouteClass.write)),
+            Depends(deadline(settings.DEADLINE_WRITE, session)),
+            *dependencies])
+    return router
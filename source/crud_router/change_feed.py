@@ -0,0 +1,232 @@
+import asyncio
+import json
+from collections import deque
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, Type
+
+from db.notifications import change_listener
+from db.sa_crud import CRUDSA
+from db.write_events import WriteEvent, on_commit
+from loguru import logger
+from metrics import metrics
+from offload import dump_json_many, offload
+
+dropped_total = metrics.counter(
+    'change_feed_dropped_clients_total',
+    'Change feed clients disconnected for falling behind.')
+
+# Operations whose rows are sent along with the ids.
+WITH_ITEMS = {'create', 'update', 'upsert'}
+
+
+@dataclass
+class FeedEvent:
+    id: int
+    message: bytes
+
+
+@dataclass(eq=False)
+class Subscriber:
+    queue: asyncio.Queue
+    overflowed: bool = False
+
+
+class ChangeFeed:
+    '''
+        Server-Sent Events of writes to one model. Events come from the
+        commit hooks of this worker and from the shared LISTEN connection
+        (see notifications), changed rows are loaded and serialized once
+        per event and fanned out to every client.
+        The last buffer_size events are kept for Last-Event-ID resume.
+        A client whose queue_size queue is full is disconnected, it
+        resumes from the buffer on reconnect.
+        Event ids are local to the worker, an unknown Last-Event-ID gets
+        a reset event: the client has to reload the collection. So do
+        events without ids (whole-table notifications) and a LISTEN
+        reconnect, notifications may have been missed meanwhile.
+    '''
+
+    def __init__(self,
+                 db_crud: CRUDSA,
+                 schema: Type,
+                 session_maker: Callable,
+                 buffer_size: int,
+                 queue_size: int,
+                 heartbeat: float):
+        self.db_crud = db_crud
+        self.schema = schema
+        self.session_maker = session_maker
+        self.queue_size = queue_size
+        self.heartbeat = heartbeat
+        self.buffer: deque[FeedEvent] = deque(maxlen=buffer_size)
+        # None: clients get reset.
+        self.pending: asyncio.Queue[WriteEvent | None] = asyncio.Queue(
+            buffer_size)
+        self.subscribers: set[Subscriber] = set()
+        self.last_id = 0
+        self.dropped = False
+        self._task: asyncio.Task | None = None
+
+    def publish(self, write_event: WriteEvent) -> None:
+        if self._task is None:
+            return
+        try:
+            self.pending.put_nowait(write_event)
+        except asyncio.QueueFull:
+            logger.warning('Change feed {} is behind, event dropped',
+                           self.db_crud.model.tablename())
+            self.dropped = True
+
+    def reset(self) -> None:
+        if self._task is None:
+            return
+        try:
+            self.pending.put_nowait(None)
+        except asyncio.QueueFull:
+            self.dropped = True
+
+    async def stream(self, last_event_id: int | None) -> AsyncIterator[bytes]:
+        self._start()
+        subscriber = Subscriber(asyncio.Queue(self.queue_size))
+        self.subscribers.add(subscriber)
+        try:
+            # Queued events are newer than the buffer snapshot.
+            sent = self.last_id
+            if last_event_id is not None:
+                oldest = self.buffer[0].id if self.buffer else sent + 1
+                if last_event_id > sent or last_event_id + 1 < oldest:
+                    yield self._reset_message()
+                else:
+                    for event in list(self.buffer):
+                        if event.id > last_event_id:
+                            yield event.message
+            while not subscriber.overflowed:
+                try:
+                    event = await asyncio.wait_for(subscriber.queue.get(),
+                                                   self.heartbeat)
+                except TimeoutError:
+                    yield b': ping\n\n'
+                    continue
+                if event.id > sent:
+                    sent = event.id
+                    yield event.message
+        finally:
+            self.subscribers.discard(subscriber)
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def _start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            write_event = await self.pending.get()
+            if self.dropped:
+                self.dropped = False
+                self._broadcast(None)
+            if write_event is None or not write_event.ids:
+                self._broadcast(None)
+                continue
+            try:
+                message = await self._render(write_event)
+            except Exception as e:
+                logger.exception('Change feed event failed: {}', e)
+                message = None
+            self._broadcast(message)
+
+    async def _render(self, write_event: WriteEvent) -> bytes:
+        data = {'operation': write_event.operation,
+                'ids': list(write_event.ids)}
+        items = b'[]'
+        if write_event.operation in WITH_ITEMS:
+            async with self.session_maker() as session:
+                rows = await self.db_crud.get_many(
+                    list(write_event.ids), session,
+                    include=list(self.schema.model_fields))
+            items = await offload(dump_json_many, self.schema, rows,
+                                  size=len(rows))
+        # Items are already serialized, spliced into the json object.
+        return json.dumps(data)[:-1].encode() + b', "items": ' + items + b'}'
+
+    def _broadcast(self, data: bytes | None) -> None:
+        '''
+            data None: the event could not be rendered, clients get reset.
+        '''
+        self.last_id += 1
+        if data is None:
+            message = self._reset_message(self.last_id)
+        else:
+            message = (f'id: {self.last_id}\nevent: change\n'.encode()
+                       + b'data: ' + data + b'\n\n')
+        event = FeedEvent(self.last_id, message)
+        self.buffer.append(event)
+        for subscriber in list(self.subscribers):
+            try:
+                subscriber.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                subscriber.overflowed = True
+                self.subscribers.discard(subscriber)
+                dropped_total.inc(table=self.db_crud.model.tablename())
+
+    def _reset_message(self, id: int | None = None) -> bytes:
+        id = self.last_id if id is None else id
+        return f'id: {id}\nevent: reset\ndata: {{}}\n\n'.encode()
+
+
+feeds: dict[str, list[ChangeFeed]] = {}
+
+
+def register(feed: ChangeFeed, tables: tuple[str, ...]) -> None:
+    for table in tables:
+        feeds.setdefault(table, []).append(feed)
+
+
+def dispatch(write_event: WriteEvent) -> None:
+    # Joined inheritance: one event may concern several tables of a feed.
+    targets = {id(feed): feed for table in write_event.tables
+               for feed in feeds.get(table, [])}
+    for feed in targets.values():
+        feed.publish(write_event)
+
+
+def _dispatch_committed(events: list[WriteEvent]) -> None:
+    for write_event in events:
+        dispatch(write_event)
+
+
+on_commit(_dispatch_committed)
+def _unique_feeds() -> list[ChangeFeed]:
+    return list({id(feed): feed for table_feeds in feeds.values()
+                 for feed in table_feeds}.values())
+
+
+def _reset_feeds() -> None:
+    for feed in _unique_feeds():
+        feed.reset()
+
+
+change_listener.subscribe(dispatch)
+change_listener.on_reset(_reset_feeds)
+
+
+async def stop_feeds() -> None:
+    for feed in _unique_feeds():
+        await feed.stop()
+
+
+def _clients() -> dict[tuple, float]:
+    clients: dict[tuple, float] = {}
+    for table_feeds in feeds.values():
+        for feed in table_feeds:
+            key = (('table', feed.db_crud.model.tablename()),)
+            clients[key] = len(feed.subscribers)
+    return clients
+
+
+metrics.gauge('change_feed_clients', 'Connected change feed clients.',
+              callback=_clients)
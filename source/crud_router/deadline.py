@@ -0,0 +1,116 @@
+import asyncio
+from functools import wraps
+from typing import AsyncIterator, Callable
+
+from config import settings
+from exceptions.http_exceptions import (
+    HTTPClientClosedRequest,
+    HttpExceptionsHandler,
+)
+from fastapi import Depends, Request
+from fastapi.responses import StreamingResponse
+from loguru import logger
+from sqlalchemy.ext.asyncio import AsyncSession
+
+STATEMENT_TIMEOUT = 'statement_timeout'
+
+
+async def _watch_disconnect(request: Request, task: asyncio.Task) -> bool:
+    while not await request.is_disconnected():
+        await asyncio.sleep(settings.DEADLINE_DISCONNECT_POLL)
+    task.cancel()
+    return True
+
+
+def deadline(seconds: float,
+             session_dependency: Callable,
+             statement_timeout: bool = True) -> Callable:
+    '''
+        Request deadline:
+        - statement_timeout of every transaction the request session
+          begins while the endpoint runs is set to the deadline (see
+          db.db), Postgres stops the query;
+        - the request task is cancelled when the deadline passes or
+          the client disconnects, which cancels the in-flight asyncpg
+          query and returns the pooled connection.
+        Timeouts surface as 504 through HttpExceptionsHandler.
+        Streaming routes pass statement_timeout=False: their transaction
+        lasts as long as the client reads, see stream_deadline.
+    '''
+    async def dependency(
+            request: Request,
+            session: AsyncSession = Depends(session_dependency)
+    ) -> AsyncIterator[None]:
+        if statement_timeout:
+            session.info[STATEMENT_TIMEOUT] = int(seconds * 1000)
+        task = asyncio.current_task()
+        watcher = asyncio.create_task(_watch_disconnect(request, task))
+        try:
+            with HttpExceptionsHandler():
+                async with asyncio.timeout(seconds):
+                    yield
+        except asyncio.CancelledError:
+            if watcher.done() and not watcher.cancelled():
+                task.uncancel()
+                raise HTTPClientClosedRequest
+            raise
+        finally:
+            watcher.cancel()
+            session.info.pop(STATEMENT_TIMEOUT, None)
+    return dependency
+
+
+def stream_deadline(endpoint: Callable, seconds: float) -> Callable:
+    '''
+        Endpoint wrapper for routes returning StreamingResponse, used
+        with deadline(statement_timeout=False). The body is sent after
+        the deadline dependency has exited, so:
+        - the first chunk is produced by the endpoint, still within the
+          request deadline: a slow start is a 504 (499 on disconnect)
+          before anything is sent;
+        - every next chunk has seconds to be produced, the time the
+          client takes to read does not count. A late chunk aborts the
+          stream: the client sees a broken transfer, not a short file.
+        Disconnects during the body are handled by Starlette.
+    '''
+    @wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        response = await endpoint(*args, **kwargs)
+        if not isinstance(response, StreamingResponse):
+            return response
+        chunks = aiter(response.body_iterator)
+        try:
+            first = await anext(chunks)
+        except StopAsyncIteration:
+            first = None
+        except BaseException:
+            await _close(chunks)
+            raise
+        response.body_iterator = _paced(first, chunks, seconds)
+        return response
+    return wrapper
+
+
+async def _paced(first: bytes | None, chunks: AsyncIterator,
+                 seconds: float) -> AsyncIterator:
+    if first is None:
+        return
+    try:
+        yield first
+        while True:
+            try:
+                async with asyncio.timeout(seconds):
+                    chunk = await anext(chunks)
+            except StopAsyncIteration:
+                return
+            except TimeoutError:
+                logger.warning('Stream aborted, no chunk in {}s', seconds)
+                raise
+            yield chunk
+    finally:
+        await _close(chunks)
+
+
+async def _close(chunks: AsyncIterator) -> None:
+    if (aclose := getattr(chunks, 'aclose', None)) is not None:
+        await aclose()
@@ -0,0 +1,126 @@
+import asyncio
+import csv
+import io
+import zlib
+from enum import Enum
+from typing import Any, AsyncIterator, Sequence
+
+from config import settings
+from db import backend
+from db.sa_crud import CRUDSA
+from pydantic_core import to_json
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+class ExportFormat(str, Enum):
+    csv = 'csv'
+    ndjson = 'ndjson'
+
+
+class ExportEngine(str, Enum):
+    copy = 'copy'
+    cursor = 'cursor'
+
+
+MEDIA_TYPES = {
+    ExportFormat.csv: 'text/csv',
+    ExportFormat.ndjson: 'application/x-ndjson',
+}
+
+
+class Exporter:
+    '''
+        Builds a byte stream of model rows for StreamingResponse.
+        copy engine - COPY ... TO STDOUT, rows are rendered by Postgres.
+        cursor engine - server-side cursor, rows are rendered here chunk
+            by chunk.
+        In both cases at most queue_size chunks are held in memory.
+    '''
+
+    def __init__(self,
+                 db_crud: CRUDSA,
+                 session: AsyncSession,
+                 fields: list[str],
+                 format: ExportFormat = ExportFormat.csv,
+                 engine: ExportEngine = ExportEngine.copy,
+                 queue_size: int = 8,
+                 ranges: dict[str, tuple[Any, Any]] = {},
+                 **filters: Any):
+        self.db_crud = db_crud
+        self.session = session
+        self.fields = fields
+        self.format = format
+        # No COPY on SQLite.
+        self.engine = ExportEngine.cursor if backend.SQLITE else engine
+        self.queue_size = queue_size
+        self.ranges = ranges
+        self.filters = filters
+
+    def stream(self, compress: bool = False) -> AsyncIterator[bytes]:
+        match self.engine:
+            case ExportEngine.copy:
+                chunks = self._copy_stream()
+            case ExportEngine.cursor:
+                chunks = self._cursor_stream()
+        if compress:
+            chunks = gzip_stream(chunks)
+        return chunks
+
+    async def _copy_stream(self) -> AsyncIterator[bytes]:
+        queue: asyncio.Queue[bytes | None] = asyncio.Queue(self.queue_size)
+
+        async def output(chunk: bytes) -> None:
+            await queue.put(bytes(chunk))
+
+        async def copy() -> None:
+            try:
+                await self.db_crud.copy_to(
+                    self.session, output,
+                    include=self.fields, format=self.format.value,
+                    ranges=self.ranges, **self.filters)
+            finally:
+                # Cancelled: nobody reads the queue any more.
+                if not asyncio.current_task().cancelling():
+                    await queue.put(None)
+
+        task = asyncio.create_task(copy())
+        try:
+            while (chunk := await queue.get()) is not None:
+                yield chunk
+            await task
+        finally:
+            # The COPY holds the session connection: done before the
+            # session is closed.
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    async def _cursor_stream(self) -> AsyncIterator[bytes]:
+        if self.format == ExportFormat.csv:
+            yield self._csv([self.fields])
+        async for rows in self.db_crud.stream_all(
+                self.session, include=self.fields,
+                chunk_size=settings.EXPORT_CHUNK_SIZE, ranges=self.ranges,
+                **self.filters):
+            match self.format:
+                case ExportFormat.csv:
+                    yield self._csv(
+                        [[row[field] for field in self.fields]
+                         for row in rows])
+                case ExportFormat.ndjson:
+                    yield b''.join(to_json(dict(row)) + b'\n'
+                                   for row in rows)
+
+    @staticmethod
+    def _csv(rows: Sequence[Sequence[Any]]) -> bytes:
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        return buffer.getvalue().encode()
+
+
+async def gzip_stream(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(
+        settings.EXPORT_GZIP_LEVEL, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    async for chunk in chunks:
+        if compressed := compressor.compress(chunk):
+            yield compressed
+    yield compressor.flush()
@@ -0,0 +1,277 @@
+import asyncio
+import hashlib
+import inspect
+import zlib
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+from typing import Any, Callable
+
+from config import settings
+from db import backend
+from db.db import async_session_maker
+from db.models.idempotency import IdempotencyKey
+from fastapi import Header, HTTPException, Request, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+from loguru import logger
+from metrics import metrics
+from offload import dump_json
+from pydantic_core import to_json
+from sqlalchemy import delete
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+
+replays_total = metrics.counter(
+    'idempotent_replays_total',
+    'Responses replayed for a repeated Idempotency-Key.')
+
+HTTPIdempotencyKeyReused = HTTPException(
+    status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+    detail="Idempotency-Key was used for a different request.")
+
+HTTPIdempotencyKeyInFlight = HTTPException(
+    status_code=status.HTTP_409_CONFLICT,
+    detail="A request with this Idempotency-Key is in progress.",
+    headers={'Retry-After': '1'})
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class IdempotencyStore:
+    '''
+        Responses by Idempotency-Key. The first request claims the key
+        (a row with status None, free again after lease seconds if the
+        worker dies), its response is stored for ttl seconds. Requests
+        repeating the key wait for the first one: in-process on an
+        event, across workers by polling the row, at most wait seconds.
+    '''
+
+    def __init__(self,
+                 session_maker: Callable,
+                 ttl: float,
+                 lease: float,
+                 wait: float,
+                 poll: float,
+                 purge_interval: float):
+        self.session_maker = session_maker
+        self.ttl = ttl
+        self.lease = lease
+        self.wait = wait
+        self.poll = poll
+        self.purge_interval = purge_interval
+        self.inflight: dict[str, asyncio.Event] = {}
+        self._task: asyncio.Task | None = None
+
+    async def claim(self, key: str, fingerprint: bytes) -> bool:
+        '''
+            False if the key is taken by a live claim or a stored
+            response.
+        '''
+        stmt = backend.insert(IdempotencyKey).values(
+            key=key, fingerprint=fingerprint, status=None, body=None,
+            expires=_now() + timedelta(seconds=self.lease))
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['key'],
+            set_={column: stmt.excluded[column]
+                  for column in ('fingerprint', 'status', 'body', 'expires')},
+            where=IdempotencyKey.expires < _now()
+        ).returning(IdempotencyKey.key)
+        async with self.session_maker() as session, session.begin():
+            await backend.acquire_writer(session)
+            claimed = await session.scalar(stmt) is not None
+        if claimed:
+            self.inflight[key] = asyncio.Event()
+        return claimed
+
+    async def complete(self, key: str, status_code: int, body: bytes
+                       ) -> None:
+        try:
+            async with self.session_maker() as session, session.begin():
+                await backend.acquire_writer(session)
+                row = await session.get(IdempotencyKey, key)
+                row.status = status_code
+                row.body = zlib.compress(body)
+                row.expires = _now() + timedelta(seconds=self.ttl)
+        finally:
+            self._done(key)
+
+    async def release(self, key: str) -> None:
+        '''
+            Forget the claim: the request failed, a retry runs it again.
+        '''
+        try:
+            async with self.session_maker() as session, session.begin():
+                await backend.acquire_writer(session)
+                await session.execute(delete(IdempotencyKey).where(
+                    IdempotencyKey.key == key,
+                    IdempotencyKey.status.is_(None)))
+        finally:
+            self._done(key)
+
+    async def stored(self, key: str, fingerprint: bytes
+                     ) -> tuple[int, bytes] | None:
+        '''
+            Response of the request that claimed key, waits while it is
+            in flight. None if the claim is gone (failed or expired).
+        '''
+        deadline = asyncio.get_running_loop().time() + self.wait
+        while True:
+            async with self.session_maker() as session:
+                row = await session.get(IdempotencyKey, key)
+            if row is None:
+                return None
+            if row.fingerprint != fingerprint:
+                raise HTTPIdempotencyKeyReused
+            if row.status is not None:
+                return row.status, zlib.decompress(row.body)
+            # SQLite returns naive datetimes, stored in UTC.
+            if row.expires.replace(tzinfo=timezone.utc) < _now():
+                return None
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                raise HTTPIdempotencyKeyInFlight
+            if event := self.inflight.get(key):
+                try:
+                    await asyncio.wait_for(event.wait(), remaining)
+                except TimeoutError:
+                    pass
+            else:
+                await asyncio.sleep(min(self.poll, remaining))
+
+    async def purge(self) -> int:
+        async with self.session_maker() as session, session.begin():
+            await backend.acquire_writer(session)
+            result = await session.execute(delete(IdempotencyKey).where(
+                IdempotencyKey.expires < _now()))
+        return result.rowcount
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.purge_interval)
+            try:
+                if purged := await self.purge():
+                    logger.debug('Purged {} idempotency keys', purged)
+            except Exception as e:
+                logger.warning('Idempotency keys purge failed: {}', e)
+
+    def _done(self, key: str) -> None:
+        if event := self.inflight.pop(key, None):
+            event.set()
+
+
+idempotency_store = IdempotencyStore(
+    session_maker=async_session_maker,
+    ttl=settings.IDEMPOTENCY_TTL,
+    lease=settings.IDEMPOTENCY_LEASE,
+    wait=settings.IDEMPOTENCY_WAIT,
+    poll=settings.IDEMPOTENCY_POLL,
+    purge_interval=settings.IDEMPOTENCY_PURGE_INTERVAL)
+
+
+def principal(request: Request) -> str:
+    '''
+        Digest of the credentials the request is authenticated with:
+        keys of different users never meet.
+    '''
+    authorization = request.headers.get('Authorization', '')
+    return hashlib.sha256(authorization.encode()).hexdigest()
+
+
+async def fingerprint(request: Request) -> bytes:
+    digest = hashlib.sha256()
+    for part in (principal(request), request.method, request.url.path,
+                 str(request.url.query)):
+        digest.update(part.encode() + b'\0')
+    digest.update(await request.body())
+    return digest.digest()
+
+
+def idempotent(endpoint: Callable,
+               response_model: Any,
+               status_code: int = status.HTTP_200_OK,
+               store: IdempotencyStore = idempotency_store) -> Callable:
+    '''
+        Endpoint wrapper honouring the Idempotency-Key header. The
+        response (client errors included, as they would repeat) is
+        rendered with response_model and stored, a repeated key gets it
+        back with the Idempotent-Replayed header instead of running the
+        endpoint again. Requests without the header run as before.
+        Keys are scoped by principal (the Authorization header).
+        The response is stored after the endpoint's own transaction has
+        committed: if the worker dies in between, the claim expires
+        after lease seconds and a retry runs the endpoint again.
+    '''
+    signature = inspect.signature(endpoint)
+    # FastAPI passes the request to one parameter only: the endpoint's
+    # own if it has one.
+    request_name = next((name for name, parameter
+                         in signature.parameters.items()
+                         if parameter.annotation is Request), None)
+    extra = [
+        inspect.Parameter('idempotency_request',
+                          inspect.Parameter.KEYWORD_ONLY,
+                          annotation=Request),
+    ] if request_name is None else []
+    extra += [
+        inspect.Parameter('idempotency_key',
+                          inspect.Parameter.KEYWORD_ONLY,
+                          annotation=str | None,
+                          default=Header(default=None,
+                                         alias=IDEMPOTENCY_HEADER)),
+    ]
+
+    @wraps(endpoint)
+    async def wrapper(*args, idempotency_key: str | None,
+                      idempotency_request: Request | None = None, **kwargs):
+        if idempotency_key is None:
+            return await endpoint(*args, **kwargs)
+        if request_name is not None:
+            idempotency_request = kwargs[request_name]
+        idempotency_key = (f'{principal(idempotency_request)}:'
+                           f'{idempotency_key}')
+        digest = await fingerprint(idempotency_request)
+        while not await store.claim(idempotency_key, digest):
+            if (stored := await store.stored(idempotency_key, digest)
+                    ) is not None:
+                replays_total.inc()
+                return _response(*stored, replayed=True)
+        try:
+            result = await endpoint(*args, **kwargs)
+        except HTTPException as e:
+            if e.status_code >= 500:
+                await store.release(idempotency_key)
+                raise
+            body = to_json({'detail': jsonable_encoder(e.detail)})
+            await store.complete(idempotency_key, e.status_code, body)
+            raise
+        except BaseException:
+            await asyncio.shield(store.release(idempotency_key))
+            raise
+        body = dump_json(response_model, result)
+        await store.complete(idempotency_key, status_code, body)
+        return _response(status_code, body)
+
+    wrapper.__signature__ = signature.replace(parameters=[
+        *(parameter for parameter in signature.parameters.values()
+          if parameter.kind != inspect.Parameter.VAR_KEYWORD),
+        *extra])
+    return wrapper
+
+
+def _response(status_code: int, body: bytes, replayed: bool = False
+              ) -> Response:
+    headers = {REPLAYED_HEADER: 'true'} if replayed else None
+    return Response(content=body, status_code=status_code,
+                    media_type='application/json', headers=headers)
@@ -1,30 +1,83 @@
 # from msilib import schema
+import csv
+import io
 import json
 from collections.abc import Iterator
+from datetime import datetime
 from enum import Enum
-from typing import Any, Callable, Coroutine, Literal, Type
+from typing import Any, Callable, Coroutine, Literal, Sequence, Type
 
-from db.db import get_async_session
+from cache.response_cache import response_cache
+from config import settings
+from crud_router.admission import (
+    Priority,
+    RouteClass,
+    admission,
+    admit_stream,
+)
+from crud_router.change_feed import ChangeFeed, register
+from crud_router.deadline import deadline, stream_deadline
+from crud_router.export import MEDIA_TYPES, ExportEngine, Exporter, ExportFormat
+from crud_router.idempotency import idempotent
+from db.audit import audit_log
+from db.backend import SQLITE
+from db.db import async_session_maker, get_async_session
+from db.models.jobs import JobKind
 from db.sa_crud import CRUDSA
+from db.slow_queries import query_route
+from db.json_select import nested_schema
+from db.write_events import model_tables
 from exceptions.http_exceptions import (
     HttpExceptionsHandler,
+    HTTPJobQueueFull,
     HTTPObjectNotExist,
     HTTPUniqueAttrException,
 )
 from exceptions.sa_handler_manager import ErrorHandler, ItemNotUnique
-from fastapi import APIRouter, Body, Depends, HTTPException
+from fastapi import (
+    APIRouter,
+    Body,
+    Depends,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    UploadFile,
+    status,
+)
 from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError, ResponseValidationError
 from fastapi.params import Depends
+from fastapi.responses import Response, StreamingResponse
+from jobs.executor import JobQueueFull, job_executor
 from loguru import logger
+from offload import dump_json, dump_json_many, json_schema, offload, type_adapter, validate_many
+from pydantic import ValidationError
 from pydantic.json import pydantic_encoder
-from schemas.base import BaseSchema
-from sqlalchemy import select
+from profiling import timed
+from schemas.aggregates import BucketCountSchemaOut
+from schemas.audit import AuditRecordSchemaOut
+from schemas.base import BaseSchema, page_schema
+from schemas.jobs import JobSchemaOut
+from sqlalchemy import inspect
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 
+class RenderMode(str, Enum):
+    orm = 'orm'
+    db = 'db'
+
+
+class Bucket(str, Enum):
+    day = 'day'
+    week = 'week'
+    month = 'month'
+
+
 class RouterGenerator(APIRouter):
     root_path = '/'
+    registry: dict[str, 'RouterGenerator'] = {}
 
     def __init__(
         self,
@@ -40,19 +93,39 @@ class RouterGenerator(APIRouter):
         route_get_all: bool = False,
         route_get_all_with_related: bool = False,
         route_get_by_id: bool = False,
+        route_get_by_ids: bool = False,
         route_create: bool = False,
         route_create_batch: bool = False,
         route_update: bool = False,
         route_delete: bool = False,
+        route_export: bool = False,
+        route_jobs: bool = False,
+        route_changes: bool = False,
+        route_relations: bool = False,
+        route_counts: bool = False,
+        route_history: bool = False,
         deps_all_routes: list[Depends] = [],
         deps_route_get_all_related: list[Depends] = [],
         deps_route_get_all: list[Depends] = [],
         deps_route_get_by_id: list[Depends] = [],
+        deps_route_get_by_ids: list[Depends] = [],
         deps_route_create: list[Depends] = [],
         deps_route_create_batch: list[Depends] = [],
         deps_route_update: list[Depends] = [],
         deps_route_delete: list[Depends] = [],
+        deps_route_export: list[Depends] = [],
+        deps_route_jobs: list[Depends] = [],
+        deps_route_changes: list[Depends] = [],
+        deps_route_relations: list[Depends] = [],
+        deps_route_counts: list[Depends] = [],
+        deps_route_history: list[Depends] = [],
         session: AsyncSession = get_async_session,
+        admission_control: bool = True,
+        deadlines: dict[RouteClass, float] = {},
+        cache_responses: bool = settings.CACHE_ENABLED,
+        relation_schemas: dict[str, Type[BaseSchema]] = {},
+        range_filters: list[str] = [],
+        idempotency: bool = settings.IDEMPOTENCY_ENABLED,
         *args, **kwargs
     ) -> None:
         self.db_crud = db_crud
@@ -63,12 +136,35 @@ class RouterGenerator(APIRouter):
         self.schema_create = schema_create
         self.schema_update = schema_update
         self.session = session
+        self.admission_control = admission_control
+        self.deadlines = {
+            RouteClass.read: settings.DEADLINE_READ,
+            RouteClass.write: settings.DEADLINE_WRITE,
+            RouteClass.heavy: settings.DEADLINE_HEAVY,
+        } | deadlines
+        self.cache_responses = cache_responses
+        self.idempotency = idempotency
+        self.tables = model_tables(self.db_crud.model)
+        # Column -> python type of <column>_from/<column>_to parameters.
+        self.range_filters = {
+            field: getattr(self.db_crud.model, field).type.python_type
+            for field in range_filters}
 
         prefix = str(prefix if prefix else self.schema.__name__).lower()
         prefix = self.root_path + prefix.strip("/")
         tags = tags or [prefix.strip("/")]
 
         super().__init__(prefix=prefix, tags=tags, )
+        self.registry[self.db_crud.model.tablename()] = self
+        # Operations of the model allowed in /batch and the dependencies
+        # of their routes, run by the batch too (see crud_router.batch).
+        self.batch_operations = {
+            operation: [*dependencies, *deps_all_routes]
+            for operation, enabled, dependencies in (
+                ('create', route_create, deps_route_create),
+                ('update', route_update, deps_route_update),
+                ('delete', route_delete, deps_route_delete))
+            if enabled}
 
         if route_get_all:
             self._add_api_route(
@@ -76,9 +172,22 @@ class RouterGenerator(APIRouter):
                 endpoint=self._get_all(self.schema_basic_out),
                 methods=["GET"],
                 response_model=list[self.schema_basic_out] | None,
+                route_class=RouteClass.read,
                 summary="Get all",
+                openapi_extra=self._range_parameters(),
                 dependencies=deps_route_get_all + deps_all_routes)
 
+        if route_counts and self.range_filters:
+            self._add_api_route(
+                '/counts/',
+                endpoint=self._count_by_bucket(),
+                methods=["GET"],
+                response_model=list[BucketCountSchemaOut],
+                route_class=RouteClass.read,
+                summary="Counts per time bucket",
+                openapi_extra=self._range_parameters(),
+                dependencies=deps_route_counts + deps_all_routes)
+
         if route_get_all_with_related:
             self._add_api_route(
                 '/related/',
@@ -86,26 +195,87 @@ class RouterGenerator(APIRouter):
                     schema=self.schema_full_out),
                 methods=["GET"],
                 response_model=list[self.schema_full_out] | None,
+                route_class=RouteClass.heavy,
+                streaming=True,
                 summary="Get all with related",
                 dependencies=deps_route_get_all_related + deps_all_routes)
 
+        if route_export:
+            self._add_api_route(
+                '/export/',
+                endpoint=self._export(schema=self.schema_basic_out),
+                methods=["GET"],
+                response_class=StreamingResponse,
+                route_class=RouteClass.heavy,
+                streaming=True,
+                summary="Export all",
+                openapi_extra=self._range_parameters(),
+                dependencies=deps_route_export + deps_all_routes)
+
+        if route_changes:
+            # Long-lived stream: neither admission slot nor deadline.
+            self._add_api_route(
+                '/changes/',
+                endpoint=self._changes(schema=self.schema_basic_out),
+                methods=["GET"],
+                response_class=StreamingResponse,
+                summary="Change feed (Server-Sent Events)",
+                dependencies=deps_route_changes + deps_all_routes)
+
+        if route_get_by_ids:
+            self._add_api_route(
+                '/by-ids/',
+                endpoint=self._get_by_ids(schema=self.schema_basic_out),
+                methods=["GET"],
+                response_model=list[self.schema_basic_out],
+                route_class=RouteClass.read,
+                priority=Priority.high,
+                summary="Get by ids",
+                dependencies=deps_route_get_by_ids + deps_all_routes)
+
+        if route_history:
+            self._add_api_route(
+                '/{item_id}/history/',
+                endpoint=self._history(),
+                methods=["GET"],
+                response_model=list[AuditRecordSchemaOut],
+                route_class=RouteClass.read,
+                summary="Get change history",
+                dependencies=deps_route_history + deps_all_routes)
+
+        if route_relations:
+            for relation, schema in self._relation_schemas(
+                    relation_schemas).items():
+                self._add_api_route(
+                    f'/{{item_id}}/{relation}/',
+                    endpoint=self._get_related_page(relation, schema),
+                    methods=["GET"],
+                    response_model=page_schema(schema),
+                    route_class=RouteClass.read,
+                    summary=f"Get {relation} page",
+                    dependencies=deps_route_relations + deps_all_routes)
+
         if route_get_by_id:
             self._add_api_route(
                 '/{item_id}/',
                 endpoint=self._get_by_id(schema=self.schema_basic_out),
                 methods=["GET"],
                 response_model=self.schema_basic_out,
+                route_class=RouteClass.read,
+                priority=Priority.high,
                 summary="Get by id",
                 dependencies=deps_route_get_by_id + deps_all_routes)
 
         if route_create:
             self._add_api_route(
                 '',
-                endpoint=self._create(
-                    schema_create=self.schema_create,
-                    schema_out=self.schema_basic_out),
+                endpoint=self._idempotent(
+                    self._create(schema_create=self.schema_create,
+                                 schema_out=self.schema_basic_out),
+                    self.schema_basic_out),
                 methods=["POST"],
                 response_model=self.schema_basic_out,
+                route_class=RouteClass.write,
                 summary="Create",
                 dependencies=deps_route_create + deps_all_routes)
 
@@ -116,6 +286,7 @@ class RouterGenerator(APIRouter):
                                       schema_out=self.schema_basic_out),
                 methods=["PATCH"],
                 response_model=self.schema_basic_out,
+                route_class=RouteClass.write,
                 summary="Update",
                 dependencies=deps_route_update + deps_all_routes)
 
@@ -125,62 +296,352 @@ class RouterGenerator(APIRouter):
                 endpoint=self._delete(),
                 methods=["DELETE"],
                 response_model=self.schema_in,
+                route_class=RouteClass.write,
                 summary="Delete item",
                 dependencies=deps_route_delete + deps_all_routes)
 
         if route_create_batch:
             self._add_api_route(
                 '/batch/',
-                endpoint=self._create_batch(
-                    schema_create=self.schema_create,
-                    schema_out=list[Any | str]),
+                endpoint=self._idempotent(
+                    self._create_batch(schema_create=self.schema_create,
+                                       schema_out=list[Any | str]),
+                    list[self.schema_basic_out | str]),
                 methods=["POST"],
+                openapi_extra=self._list_body(self.schema_create),
                 # self.self.schema_basic_out),
                 response_model=list[self.schema_basic_out | str],
+                route_class=RouteClass.heavy,
                 summary="Create batch",
                 dependencies=deps_route_create_batch + deps_all_routes)
 
+        if route_jobs:
+            job_executor.register(self.db_crud)
+            for kind, schema in ((JobKind.create, self.schema_create),
+                                 (JobKind.upsert, self.schema_create),
+                                 (JobKind.delete, int)):
+                self._add_api_route(
+                    f'/jobs/{kind.value}/',
+                    endpoint=self._submit_job(kind, schema),
+                    methods=["POST"],
+                    openapi_extra=self._list_body(schema),
+                    response_model=JobSchemaOut,
+                    status_code=status.HTTP_202_ACCEPTED,
+                    route_class=RouteClass.write,
+                    summary=f"Submit {kind.value} job",
+                    dependencies=deps_route_jobs + deps_all_routes)
+            self._add_api_route(
+                '/jobs/import/',
+                endpoint=self._submit_import_job(self.schema_create),
+                methods=["POST"],
+                response_model=JobSchemaOut,
+                status_code=status.HTTP_202_ACCEPTED,
+                route_class=RouteClass.write,
+                summary="Submit import job",
+                dependencies=deps_route_jobs + deps_all_routes)
+
     def _add_api_route(
         self,
         path,
         endpoint: Callable[..., Any],
         dependencies: list[Depends] = [],
         error_responses: list[HTTPException] | None = None,
+        route_class: RouteClass | None = None,
+        priority: Priority = Priority.normal,
+        streaming: bool = False,
         **kwargs: Any,
     ) -> None:
+        '''
+            streaming: the endpoint may return a StreamingResponse, whose
+            body is sent after the dependencies have exited.
+        '''
+        if route_class and (seconds := self.deadlines.get(route_class)):
+            dependencies = [Depends(deadline(seconds, self.session,
+                                             statement_timeout=not streaming)),
+                            *dependencies]
+            if streaming:
+                endpoint = stream_deadline(endpoint, seconds)
+        if route_class and self.admission_control:
+            if streaming:
+                endpoint = admit_stream(endpoint, route_class, priority)
+            else:
+                dependencies = [Depends(admission(route_class, priority)),
+                                *dependencies]
+        methods = ','.join(kwargs.get('methods') or [])
+        dependencies = [Depends(query_route(f'{methods} {self.prefix}{path}')),
+                        *dependencies]
         super().add_api_route(
             path, endpoint, dependencies=dependencies,
             ** kwargs
         )
 
+    def _idempotent(self, endpoint: Callable, response_model: Any
+                    ) -> Callable:
+        '''
+            Honour Idempotency-Key on POST routes (see idempotency).
+        '''
+        if not self.idempotency:
+            return endpoint
+        return idempotent(endpoint, response_model)
+
     def _get_all(self, schema: BaseSchema) -> Callable:
-        async def endpoint(session: AsyncSession = Depends(self.session)):
+        async def endpoint(request: Request,
+                           session: AsyncSession = Depends(self.session)):
             include_fields = schema.model_fields
-            with ErrorHandler() as error_handler:
-                models = await self.db_crud.get_all(session, include_fields)
-            return models
+            ranges = self._ranges(request)
+
+            async def render() -> bytes:
+                with ErrorHandler() as error_handler:
+                    models = await self.db_crud.get_all(
+                        session, include_fields, ranges=ranges)
+                return await self._serialize(schema, models)
+            return await self._cached(request, render)
+        return endpoint
+
+    def _count_by_bucket(self) -> Callable:
+        fields = list(self.range_filters)
+
+        async def endpoint(request: Request,
+                           bucket: Bucket = Bucket.day,
+                           by: str = fields[0],
+                           session: AsyncSession = Depends(self.session)):
+            if by not in self.range_filters:
+                raise HTTPException(status_code=422,
+                                    detail=f"Fields allowed: {fields}")
+            start, end = self._ranges(request).get(by, (None, None))
+
+            async def render() -> bytes:
+                with ErrorHandler():
+                    counts = await self.db_crud.count_by_bucket(
+                        by, bucket.value, session, start, end)
+                return self._dump(list[BucketCountSchemaOut], counts)
+            return await self._cached(request, render)
         return endpoint
 
+    def _ranges(self, request: Request) -> dict[str, tuple[Any, Any]]:
+        '''
+            Half-open ranges [<field>_from, <field>_to) of range_filters
+            from query parameters.
+        '''
+        ranges = {}
+        for field, python_type in self.range_filters.items():
+            bounds = []
+            for name in (f'{field}_from', f'{field}_to'):
+                value = request.query_params.get(name)
+                try:
+                    bounds.append(None if value is None else type_adapter(
+                        python_type).validate_strings(value))
+                except ValidationError as e:
+                    raise RequestValidationError(
+                        self._errors(e, 'query', name))
+            if bounds != [None, None]:
+                ranges[field] = tuple(bounds)
+        return ranges
+
+    def _range_parameters(self) -> dict[str, Any] | None:
+        '''
+            OpenAPI description of the parameters read by _ranges.
+        '''
+        if not self.range_filters:
+            return None
+        return {'parameters': [
+            {'name': f'{field}_{bound}', 'in': 'query', 'required': False,
+             'schema': json_schema(python_type)}
+            for field, python_type in self.range_filters.items()
+            for bound in ('from', 'to')]}
+
     def _get_all_with_related(self, schema: BaseSchema) -> Callable:
-        async def endpoint(session: AsyncSession = Depends(self.session)):
-            stmt = select(self.db_crud.model
-                          ).order_by(
-                getattr(self.db_crud.model, self.db_crud.model.get_pks()[0]))
-            with ErrorHandler() as error_handler:
-                models = await session.scalars(stmt)
-            result = models.unique().all()
-            return result
+        mapper = inspect(self.db_crud.model)
+        tables = {*self.tables,
+                  *(table.name for relationship in mapper.relationships
+                    for table in relationship.mapper.tables)}
+
+        async def endpoint(request: Request,
+                           render_mode: RenderMode = Query(
+                               default=RenderMode.orm, alias='render'),
+                           session: AsyncSession = Depends(self.session)):
+            if render_mode == RenderMode.db and not SQLITE:
+                # Documents are assembled by Postgres and streamed as is,
+                # SQLite falls back to orm.
+                return StreamingResponse(
+                    self.db_crud.stream_json(
+                        session, schema,
+                        chunk_size=settings.EXPORT_CHUNK_SIZE),
+                    media_type='application/json')
+            include_fields = list(schema.model_fields)
+
+            async def render() -> bytes:
+                with ErrorHandler() as error_handler:
+                    result = await self.db_crud.get_all_with_related(
+                        session, include_fields)
+                return await self._serialize(schema, result)
+            return await self._cached(request, render, tables)
         return endpoint
 
-    def _get_by_id(self, schema: BaseSchema) -> Coroutine:
+    def _export(self, schema: BaseSchema) -> Callable:
+        schema_fields = list(schema.model_fields)
+
+        async def endpoint(
+                request: Request,
+                format: ExportFormat = ExportFormat.csv,
+                engine: ExportEngine = ExportEngine.copy,
+                fields: list[str] | None = Query(default=None),
+                gzip: bool = False,
+                session: AsyncSession = Depends(self.session)):
+            fields = [field for field in fields or schema_fields
+                      if field in schema_fields]
+            if not fields:
+                raise HTTPException(status_code=422,
+                                    detail=f"Fields allowed: {schema_fields}")
+            exporter = Exporter(self.db_crud, session, fields,
+                                format=format, engine=engine,
+                                ranges=self._ranges(request))
+            filename = f'{self.db_crud.model.tablename()}.{format.value}'
+            media_type = MEDIA_TYPES[format]
+            if gzip:
+                filename += '.gz'
+                media_type = 'application/gzip'
+            return StreamingResponse(
+                exporter.stream(compress=gzip),
+                media_type=media_type,
+                headers={'Content-Disposition':
+                         f'attachment; filename="{filename}"'})
+        return endpoint
+
+    def _changes(self, schema: BaseSchema) -> Callable:
+        feed = ChangeFeed(self.db_crud, schema, async_session_maker,
+                          buffer_size=settings.FEED_BUFFER_SIZE,
+                          queue_size=settings.FEED_CLIENT_QUEUE,
+                          heartbeat=settings.FEED_HEARTBEAT)
+        register(feed, self.tables)
+
+        async def endpoint(last_event_id: int | None = Header(default=None)):
+            return StreamingResponse(
+                feed.stream(last_event_id),
+                media_type='text/event-stream',
+                headers={'Cache-Control': 'no-cache',
+                         'X-Accel-Buffering': 'no'})
+        return endpoint
+
+    def _relation_schemas(self, relation_schemas: dict[str, Type[BaseSchema]]
+                          ) -> dict[str, Type[BaseSchema]]:
+        '''
+            Item schema of every to-many relation: given explicitly or
+            taken from the field of the full output schema.
+        '''
+        full_fields = (self.schema_full_out.model_fields
+                       if self.schema_full_out else {})
+        schemas = {}
+        for relation in self.db_crud.collections():
+            if relation in relation_schemas:
+                schemas[relation] = relation_schemas[relation]
+            elif relation in full_fields:
+                schemas[relation] = nested_schema(
+                    full_fields[relation].annotation)
+        return schemas
+
+    def _get_related_page(self, relation: str, schema: BaseSchema) -> Callable:
+        related = self.db_crud.collections()[relation]
+        tables = {*self.tables, *model_tables(related)}
+        columns = {}
+        for field in related.as_list():
+            try:
+                columns[field] = getattr(related, field).type.python_type
+            except NotImplementedError:
+                columns[field] = str
+
+        async def endpoint(request: Request,
+                           item_id: int,
+                           after: int | None = None,
+                           limit: int = Query(default=settings.PAGE_LIMIT,
+                                              ge=1, le=settings.PAGE_LIMIT_MAX),
+                           session: AsyncSession = Depends(self.session)):
+            filters = self._filters(request, columns, {'after', 'limit'})
+
+            async def render() -> bytes:
+                with HttpExceptionsHandler():
+                    items = await self.db_crud.get_related_page(
+                        item_id, relation, session,
+                        after=after, limit=limit, **filters)
+                next_after = items[-1].id if len(items) == limit else None
+                return self._dump(page_schema(schema),
+                                 {'items': items, 'next_after': next_after})
+            return await self._cached(request, render, tables)
+        return endpoint
+
+    def _history(self) -> Callable:
+        table_name = self.tables[0]
+
         async def endpoint(item_id: int,
+                           before: datetime | None = None,
+                           before_id: int | None = None,
+                           limit: int = Query(default=settings.PAGE_LIMIT,
+                                              ge=1, le=settings.PAGE_LIMIT_MAX),
                            session: AsyncSession = Depends(self.session)):
-            include_fields = schema.model_fields
+            '''
+                Newest first, the next page starts before the time and
+                id of the last record.
+            '''
+            if (before is None) != (before_id is None):
+                raise RequestValidationError(
+                    [{'loc': ('query', 'before_id'), 'type': 'missing',
+                      'msg': 'before and before_id go together'}])
             with HttpExceptionsHandler():
-                result = await self.db_crud.get_by_id(item_id,
-                                                      include=include_fields,
-                                                      session=session)
-            return result
+                return await audit_log.history(
+                    session, table_name, item_id,
+                    before=(before, before_id) if before else None,
+                    limit=limit)
+        return endpoint
+
+    @classmethod
+    def _filters(cls,
+                 request: Request,
+                 columns: dict[str, type],
+                 reserved: set[str]) -> dict[str, Any]:
+        '''
+            Equality filters from query parameters named after columns.
+        '''
+        filters = {}
+        for name, value in request.query_params.items():
+            if name in reserved:
+                continue
+            if name not in columns:
+                raise HTTPException(
+                    status_code=422,
+                    detail=f"Filters allowed: {sorted(columns)}")
+            try:
+                filters[name] = type_adapter(columns[name]
+                                             ).validate_strings(value)
+            except ValidationError as e:
+                raise RequestValidationError(cls._errors(e, 'query', name))
+        return filters
+
+    def _get_by_id(self, schema: BaseSchema) -> Coroutine:
+        async def endpoint(request: Request,
+                           item_id: int,
+                           session: AsyncSession = Depends(self.session)):
+            include_fields = schema.model_fields
+
+            async def render() -> bytes:
+                with HttpExceptionsHandler():
+                    result = await self.db_crud.get_by_id(
+                        item_id, include=include_fields, session=session)
+                return self._dump(schema, result)
+            return await self._cached(request, render)
+        return endpoint
+
+    def _get_by_ids(self, schema: BaseSchema) -> Coroutine:
+        async def endpoint(request: Request,
+                           ids: list[int] = Query(),
+                           session: AsyncSession = Depends(self.session)):
+            include_fields = schema.model_fields
+
+            async def render() -> bytes:
+                with HttpExceptionsHandler():
+                    result = await self.db_crud.get_many(
+                        ids, include=include_fields, session=session)
+                return await self._serialize(schema, result)
+            return await self._cached(request, render)
         return endpoint
 
     def _create(self,
@@ -190,7 +651,8 @@ class RouterGenerator(APIRouter):
                            session: AsyncSession = Depends(self.session)
                            ) -> schema_out:
             try:
-                logger.debug('Create endpoint. Data', data.dict())
+                logger.opt(lazy=True).debug('Create endpoint. Data {}',
+                                            data.dict)
                 response: int = await self.db_crud.create(
                     data=data.dict(), session=session)
                 return response
@@ -201,11 +663,13 @@ class RouterGenerator(APIRouter):
     def _create_batch(self,
                       schema_create: BaseSchema,
                       schema_out: BaseSchema) -> Coroutine:
-        async def endpoint(data: list[schema_create] = Body(),
+        async def endpoint(data: list[dict[str, Any]] = Body(),
                            session: AsyncSession = Depends(self.session)
                            ) -> list[schema_out | str]:
-            data = [item.dict() for item in data]
-            logger.debug('Create endpoint. Data', data)
+            data = [item.dict()
+                    for item in await self._validate(schema_create, data)]
+            logger.opt(lazy=True).debug('Create batch endpoint. Data {}',
+                                        lambda: data)
             response: list[BaseSchema] = await self.db_crud.create_batch(
                 data=data, session=session)
             return response
@@ -234,3 +698,104 @@ class RouterGenerator(APIRouter):
                 result = await self.db_crud.delete(item_id, session)
             return result
         return endpoint
+
+    def _submit_job(self, kind: JobKind, schema: Type) -> Coroutine:
+        async def endpoint(data: list[Any] = Body(),
+                           index_elements: list[str] | None = Query(
+                               default=None)):
+            payload = jsonable_encoder(await self._validate(schema, data))
+            return await self._submit(kind, payload, index_elements)
+        return endpoint
+
+    def _submit_import_job(self, schema_create: BaseSchema) -> Coroutine:
+        async def endpoint(file: UploadFile,
+                           format: ExportFormat = ExportFormat.csv,
+                           index_elements: list[str] | None = Query(
+                               default=None)):
+            content = (await file.read()).decode()
+            match format:
+                case ExportFormat.csv:
+                    rows = [{key: value if value != '' else None
+                             for key, value in row.items()}
+                            for row in csv.DictReader(io.StringIO(content))]
+                case ExportFormat.ndjson:
+                    rows = [json.loads(line)
+                            for line in content.splitlines() if line]
+            data = await self._validate(schema_create, rows)
+            payload = jsonable_encoder(data)
+            return await self._submit(JobKind.import_, payload, index_elements)
+        return endpoint
+
+    async def _validate(self, schema: Type, data: list[Any]) -> list[Any]:
+        '''
+            Validate list body in the offload pool, big batches would
+            block the event loop for the whole validation.
+        '''
+        try:
+            return await offload(validate_many, schema, data, size=len(data))
+        except ValidationError as e:
+            raise RequestValidationError(self._errors(e, 'body'))
+
+    async def _serialize(self, schema: Type, items: Sequence[Any]) -> bytes:
+        '''
+            Body of list of schema in the offload pool, rendered as
+            response_model would (see offload.dump_json).
+        '''
+        with timed('serialization'):
+            try:
+                return await offload(dump_json_many, schema, items,
+                                     size=len(items))
+            except ValidationError as e:
+                raise ResponseValidationError(self._errors(e, 'response'))
+
+    @classmethod
+    def _dump(cls, schema: Type, item: Any) -> bytes:
+        with timed('serialization'):
+            try:
+                return dump_json(schema, item)
+            except ValidationError as e:
+                raise ResponseValidationError(cls._errors(e, 'response'))
+
+    @staticmethod
+    def _errors(error: ValidationError, *loc: str) -> list[dict[str, Any]]:
+        '''
+            Errors of error located as FastAPI locates them, loc: 'body',
+            'query' and the parameter name, 'response'.
+        '''
+        return [{**item, 'loc': (*loc, *item['loc'])}
+                for item in error.errors(include_url=False)]
+
+    async def _cached(self,
+                      request: Request,
+                      render: Callable[[], Coroutine[Any, Any, bytes]],
+                      tables: set[str] | None = None) -> Response:
+        '''
+            Serve GET response from the response cache, render builds
+            the body on a miss. tables: tables the response is built
+            from, the model tables by default.
+        '''
+        if not self.cache_responses:
+            return Response(await render(), media_type='application/json')
+        return await response_cache.respond(
+            request, tables or self.tables, render)
+
+    @staticmethod
+    def _list_body(schema: Type) -> dict[str, Any]:
+        '''
+            OpenAPI request body of routes validating list of schema
+            themselves (see _validate).
+        '''
+        body_schema = json_schema(list[schema])
+        return {'requestBody': {'required': True, 'content': {
+            'application/json': {'schema': body_schema}}}}
+
+    async def _submit(self,
+                      kind: JobKind,
+                      payload: list[Any],
+                      index_elements: list[str] | None):
+        try:
+            return await job_executor.submit(
+                kind, self.db_crud.model.tablename(), payload,
+                options={'index_elements': index_elements})
+        except JobQueueFull:
+            raise HTTPJobQueueFull
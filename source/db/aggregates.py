@@ -0,0 +1,175 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable
+
+from config import settings
+from db.db import async_session_maker
+from db.models.aggregates import AggregateRefresh
+from db.write_events import WriteEvent, on_commit
+from loguru import logger
+from metrics import metrics
+from sqlalchemy import Select, TableClause, column, delete, func, select, table, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+refreshes_total = metrics.counter(
+    'aggregate_refreshes_total', 'Aggregate refreshes.')
+refresh_seconds_total = metrics.counter(
+    'aggregate_refresh_seconds_total', 'Time spent refreshing aggregates.')
+
+
+@dataclass(frozen=True)
+class Aggregate:
+    '''
+        Row count of table per key column, kept incrementally: triggers
+        on table append per-statement deltas to <name>_delta, refresh
+        folds them into the <name> table (created by migrations).
+        groups: table of every group (key references its id) and its
+        label column, groups without rows count 0.
+    '''
+    name: str
+    table: str
+    key: str
+    groups: tuple[str, str] | None = None
+
+    @property
+    def counts(self) -> TableClause:
+        return table(self.name, column(self.key), column('count'))
+
+    def select(self) -> Select:
+        counts = self.counts
+        if self.groups is None:
+            return select(counts).where(counts.c.count > 0
+                                        ).order_by(counts.c[self.key])
+        name, label = self.groups
+        groups = table(name, column('id'), column(label))
+        return select(
+            groups.c.id.label(self.key),
+            groups.c[label].label(f'{name}_{label}'),
+            func.coalesce(counts.c.count, 0).label('count')
+        ).select_from(groups.outerjoin(
+            counts, counts.c[self.key] == groups.c.id)
+        ).order_by(groups.c.id)
+
+
+AGGREGATES = {aggregate.name: aggregate for aggregate in (
+    Aggregate('device_count_by_vendor', 'device', 'vendor_id',
+              ('vendor', 'name')),
+    Aggregate('cartridge_count_by_model', 'cartridge', 'model_id',
+              ('model', 'name')),
+    Aggregate('device_count_by_type', 'device', 'type'),
+)}
+
+# Pending deltas of the aggregate added to its counts, in one statement.
+FOLD = '''
+WITH folded AS (DELETE FROM {name}_delta RETURNING {key}, delta)
+INSERT INTO {name} ({key}, count)
+SELECT {key}, sum(delta) FROM folded GROUP BY {key}
+ON CONFLICT ({key}) DO UPDATE SET count = {name}.count + excluded.count
+'''
+
+
+class AggregateRefresher:
+    '''
+        Folds the deltas of aggregates into their counts after committed
+        writes to their tables, a refresh costs the rows written since
+        the last one, not the table. Readers are not blocked. Writes
+        within delay seconds are coalesced into one refresh, every
+        aggregate is also refreshed each interval seconds for writes of
+        other processes and workers that died before their refresh.
+        An advisory lock keeps workers from refreshing the same
+        aggregate at once.
+    '''
+
+    def __init__(self,
+                 session_maker: Callable,
+                 aggregates: Iterable[Aggregate],
+                 delay: float,
+                 interval: float):
+        self.session_maker = session_maker
+        self.aggregates = list(aggregates)
+        self.delay = delay
+        self.interval = interval
+        self.dirty: set[str] = set()
+        self.wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def mark(self, events: list[WriteEvent]) -> None:
+        tables = {table for event in events for table in event.tables}
+        for aggregate in self.aggregates:
+            if aggregate.table in tables:
+                self.dirty.add(aggregate.name)
+        if self.dirty:
+            self.wakeup.set()
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def refresh(self, name: str) -> bool:
+        '''
+            Return False if another worker is refreshing the aggregate.
+        '''
+        aggregate = AGGREGATES[name]
+        start = time.perf_counter()
+        async with self.session_maker() as session, session.begin():
+            locked = await session.scalar(select(
+                func.pg_try_advisory_xact_lock(func.hashtext(name))))
+            if not locked:
+                return False
+            await session.execute(
+                text(FOLD.format(name=name, key=aggregate.key)))
+            counts = aggregate.counts
+            await session.execute(delete(counts).where(counts.c.count == 0))
+            stmt = pg_insert(AggregateRefresh).values(
+                name=name, refreshed_at=func.now())
+            await session.execute(stmt.on_conflict_do_update(
+                index_elements=['name'],
+                set_={'refreshed_at': stmt.excluded.refreshed_at}))
+        refreshes_total.inc(aggregate=name)
+        refresh_seconds_total.inc(time.perf_counter() - start,
+                                  aggregate=name)
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.interval)
+                await asyncio.sleep(self.delay)
+            except TimeoutError:
+                self.dirty.update(aggregate.name
+                                  for aggregate in self.aggregates)
+            self.wakeup.clear()
+            names, self.dirty = self.dirty, set()
+            for name in names:
+                try:
+                    if not await self.refresh(name):
+                        # Refresh in progress may predate our writes.
+                        self.dirty.add(name)
+                        self.wakeup.set()
+                except Exception as e:
+                    logger.exception('Aggregate {} refresh failed: {}',
+                                     name, e)
+
+
+aggregate_refresher = AggregateRefresher(
+    async_session_maker, AGGREGATES.values(),
+    delay=settings.AGGREGATES_REFRESH_DELAY,
+    interval=settings.AGGREGATES_REFRESH_INTERVAL)
+on_commit(aggregate_refresher.mark)
+
+
+async def read(session: Any, aggregate: Aggregate) -> tuple[Any, list[Any]]:
+    '''
+        Return refresh time and counts of the aggregate as of then.
+    '''
+    refreshed_at = await session.scalar(
+        select(AggregateRefresh.refreshed_at).where(
+            AggregateRefresh.name == aggregate.name))
+    rows = await session.execute(aggregate.select())
+    return refreshed_at, rows.mappings().all()
@@ -0,0 +1,209 @@
+import asyncio
+import itertools
+import json
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Callable, Sequence
+
+from config import settings
+from db import backend
+from db.db import async_session_maker
+from db.models.audit import AuditRecord
+from db.slow_queries import REDACTED
+from db.write_events import WriteEvent, in_transaction, on_commit
+from loguru import logger
+from metrics import metrics
+from pydantic_core import to_jsonable_python
+from sqlalchemy import insert, select, tuple_
+
+# Who is changing the data, set per request (see crud_router.audit).
+current_actor: ContextVar[str | None] = ContextVar('current_actor',
+                                                   default=None)
+
+COLUMNS = ('table_name', 'row_id', 'operation', 'diff', 'actor', 'time')
+
+audit_records_total = metrics.counter(
+    'audit_records_total', 'Audit records written.')
+audit_dropped_total = metrics.counter(
+    'audit_dropped_total', 'Audit records dropped, the buffer was full.')
+
+
+def redact(change: dict[str, Any]) -> dict[str, Any]:
+    return {name: REDACTED
+            if any(word in name.lower() for word in settings.AUDIT_REDACT)
+            else value
+            for name, value in change.items()}
+
+
+class AuditLog:
+    '''
+        History of rows changed through CRUDSA. durability:
+        buffered - records of committed transactions are kept in a
+            buffer of at most size records and written in batches of
+            batch_size by a background task (COPY on Postgres, multi-row
+            INSERT elsewhere), at least every interval seconds. Writes
+            do not wait for the audit; records still in the buffer are
+            lost if the process dies, records not fitting in the buffer
+            are dropped (audit_dropped_total).
+        transaction - records are inserted in the transaction of the
+            change itself: nothing is lost, every write pays for it.
+    '''
+
+    def __init__(self,
+                 session_maker: Callable,
+                 durability: str,
+                 size: int,
+                 batch_size: int,
+                 interval: float):
+        self.session_maker = session_maker
+        self.durability = durability
+        self.size = size
+        self.batch_size = batch_size
+        self.interval = interval
+        self.buffer: deque[tuple] = deque()
+        self.flushing = asyncio.Lock()
+        self.wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    @staticmethod
+    def records(events: Sequence[WriteEvent]) -> list[tuple]:
+        '''
+            Audit records of events, values of columns named like
+            AUDIT_REDACT are not kept.
+        '''
+        actor = current_actor.get()
+        now = datetime.now(timezone.utc)
+        records = []
+        for write_event in events:
+            changes = write_event.changes or [{}] * len(write_event.ids)
+            for id, change in zip(write_event.ids, changes):
+                records.append((write_event.tables[0], id,
+                                write_event.operation,
+                                to_jsonable_python(redact(change),
+                                                   fallback=str),
+                                actor, now))
+        return records
+
+    def capture(self, events: Sequence[WriteEvent]) -> None:
+        if self.durability != 'buffered':
+            return
+        for record in self.records(events):
+            if len(self.buffer) >= self.size:
+                audit_dropped_total.inc()
+                continue
+            self.buffer.append(record)
+        if len(self.buffer) >= self.batch_size:
+            self.wakeup.set()
+
+    def write_in_transaction(self, session, events: Sequence[WriteEvent]
+                             ) -> None:
+        if self.durability != 'transaction':
+            return
+        if records := self.records(events):
+            session.execute(insert(AuditRecord),
+                            [dict(zip(COLUMNS, record))
+                             for record in records])
+            audit_records_total.inc(len(records))
+
+    async def flush(self) -> int:
+        '''
+            Write the buffer out. A batch leaves the buffer once it is
+            committed: history() never misses it, a failed batch stays
+            at the buffer front.
+        '''
+        written = 0
+        async with self.flushing:
+            while self.buffer:
+                batch = list(itertools.islice(self.buffer, self.batch_size))
+                await self._write(batch)
+                for _ in batch:
+                    self.buffer.popleft()
+                written += len(batch)
+                audit_records_total.inc(len(batch))
+        return written
+
+    async def history(self,
+                      session: Any,
+                      table_name: str,
+                      row_id: int,
+                      before: tuple[datetime, int] | None = None,
+                      limit: int = settings.PAGE_LIMIT) -> list[dict]:
+        '''
+            Changes of the row, newest first. Keyset pages: before is
+            (time, id) of the last record of the previous page. The
+            first page starts with records still in the buffer (id None),
+            a batch committed during the call may show up twice.
+        '''
+        pending = [] if before else [
+            dict(zip(COLUMNS, record), id=None)
+            for record in reversed(self.buffer)
+            if record[0] == table_name and record[1] == row_id]
+        stmt = select(AuditRecord).where(
+            AuditRecord.table_name == table_name,
+            AuditRecord.row_id == row_id)
+        if before is not None:
+            stmt = stmt.where(tuple_(AuditRecord.time, AuditRecord.id)
+                              < tuple_(*before))
+        stmt = stmt.order_by(AuditRecord.time.desc(),
+                             AuditRecord.id.desc()).limit(limit)
+        async with session:
+            stored = [{'id': record.id,
+                       **{column: getattr(record, column)
+                          for column in COLUMNS}}
+                      for record in await session.scalars(stmt)]
+        return (pending + stored)[:limit]
+
+    def start(self) -> None:
+        if self.durability == 'buffered':
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.buffer:
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error('{} audit records lost: {}', len(self.buffer), e)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.interval)
+            except TimeoutError:
+                pass
+            self.wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning('Audit flush failed, {} records buffered: {}',
+                               len(self.buffer), e)
+                await asyncio.sleep(self.interval)
+
+    async def _write(self, batch: list[tuple]) -> None:
+        async with self.session_maker() as session, session.begin():
+            if backend.SQLITE:
+                await backend.acquire_writer(session)
+                await session.execute(insert(AuditRecord),
+                                      [dict(zip(COLUMNS, record))
+                                       for record in batch])
+                return
+            connection = await session.connection()
+            raw = await connection.get_raw_connection()
+            await raw.driver_connection.copy_records_to_table(
+                AuditRecord.tablename(), columns=COLUMNS,
+                records=[(*record[:3], json.dumps(record[3]), *record[4:])
+                         for record in batch])
+
+
+audit_log = AuditLog(session_maker=async_session_maker,
+                     durability=settings.AUDIT_DURABILITY,
+                     size=settings.AUDIT_BUFFER_SIZE,
+                     batch_size=settings.AUDIT_BATCH_SIZE,
+                     interval=settings.AUDIT_FLUSH_INTERVAL)
+if settings.AUDIT_ENABLED:
+    on_commit(audit_log.capture)
+    in_transaction(audit_log.write_in_transaction)
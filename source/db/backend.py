@@ -0,0 +1,139 @@
+import asyncio
+from typing import Any
+
+from config import settings
+from sqlalchemy import event, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.orm import Session
+
+# The backend is chosen per process by DB_BACKEND: postgresql (default)
+# or sqlite (aiosqlite, for local runs and small read-mostly nodes).
+SQLITE = settings.DB_BACKEND == 'sqlite'
+
+# SQLite has one writer at a time, see acquire_writer.
+_writer = asyncio.Lock()
+# Root transaction holding _writer.
+_holder: list[Any] = [None]
+# How often a queued writer checks for an abandoned lock, seconds.
+_ABANDONED_CHECK = 1.0
+
+
+def engine_options() -> dict[str, Any]:
+    if SQLITE:
+        return {}
+    return {'pool_size': settings.DB_POOL_SIZE,
+            'max_overflow': settings.DB_MAX_OVERFLOW,
+            'pool_timeout': settings.DB_POOL_TIMEOUT}
+
+
+def configure(engine: AsyncEngine) -> None:
+    if SQLITE:
+        event.listen(engine.sync_engine, 'connect', _sqlite_pragmas)
+        event.listen(engine.sync_engine, 'begin', _sqlite_begin)
+
+
+def _sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    # The driver's own transaction handling commits on RELEASE of a
+    # savepoint opened before any DML, transactions are begun
+    # explicitly instead (_sqlite_begin).
+    dbapi_connection.isolation_level = None
+    # WAL: readers do not block the writer and the other way round.
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute('PRAGMA foreign_keys=ON')
+    cursor.execute(f'PRAGMA busy_timeout={int(settings.DB_POOL_TIMEOUT * 1000)}')
+    cursor.close()
+
+
+def _sqlite_begin(connection) -> None:
+    connection.exec_driver_sql('BEGIN')
+
+
+async def acquire_writer(session: AsyncSession) -> None:
+    '''
+        SQLite only: queue the write transaction of session behind the
+        one in progress, writers of this process take turns in arrival
+        order instead of failing with "database is locked". The lock is
+        held until the transaction ends. No-op on Postgres.
+    '''
+    if not SQLITE:
+        return
+    sync_session = session.sync_session
+    transaction = sync_session.get_transaction() or sync_session.begin()
+    if _holder[0] is transaction:
+        return
+    _release_abandoned()
+    acquired = asyncio.ensure_future(_writer.acquire())
+    try:
+        while not (await asyncio.wait({acquired},
+                                      timeout=_ABANDONED_CHECK))[0]:
+            _release_abandoned()
+    except BaseException:
+        acquired.cancel()
+        if acquired.done() and not acquired.cancelled():
+            _writer.release()
+        raise
+    _holder[0] = transaction
+
+
+def _release(transaction) -> None:
+    if _holder[0] is transaction:
+        _holder[0] = None
+        _writer.release()
+
+
+def _release_abandoned() -> None:
+    # A transaction cancelled while it closes (its task cancelled during
+    # the rollback or connection return) never reaches
+    # after_transaction_end: its session has moved on without it.
+    if (holder := _holder[0]) is not None and (
+            holder.session.get_transaction() is not holder):
+        _release(holder)
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def _release_writer(session, transaction) -> None:
+    if transaction.parent is None:
+        _release(transaction)
+
+
+def insert(model: Any) -> Any:
+    '''
+        INSERT with on_conflict_do_update/nothing of the backend.
+    '''
+    return (sqlite if SQLITE else postgresql).insert(model)
+
+
+def date_trunc(bucket: str, column: Any) -> Any:
+    if not SQLITE:
+        return func.date_trunc(bucket, column)
+    match bucket:
+        case 'day':
+            return func.strftime('%Y-%m-%d 00:00:00', column)
+        case 'week':
+            # Weeks start on Monday as in Postgres.
+            return func.strftime('%Y-%m-%d 00:00:00', column,
+                                 'weekday 0', '-6 days')
+        case 'month':
+            return func.strftime('%Y-%m-01 00:00:00', column)
+    raise ValueError(f'Unsupported bucket {bucket} on SQLite')
+
+
+async def create_schema(engine: AsyncEngine) -> None:
+    '''
+        SQLite has no migrations: tables are created from the models.
+        Postgres-only objects (aggregate tables and triggers) are not.
+    '''
+    import db.models.aggregates  # noqa: F401
+    import db.models.audit  # noqa: F401
+    import db.models.cartridges  # noqa: F401
+    import db.models.devices  # noqa: F401
+    import db.models.idempotency  # noqa: F401
+    import db.models.jobs  # noqa: F401
+    import db.models.vendors  # noqa: F401
+    from db.models.base import Base
+
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
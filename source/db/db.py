@@ -1,36 +1,48 @@
-import logging
+import os
 from typing import AsyncGenerator
 
 from config import settings
-from loguru import logger
-from sqlalchemy import Column, String, create_engine
+from db.backend import SQLITE, configure, engine_options
+from db.notifications import publish  # registers NOTIFY of write events
+from db.slow_queries import SlowQueryRecorder
+from sqlalchemy import Column, String, create_engine, event
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import Session
 
 
-class InterceptHandler(logging.Handler):
-    def emit(self, record):
-        # Get corresponding Loguru level if it exists
-        try:
-            level = logger.level(record.levelname).name
-        except ValueError:
-            level = record.levelno
+engine = create_async_engine(settings.DB_URL,
+                             echo=settings.DB_ECHO,
+                             **engine_options())
+configure(engine)
+
+
+def _reset_pool_after_fork() -> None:
+    # Connections inherited from the parent process must not be used
+    # or closed by the child, the child opens its own.
+    engine.sync_engine.dispose(close=False)
 
-        # Find caller from where originated the logged message
-        frame, depth = logging.currentframe(), 2
-        while frame.f_code.co_filename == logging.__file__:
-            frame = frame.f_back
-            depth += 1
 
-        logger.opt(depth=depth, exception=record.exc_info).log(
-            level, record.getMessage()
-        )
+os.register_at_fork(after_in_child=_reset_pool_after_fork)
 
+slow_query_recorder = SlowQueryRecorder(settings.SLOW_QUERY_THRESHOLD,
+                                        settings.SLOW_QUERY_KEEP,
+                                        settings.SLOW_QUERY_REDACT,
+                                        explain=(settings.SLOW_QUERY_EXPLAIN
+                                                 and not SQLITE))
+if settings.SLOW_QUERY_ENABLED:
+    slow_query_recorder.attach(engine)
 
-engine = create_async_engine(settings.DB_URL, echo=True)
 
-logging.basicConfig(handlers=[InterceptHandler()], level=0)
-logging.getLogger("db.engine").setLevel(logging.DEBUG)
+@event.listens_for(Session, 'after_begin')
+def _set_statement_timeout(session, transaction, connection) -> None:
+    # Deadline of the request, see crud_router.deadline.
+    # SQLite has no statement timeout, the deadline still cancels.
+    if connection.dialect.name != 'postgresql':
+        return
+    if timeout := session.info.get('statement_timeout'):
+        connection.exec_driver_sql(
+            f'SET LOCAL statement_timeout = {int(timeout)}')
 
 
 async_session_maker = async_sessionmaker(
@@ -40,12 +52,9 @@ async_session_maker = async_sessionmaker(
 async def get_async_session() -> AsyncSession:
     async with async_session_maker() as session:
         try:
-            logger.debug('Try yield session')
             return session
         except:
-            logger.debug('Session rollback')
             await session.rollback()
             raise
         finally:
-            logger.debug('Session close')
             await session.close()
@@ -0,0 +1,101 @@
+import json
+from types import NoneType, UnionType
+from typing import Any, Union, get_args, get_origin
+
+from pydantic import BaseModel
+from sqlalchemy import (
+    JSON,
+    ColumnElement,
+    Text,
+    and_,
+    cast,
+    func,
+    inspect,
+    literal,
+    null,
+    select,
+)
+from sqlalchemy.dialects.postgresql import JSONB, aggregate_order_by
+from sqlalchemy.orm import aliased
+
+# json_build_object takes at most 100 arguments.
+MAX_PAIRS = 50
+
+
+def json_object(model: Any, schema: type[BaseModel]) -> ColumnElement:
+    '''
+        json_build_object(...) of model rendering the fields of schema.
+        Plain fields are model columns, nested schemas are relationships:
+        to-many are json_agg subqueries ordered by primary key, to-one
+        are scalar subqueries. Fields missing on the model render their
+        default.
+    '''
+    mapper = inspect(model).mapper
+    pairs: list[Any] = []
+    for name, field in schema.model_fields.items():
+        if name in mapper.relationships:
+            value = _related(model, mapper.relationships[name],
+                             nested_schema(field.annotation))
+        elif name in mapper.column_attrs:
+            value = getattr(model, name)
+        elif not field.is_required():
+            value = null() if field.default is None else cast(
+                literal(json.dumps(field.default)), JSON)
+        else:
+            raise ValueError(
+                f'{schema.__name__}.{name} is not a field of {model}')
+        pairs.append((name, value))
+    objects = [func.json_build_object(*(item for name, value in chunk
+                                        for item in (literal(name), value)))
+               for chunk in _chunks(pairs, MAX_PAIRS)]
+    merged = objects[0]
+    for obj in objects[1:]:
+        # Key order of jsonb differs from the schema, only wide schemas.
+        merged = cast(merged, JSONB).op('||')(cast(obj, JSONB))
+    return merged
+
+
+def json_rows(model: Any, schema: type[BaseModel], **filters: Any) -> Any:
+    '''
+        Select one json text per model row, ordered by primary key.
+        Text, not json: rows are passed to the client undecoded.
+    '''
+    pk = getattr(model, model.get_pks()[0])
+    return select(cast(json_object(model, schema), Text)
+                  ).filter_by(**filters).order_by(pk)
+
+
+def _related(model: Any, relationship: Any,
+             schema: type[BaseModel]) -> ColumnElement:
+    parent = inspect(model).mapper
+    related = relationship.mapper
+    # Aliased: the same table may appear on several levels of the tree.
+    target = aliased(related.class_)
+    condition = and_(*(
+        getattr(model, parent.get_property_by_column(local).key)
+        == getattr(target, related.get_property_by_column(remote).key)
+        for local, remote in relationship.local_remote_pairs))
+    obj = json_object(target, schema)
+    if relationship.uselist:
+        pk = getattr(target, related.class_.get_pks()[0])
+        subquery = select(func.coalesce(
+            func.json_agg(aggregate_order_by(obj, pk)),
+            cast(literal('[]'), JSON)))
+    else:
+        subquery = select(obj)
+    return subquery.where(condition).correlate(model).scalar_subquery()
+
+
+def nested_schema(annotation: Any) -> type[BaseModel]:
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return annotation
+    if get_origin(annotation) in (list, Union, UnionType):
+        for arg in get_args(annotation):
+            if arg is not NoneType:
+                return nested_schema(arg)
+    raise ValueError(f'{annotation} is not a schema or list of schemas')
+
+
+def _chunks(items: list[Any], size: int) -> list[list[Any]]:
+    return [items[start:start + size]
+            for start in range(0, len(items), size)] or [[]]
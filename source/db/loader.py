@@ -0,0 +1,64 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class BatchLoader:
+    '''
+        DataLoader-style batching: ids requested with load() during one
+        event-loop tick are resolved with a single load_many(ids) call.
+        Results are cached for the loader lifetime (one request),
+        failed loads are not cached, a cancelled load cancels its
+        futures.
+        load_many returns mapping id -> item, missing ids resolve to None.
+    '''
+
+    def __init__(self,
+                 load_many: Callable[[list[Hashable]],
+                                     Awaitable[dict[Hashable, Any]]]):
+        self.load_many = load_many
+        self.cache: dict[Hashable, asyncio.Future] = {}
+        self.pending: list[Hashable] = []
+        # Running load_many calls, the loop keeps weak references only.
+        self.tasks: set[asyncio.Task] = set()
+
+    def load(self, id: Hashable) -> asyncio.Future:
+        if (future := self.cache.get(id)) is not None:
+            return future
+        loop = asyncio.get_running_loop()
+        future = self.cache[id] = loop.create_future()
+        self.pending.append(id)
+        if len(self.pending) == 1:
+            loop.call_soon(self._dispatch)
+        return future
+
+    def clear(self) -> None:
+        self.cache.clear()
+
+    def _dispatch(self) -> None:
+        ids, self.pending = self.pending, []
+        task = asyncio.ensure_future(
+            self._resolve(ids, [self.cache[id] for id in ids]))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _resolve(self,
+                       ids: list[Hashable],
+                       futures: list[asyncio.Future]) -> None:
+        try:
+            items = await self.load_many(ids)
+        except BaseException as e:
+            for id, future in zip(ids, futures):
+                if self.cache.get(id) is future:
+                    del self.cache[id]
+                if future.done():
+                    continue
+                if isinstance(e, asyncio.CancelledError):
+                    future.cancel()
+                else:
+                    future.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
+            return
+        for id, future in zip(ids, futures):
+            if not future.done():
+                future.set_result(items.get(id))
@@ -0,0 +1,15 @@
+import datetime
+
+from db.models.base import BaseCommonWithoutID
+from sqlalchemy import DateTime
+from sqlalchemy.orm import Mapped, mapped_column
+
+
+class AggregateRefresh(BaseCommonWithoutID):
+    '''
+        Time of the last refresh of every aggregate, its counts are as
+        of then (see db.aggregates).
+    '''
+    name: Mapped[str] = mapped_column(primary_key=True)
+    refreshed_at: Mapped[datetime.datetime] = mapped_column(
+        DateTime(timezone=True))
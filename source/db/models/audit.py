@@ -0,0 +1,24 @@
+import datetime
+from typing import Any
+
+from db.models.base import JSONB_OR_JSON, BaseCommon
+from sqlalchemy import DateTime, Index
+from sqlalchemy.orm import Mapped, mapped_column
+
+
+class AuditRecord(BaseCommon):
+    '''
+        One change of one row (see db.audit): diff holds the written
+        values (empty for deletes), actor the user of the request.
+    '''
+    table_name: Mapped[str]
+    row_id: Mapped[int]
+    operation: Mapped[str]
+    diff: Mapped[dict[str, Any]] = mapped_column(JSONB_OR_JSON, default=dict)
+    actor: Mapped[str | None]
+    time: Mapped[datetime.datetime] = mapped_column(DateTime(timezone=True))
+
+
+# History of a row, newest first (see db.audit.AuditLog.history).
+Index('ix_audit_record_table_name_row_id_time', AuditRecord.table_name,
+      AuditRecord.row_id, AuditRecord.time)
@@ -2,7 +2,8 @@ from datetime import datetime
 from typing import Annotated, Any
 
 from db.models.utils import split_and_concatenate
-from sqlalchemy import func, inspect
+from sqlalchemy import JSON, func, inspect
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import DeclarativeBase, Mapped, declared_attr, mapped_column
 
 
@@ -83,6 +84,9 @@ class BaseCommonWithoutID(Base, TableNameMixin):
     __abstract__ = True
 
 
+# JSONB on Postgres, JSON elsewhere (see db.backend).
+JSONB_OR_JSON = JSON().with_variant(JSONB, 'postgresql')
+
 created_at = Annotated[
     datetime,
     mapped_column(nullable=False, server_default=func.now())
@@ -24,7 +24,7 @@ class Model(BaseCommon):
     alternatives: Mapped[Self | None] = relationship(
         'Model', remote_side=original_id)
     cartridges: Mapped[list['Cartridge']] = relationship(
-        back_populates='model')
+        back_populates='model', lazy='raise')
 
 
 class Cartridge(Device, PolymorphicMixin):
@@ -0,0 +1,22 @@
+import datetime
+
+from db.models.base import BaseCommonWithoutID
+from sqlalchemy import DateTime, LargeBinary
+from sqlalchemy.orm import Mapped, mapped_column
+
+
+class IdempotencyKey(BaseCommonWithoutID):
+    '''
+        First response to a request carrying an Idempotency-Key (see
+        crud_router.idempotency). status is None while the request is
+        in flight, body is zlib-compressed json. key is prefixed with a
+        digest of the principal, fingerprint is a digest of principal,
+        method, path and body: a key is reusable only for the same
+        request. Rows are claimable again once expires passes.
+    '''
+    key: Mapped[str] = mapped_column(primary_key=True)
+    fingerprint: Mapped[bytes] = mapped_column(LargeBinary)
+    status: Mapped[int | None]
+    body: Mapped[bytes | None] = mapped_column(LargeBinary)
+    expires: Mapped[datetime.datetime] = mapped_column(
+        DateTime(timezone=True), index=True)
@@ -0,0 +1,43 @@
+import datetime
+from enum import Enum
+from typing import Any
+
+from db.models.base import JSONB_OR_JSON, BaseCommon, created_at, updated_at
+from sqlalchemy import DateTime
+from sqlalchemy.orm import Mapped, mapped_column
+
+
+class JobKind(str, Enum):
+    create = 'create'
+    upsert = 'upsert'
+    delete = 'delete'
+    import_ = 'import'
+
+
+class JobStatus(str, Enum):
+    pending = 'pending'
+    running = 'running'
+    done = 'done'
+    failed = 'failed'
+
+
+class Job(BaseCommon):
+    '''
+        A running job belongs to the worker that claimed it until lease,
+        every checkpoint extends it. Jobs whose lease passed (the worker
+        died) are claimed again, see jobs.executor.
+    '''
+    kind: Mapped[str]
+    target: Mapped[str]
+    status: Mapped[str] = mapped_column(
+        default=JobStatus.pending.value, index=True)
+    options: Mapped[dict[str, Any]] = mapped_column(JSONB_OR_JSON, default=dict)
+    payload: Mapped[list[Any]] = mapped_column(JSONB_OR_JSON)
+    total: Mapped[int]
+    processed: Mapped[int] = mapped_column(default=0)
+    result: Mapped[dict[str, Any]] = mapped_column(JSONB_OR_JSON, default=dict)
+    error: Mapped[str | None]
+    lease: Mapped[datetime.datetime | None] = mapped_column(
+        DateTime(timezone=True))
+    created: Mapped[created_at]
+    updated: Mapped[updated_at]
@@ -0,0 +1,10 @@
+from db.models.base import Base
+from fastapi_users_db_sqlalchemy import SQLAlchemyBaseUserTable
+from sqlalchemy.orm import Mapped, mapped_column
+
+
+class User(SQLAlchemyBaseUserTable[int], Base):
+    '''
+        fastapi-users user, table 'user' (see auth.user_cache.USERS_TABLE).
+    '''
+    id: Mapped[int] = mapped_column(primary_key=True)
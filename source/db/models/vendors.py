@@ -11,7 +11,10 @@ if TYPE_CHECKING:
 class Vendor(BaseCommon):
 
     name: Mapped[str] = mapped_column(unique=True, index=True)
+    # Collections are unbounded: never loaded implicitly, see
+    # CRUDSA.get_related_page and get_all_with_related.
     devices: Mapped[list['Device']] = relationship(
-        back_populates='vendor', lazy='selectin')
+        back_populates='vendor', lazy='raise')
     cartridge_models: Mapped[list['Model']
-                             ] = relationship(back_populates="vendor")
+                             ] = relationship(back_populates="vendor",
+                                              lazy='raise')
@@ -0,0 +1,155 @@
+import asyncio
+import json
+import os
+import socket
+from typing import Any, Callable
+
+import asyncpg
+from config import settings
+from db.write_events import WriteEvent, in_transaction
+from loguru import logger
+from metrics import metrics
+from sqlalchemy import func, select
+
+notifications_total = metrics.counter(
+    'change_notifications_total', 'Change notifications received.')
+listener_reconnects_total = metrics.counter(
+    'change_listener_reconnects_total', 'LISTEN connection re-establishments.')
+
+# NOTIFY payload has to be shorter than 8000 bytes, bigger id lists are
+# sent as "whole table changed".
+MAX_PAYLOAD = 7900
+
+
+def origin() -> str:
+    # Evaluated on every call, workers are forked after import.
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def dsn() -> str:
+    return settings.DB_URL.replace('postgresql+asyncpg://', 'postgresql://')
+
+
+def encode(write_event: WriteEvent) -> str:
+    message = {'origin': origin(), 'tables': write_event.tables,
+               'operation': write_event.operation, 'ids': write_event.ids}
+    payload = json.dumps(message, default=str)
+    if len(payload.encode()) > MAX_PAYLOAD:
+        payload = json.dumps({**message, 'ids': None}, default=str)
+    return payload
+
+
+def decode(payload: str) -> tuple[str, WriteEvent]:
+    message = json.loads(payload)
+    return message['origin'], WriteEvent(
+        tables=tuple(message['tables']), operation=message['operation'],
+        ids=tuple(message['ids'] or ()))
+
+
+@in_transaction
+def publish(session, events: list[WriteEvent]) -> None:
+    '''
+        NOTIFY is transactional: listeners get the events only if the
+        transaction commits, together with its data.
+    '''
+    if not settings.NOTIFY_ENABLED:
+        return
+    if session.get_bind().dialect.name != 'postgresql':
+        return
+    for write_event in events:
+        session.execute(select(func.pg_notify(settings.NOTIFY_CHANNEL,
+                                              encode(write_event))))
+
+
+class ChangeListener:
+    '''
+        One dedicated LISTEN connection per worker. Events published by
+        other workers and nodes are passed to subscribers, events of
+        this worker were already handled by its commit hooks.
+        After a lost connection notifications may have been missed,
+        reset subscribers are called once it is re-established.
+    '''
+
+    def __init__(self,
+                 channel: str,
+                 reconnect_delay: float,
+                 healthcheck_interval: float):
+        self.channel = channel
+        self.reconnect_delay = reconnect_delay
+        self.healthcheck_interval = healthcheck_interval
+        self.subscribers: list[Callable[[WriteEvent], Any]] = []
+        self.reset_subscribers: list[Callable[[], Any]] = []
+        self.connection: asyncpg.Connection | None = None
+        self._task: asyncio.Task | None = None
+
+    def subscribe(self, callback: Callable[[WriteEvent], Any]) -> None:
+        self.subscribers.append(callback)
+
+    def on_reset(self, callback: Callable[[], Any]) -> None:
+        self.reset_subscribers.append(callback)
+
+    async def notify(self, write_event: WriteEvent) -> bool:
+        '''
+            NOTIFY a change made outside CRUDSA transactions over the
+            LISTEN connection. False if it is down (or not started).
+        '''
+        if self.connection is None:
+            return False
+        await self.connection.execute('SELECT pg_notify($1, $2)',
+                                      self.channel, encode(write_event))
+        return True
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        connected_before = False
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(dsn())
+                await connection.add_listener(self.channel, self._notify)
+                self.connection = connection
+                if connected_before:
+                    listener_reconnects_total.inc()
+                    self._reset()
+                connected_before = True
+                # A dead peer is not always noticed by an idle socket.
+                while True:
+                    await asyncio.sleep(self.healthcheck_interval)
+                    await connection.fetchval('SELECT 1')
+            except Exception as e:
+                logger.warning('Change listener connection failed: {}', e)
+            finally:
+                self.connection = None
+                if connection is not None:
+                    connection.terminate()
+            await asyncio.sleep(self.reconnect_delay)
+
+    def _notify(self, connection, pid, channel, payload: str) -> None:
+        try:
+            sender, write_event = decode(payload)
+        except (ValueError, KeyError) as e:
+            logger.warning('Malformed change notification {}: {}', payload, e)
+            return
+        if sender == origin():
+            return
+        notifications_total.inc(operation=write_event.operation)
+        for callback in self.subscribers:
+            callback(write_event)
+
+    def _reset(self) -> None:
+        for callback in self.reset_subscribers:
+            callback()
+
+
+change_listener = ChangeListener(
+    channel=settings.NOTIFY_CHANNEL,
+    reconnect_delay=settings.NOTIFY_RECONNECT,
+    healthcheck_interval=settings.NOTIFY_HEALTHCHECK)
@@ -0,0 +1,58 @@
+import asyncio
+import random
+from functools import wraps
+from typing import Any, Callable
+
+from config import settings
+from exceptions.sa_handler_manager import error_code
+from loguru import logger
+from metrics import metrics
+from psycopg2 import errorcodes
+from sqlalchemy.exc import DBAPIError
+
+RETRYABLE_PGCODES = {
+    errorcodes.SERIALIZATION_FAILURE,
+    errorcodes.DEADLOCK_DETECTED,
+}
+
+retries_total = metrics.counter(
+    'crud_write_retries_total',
+    'Write transactions retried after serialization failure or deadlock.')
+
+
+def is_retryable(error: BaseException) -> bool:
+    return error_code(error) in RETRYABLE_PGCODES
+
+
+def backoff(attempt: int) -> float:
+    '''
+        Full jitter: random delay up to base * 2 ** attempt, capped.
+    '''
+    return random.uniform(0, min(settings.RETRY_BACKOFF_CAP,
+                                 settings.RETRY_BACKOFF_BASE * 2 ** attempt))
+
+
+def retryable(method: Callable) -> Callable:
+    '''
+        Retry the decorated coroutine on 40001/40P01 with jittered backoff,
+        at most RETRY_ATTEMPTS times in total.
+        The decorated coroutine must be a whole unit of work: it begins and
+        commits (or rolls back) its own transaction, so a failed attempt
+        leaves nothing behind and the retry cannot apply changes twice.
+    '''
+    @wraps(method)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        for attempt in range(settings.RETRY_ATTEMPTS):
+            try:
+                return await method(*args, **kwargs)
+            except DBAPIError as e:
+                if (not is_retryable(e)
+                        or attempt + 1 >= settings.RETRY_ATTEMPTS):
+                    raise
+                retries_total.inc(method=method.__qualname__,
+                                  pgcode=error_code(e))
+                delay = backoff(attempt)
+                logger.info('Retry {} in {:.3f}s after {}',
+                            method.__qualname__, delay, error_code(e))
+                await asyncio.sleep(delay)
+    return wrapper
@@ -1,12 +1,45 @@
+import asyncio
 from dataclasses import dataclass
-from typing import Any, Sequence, Type
+from functools import partial
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Hashable,
+    Sequence,
+    Type,
+)
 
+from db import backend
+from db.backend import acquire_writer
+from db.json_select import json_rows
+from db.loader import BatchLoader
 from db.models.base import BaseCommon
-from exceptions.sa_handler_manager import ErrorHandler
+from db.retry import retryable
+from db.singleflight import single_flight
+from db.slow_queries import traced
+from db.write_events import WRITE_EVENTS, WriteEvent, model_tables, record
+from exceptions.sa_handler_manager import ErrorHandler, ItemNotFound
 from loguru import logger
-from sqlalchemy import delete, insert, select, text, update
+from pydantic import BaseModel
+from sqlalchemy import (
+    Integer,
+    Result,
+    Select,
+    any_,
+    bindparam,
+    delete,
+    func,
+    insert,
+    inspect,
+    select,
+    text,
+    update,
+)
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import load_only, raiseload
+from sqlalchemy.orm import aliased, load_only, raiseload, selectinload
 
 MODEL_TYPE = Type[BaseCommon]
 
@@ -20,14 +53,34 @@ class CRUDSA:
         get_all: Retrieves all records from the database model.
         get_all_with_related: Retrieves all records from the database model, including related records.
         get_by_id: Retrieves a record from the database model by its ID.
+        get_many: Retrieves records by IDs, lookups issued in the same
+        event-loop tick are batched into one query (see loader).
         get_with_filters: Retrieves records from the database model based on filter criteria.
+        count_by_bucket: Counts records per time bucket of a column.
+        get_related_page: Keyset-paginated page of a to-many relation
+        of a record (collections lists them).
         create: Creates a new record in the database model.
         create_batch: Creates multiple new records in the database model.
         update: Updates an existing record in the database model.
         delete: Deletes a record from the database model.
         delete_batch: Deletes multiple records from the database model.
+        insert_many, upsert_many, update_many, delete_many: Bulk
+        statements executed in the caller's transaction, nothing is
+        committed.
         check_exist_by_id: Checks if a record exists in the database model by 
         its ID.
+        Write transactions are retried on serialization failures and
+        deadlocks (see retryable).
+        Concurrent identical reads share one query (see SingleFlight),
+        every committed write resets in-flight reads.
+        Writes are recorded as WriteEvents, hooks get them once the
+        transaction is committed (see write_events).
+        On SQLite write transactions take turns (see backend); stream_json
+        and copy_to are Postgres only.
+        stream_all: Yields records in chunks from a server-side cursor.
+        stream_json: Streams a json array of nested documents assembled
+        by the database.
+        copy_to: Streams records with COPY ... TO STDOUT into a callback.
         _get_select_options: Helper method to generate select options for 
         database queries.
         get_model: Returns the database model associated with the CRUD 
@@ -47,49 +100,156 @@ class CRUDSA:
         raiseload: list[Any]
         load_only: Any
 
+    @traced
     async def get_all(self,
                       session: AsyncSession,
                       include: list[Any] = [],
-                      exclude: list[Any] = []) -> Sequence[Any]:
+                      exclude: list[Any] = [],
+                      ranges: dict[str, tuple[Any, Any]] = {}
+                      ) -> Sequence[Any]:
         options = self._get_select_options(include, exclude)
         stmt = select(self.model
-                      ).options(*options.raiseload, options.load_only)
-        async with session as session:
-            with ErrorHandler() as error_handler:
-                raw = await session.scalars(stmt)
-                result = raw.unique().all()
-        return result
+                      ).options(*options.raiseload, options.load_only
+                                ).where(*self._range_clauses(ranges))
+        return await self._read(stmt, session, self._fetch_all,
+                                include, exclude)
+
+    @traced
+    async def count_by_bucket(self,
+                              field: str,
+                              bucket: str,
+                              session: AsyncSession,
+                              start: Any = None,
+                              end: Any = None) -> Sequence[Any]:
+        '''
+            Row counts per date_trunc(bucket, field) within [start, end),
+            bucket: day, week, month...
+        '''
+        column = getattr(self.model, field)
+        bucket_column = backend.date_trunc(bucket, column).label('bucket')
+        stmt = select(bucket_column, func.count().label('count')
+                      ).where(*self._range_clauses({field: (start, end)})
+                              ).group_by(bucket_column).order_by(bucket_column)
+        return await self._read(stmt, session,
+                                lambda result: result.mappings().all())
 
+    @traced
     async def get_all_with_related(self,
                                    session: AsyncSession,
                                    include: list[Any] = [],
                                    exclude: list[Any] = []) -> Sequence[Any]:
+        '''
+            Items with the relationships named in include, collections are
+            unbounded: none is loaded unless asked for.
+        '''
         options = self._get_select_options(include, exclude)
+        # Relationships are lazy='raise', included ones are loaded here.
+        names = [relation for relation in self.model.get_relationships()
+                 if relation in include and relation not in exclude]
+        relations = [selectinload(getattr(self.model, relation))
+                     for relation in names]
+        mappers = inspect(self.model).relationships
+        tables = [table for relation in names
+                  for table in model_tables(mappers[relation].mapper.class_)]
 
         stmt = select(self.model
                       ).order_by(
-            getattr(self.model, self.model.get_pks()[0])).options(*options.raiseload, options.load_only)
-        async with session as session:
-            with ErrorHandler() as error_handler:
-                raw = await session.scalars(stmt)
-                result = raw.unique().all()
-        return result
+            getattr(self.model, self.model.get_pks()[0])).options(*options.raiseload, options.load_only, *relations)
+        return await self._read(stmt, session, self._fetch_all,
+                                include, exclude, tables=tables)
 
+    @traced
     async def get_by_id(self,
                         id: int,
                         session: AsyncSession,
                         include: list[Any] = [],
                         exclude: list[Any] = []) -> Any:
-        options = self._get_select_options(include, exclude)
-        stmt = select(self.model
-                      ).options(*options.raiseload, options.load_only
-                                ).filter_by(id=id)
-        async with session as session:
-            with ErrorHandler() as error_handler:
-                result = await session.execute(stmt)
-                item = result.unique().one()[0]
+        item = await self.loader(session, include, exclude).load(id)
+        if item is None:
+            raise ItemNotFound
         return item
 
+    @traced
+    async def get_many(self,
+                       ids: list[int],
+                       session: AsyncSession,
+                       include: list[Any] = [],
+                       exclude: list[Any] = []) -> list[Any]:
+        '''
+            Return found records in ids order, missing ids are skipped.
+        '''
+        loader = self.loader(session, include, exclude)
+        items = await asyncio.gather(*[loader.load(id) for id in ids])
+        return [item for item in items if item is not None]
+
+    def loader(self,
+               session: AsyncSession,
+               include: list[Any] = [],
+               exclude: list[Any] = []) -> BatchLoader:
+        '''
+            Per-session (i.e. per-request) batch loader for the projection,
+            by-id lookups issued in one tick become one
+            WHERE id = ANY(:ids) query.
+        '''
+        key = ('loader', self.model.tablename(), tuple(include), tuple(exclude))
+        if (loader := session.info.get(key)) is None:
+            loader = session.info[key] = BatchLoader(
+                partial(self._load_by_ids, session, include, exclude))
+        return loader
+
+    @traced
+    async def warmup(self,
+                     session: AsyncSession,
+                     include: list[Any] = [],
+                     exclude: list[Any] = []) -> None:
+        '''
+            Execute by-id statement for the projection with no ids. It
+            populates compiled statement cache and prepared statement of
+            the session connection without reading rows.
+            Not coalesced, every connection has to prepare its own.
+        '''
+        await session.execute(self._by_ids_stmt([], include, exclude))
+
+    def collections(self) -> dict[str, MODEL_TYPE]:
+        '''
+            To-many relationships of the model: name -> related model.
+        '''
+        relationships = inspect(self.model).relationships
+        return {name: relationships[name].mapper.class_
+                for name in self.model.get_relationships()
+                if relationships[name].uselist}
+
+    @traced
+    async def get_related_page(self,
+                               item_id: int,
+                               relation: str,
+                               session: AsyncSession,
+                               after: int | None = None,
+                               limit: int = 100,
+                               **filters) -> Sequence[Any]:
+        '''
+            Page of relation items of item_id ordered by primary key,
+            keyset pagination: after is the last key of the previous
+            page. Relations of the items are not loaded.
+        '''
+        parent = aliased(self.model)
+        related = self.collections()[relation]
+        pk = getattr(related, related.get_pks()[0])
+        stmt = select(related).join_from(
+            parent, related, getattr(parent, relation)
+        ).where(parent.id == item_id).options(raiseload('*')
+                                              ).filter_by(**filters)
+        if after is not None:
+            stmt = stmt.where(pk > after)
+        stmt = stmt.order_by(pk).limit(limit)
+        items = await self._read(stmt, session, self._fetch_all,
+                                 tables=model_tables(related))
+        if not items:
+            with ErrorHandler():
+                await self.check_exist_by_id(item_id, session)
+        return items
+
+    @traced
     async def get_with_filters(self,
                                session: AsyncSession,
                                include: list[Any] = [],
@@ -100,23 +260,26 @@ class CRUDSA:
         stmt = select(self.model
                       ).options(*options.raiseload, options.load_only
                                 ).filter_by(**filters)
-        async with session:
-            with ErrorHandler() as error_handler:
-                result = await session.execute(stmt)
-                item = result.one()[0]
-        return item
+        return await self._read(stmt, session, self._fetch_one,
+                                include, exclude)
 
+    @retryable
+    @traced
     async def create(self,
                      data: dict,
                      session: AsyncSession) -> Any:
         stmt = insert(self.model).returning(self.model)
         async with session:
             with ErrorHandler():
+                await acquire_writer(session)
                 result = await session.scalar(stmt, [data])
+                self._written(session, 'create', [result.id], [data])
                 await session.commit()
-        logger.debug(f"SA crud create statement: {stmt}, data: {data}")
+        logger.opt(lazy=True).debug("SA crud create statement: {}, data: {}",
+                                    lambda: stmt, lambda: data)
         return result
 
+    @traced
     async def create_batch(self,
                            data: list[dict],
                            session: AsyncSession) -> Any:
@@ -130,6 +293,8 @@ class CRUDSA:
                 result_batch.append(result)
         return result_batch
 
+    @retryable
+    @traced
     async def update(self, id: int,
                      data: dict,
                      session: AsyncSession,
@@ -140,10 +305,14 @@ class CRUDSA:
             values(data).\
             returning(self.model.id)
         async with session:
+            await acquire_writer(session)
             item_id = await session.scalar(stmt)
+            self._written(session, 'update', [item_id], [data])
             await session.commit()
         return item_id
 
+    @retryable
+    @traced
     async def delete(self, item_id: int, session: AsyncSession) -> int | None:
         stmt = delete(self.model).\
             where(self.model.id == item_id).\
@@ -151,18 +320,95 @@ class CRUDSA:
         with ErrorHandler():
             await self.check_exist_by_id(item_id, session)
         async with session:
+            await acquire_writer(session)
             result = await session.scalar(stmt)
+            self._written(session, 'delete', [result])
             await session.commit()
         return result
 
+    @retryable
+    @traced
     async def delete_batch(self, ids: list[int],
                            session: AsyncSession) -> None:
         stmt = delete(self.model).\
             where(self.model.id.in_(ids))
         async with session:
+            await acquire_writer(session)
             await session.scalar(stmt)
+            self._written(session, 'delete', ids)
             await session.commit()
 
+    @traced
+    async def insert_many(self,
+                          data: list[dict],
+                          session: AsyncSession) -> list[int]:
+        # Ids in data order, callers match them to the input rows.
+        stmt = insert(self.model).returning(self.model.id,
+                                            sort_by_parameter_order=True)
+        await acquire_writer(session)
+        ids = list(await session.scalars(stmt, data))
+        self._written(session, 'create', ids, data)
+        return ids
+
+    @traced
+    async def upsert_many(self,
+                          data: list[dict],
+                          session: AsyncSession,
+                          index_elements: list[str] | None = None
+                          ) -> list[int]:
+        '''
+            Insert rows, rows conflicting on index_elements (primary key
+            by default) are updated with the given values.
+        '''
+        index_elements = index_elements or self.model.get_pks()
+        stmt = backend.insert(self.model)
+        columns = {key for item in data for key in item
+                   if key not in index_elements}
+        stmt = stmt.on_conflict_do_update(
+            index_elements=index_elements,
+            set_={column: stmt.excluded[column] for column in columns}
+        ).returning(self.model.id, sort_by_parameter_order=True)
+        await acquire_writer(session)
+        ids = list(await session.scalars(stmt, data))
+        self._written(session, 'upsert', ids, data)
+        return ids
+
+    @traced
+    async def update_many(self,
+                          data: list[dict],
+                          session: AsyncSession) -> list[int]:
+        '''
+            Update rows by id (every item carries its id), ids of
+            missing rows are not returned.
+        '''
+        ids, changes = [], []
+        await acquire_writer(session)
+        for item in data:
+            values = {key: value for key, value in item.items()
+                      if key != 'id'}
+            stmt = update(self.model).\
+                where(self.model.id == item['id']).\
+                values(values).\
+                returning(self.model.id)
+            if (item_id := await session.scalar(stmt)) is not None:
+                ids.append(item_id)
+                changes.append(values)
+        self._written(session, 'update', ids, changes)
+        return ids
+
+    @traced
+    async def delete_many(self,
+                          ids: list[int],
+                          session: AsyncSession) -> list[int]:
+        stmt = delete(self.model).\
+            where(self.model.id.in_(ids)).\
+            returning(self.model.id)
+        await acquire_writer(session)
+        ids = list(await session.scalars(stmt))
+        self._written(session, 'delete', ids)
+        return ids
+
+    @traced
     async def check_exist_by_id(self, id, session):
         query = text(
             f'SELECT * FROM {self.model.__tablename__} WHERE id=:id')
@@ -170,6 +416,219 @@ class CRUDSA:
             result = await session.execute(query, {'id': id})
         return result.one()
 
+    async def stream_all(self,
+                         session: AsyncSession,
+                         include: list[Any] = [],
+                         exclude: list[Any] = [],
+                         chunk_size: int = 1000,
+                         ranges: dict[str, tuple[Any, Any]] = {},
+                         **filters) -> AsyncIterator[Sequence[Any]]:
+        '''
+            Yield row mappings in chunks of chunk_size. Only plain columns
+            are selected, so no ORM objects are built and memory stays
+            bounded by the chunk size.
+        '''
+        stmt = self._get_export_stmt(include, exclude, ranges, **filters
+                                     ).execution_options(yield_per=chunk_size)
+        async with session:
+            with ErrorHandler():
+                result = await session.stream(stmt)
+            async for partition in result.mappings().partitions():
+                yield partition
+
+    async def stream_json(self,
+                          session: AsyncSession,
+                          schema: Type[BaseModel],
+                          chunk_size: int = 1000,
+                          **filters) -> AsyncIterator[bytes]:
+        '''
+            Yield a json array of schema documents rendered by Postgres
+            (see json_select), nested schemas included. Rows are read
+            from a server-side cursor and passed through undecoded.
+        '''
+        stmt = json_rows(self.model, schema, **filters
+                         ).execution_options(yield_per=chunk_size)
+        separator = b'['
+        async with session:
+            with ErrorHandler():
+                result = await session.stream(stmt)
+            async for partition in result.scalars().partitions():
+                yield separator + ','.join(partition).encode()
+                separator = b','
+        yield b'[]' if separator == b'[' else b']'
+
+    @traced
+    async def copy_to(self,
+                      session: AsyncSession,
+                      output: Callable[[bytes], Awaitable[Any]],
+                      include: list[Any] = [],
+                      exclude: list[Any] = [],
+                      format: str = 'csv',
+                      ranges: dict[str, tuple[Any, Any]] = {},
+                      **filters) -> None:
+        '''
+            Run COPY (SELECT ...) TO STDOUT and pass every chunk received
+            from the server to output.
+            format: csv - csv with header, ndjson - one json object per line.
+        '''
+        stmt = self._get_export_stmt(include, exclude, ranges, **filters)
+        async with session:
+            with ErrorHandler():
+                connection = await session.connection()
+                compiled = stmt.compile(dialect=connection.dialect)
+                query = str(compiled)
+                args = [compiled.params[name]
+                        for name in compiled.positiontup or []]
+                options = {'format': 'csv', 'header': True}
+                if format == 'ndjson':
+                    # Postgres renders the row as json, csv mode with
+                    # unused quote/delimiter keeps it unescaped.
+                    query = f'SELECT row_to_json(t) FROM ({query}) AS t'
+                    options = {'format': 'csv',
+                               'quote': '\x01', 'delimiter': '\x02'}
+                raw = await connection.get_raw_connection()
+                await raw.driver_connection.copy_from_query(
+                    query, *args, output=output, **options)
+
+    def _get_export_stmt(self,
+                         include: list[Any] = [],
+                         exclude: list[Any] = [],
+                         ranges: dict[str, tuple[Any, Any]] = {},
+                         **filters) -> Select:
+        columns = self._get_columns(include, exclude)
+        stmt = select(*columns).filter_by(**filters).where(
+            *self._range_clauses(ranges)).order_by(
+            getattr(self.model, self.model.get_pks()[0]))
+        return stmt
+
+    def _get_columns(self,
+                     include: list[Any] = [],
+                     exclude: list[Any] = []) -> list[Any]:
+        '''
+            Return model column attributes with the same include/exclude
+            rules as _get_select_options, relations are never returned.
+        '''
+        fields = [field for field in self.model.as_list()
+                  if (not include or field in include)
+                  and field not in exclude]
+        return [getattr(self.model, field) for field in fields]
+
+    async def _read(self,
+                    stmt: Select,
+                    session: AsyncSession,
+                    fetch: Callable[[Result], Any],
+                    include: list[Any] = [],
+                    exclude: list[Any] = [],
+                    tables: Sequence[str] = ()) -> Any:
+        '''
+            Execute read statement, identical concurrent reads
+            (same model, statement, params and projection) share one query.
+            tables: other tables the read depends on (loaded relations),
+            a committed write to any of them starts new reads.
+            Reads in a transaction that has written are not shared: they
+            see its uncommitted rows.
+        '''
+        if session.in_transaction() and session.info.get(WRITE_EVENTS):
+            with ErrorHandler():
+                return fetch(await session.execute(stmt))
+        key = (self.model.tablename(), self._statement_key(stmt),
+               tuple(include), tuple(exclude))
+
+        async def query():
+            async with session:
+                with ErrorHandler():
+                    result = await session.execute(stmt)
+                    return fetch(result)
+        return await single_flight.do(
+            key, query, table=self.model.tablename(),
+            tables=(*model_tables(self.model), *tables))
+
+    @staticmethod
+    def _statement_key(stmt: Select) -> Hashable:
+        '''
+            Statement structure and parameter values. The cache key is
+            what SQLAlchemy uses to look up compiled statements, cheaper
+            than compiling.
+        '''
+        if (cache_key := stmt._generate_cache_key()) is None:
+            compiled = stmt.compile()
+            return str(compiled), repr(sorted(compiled.params.items()))
+        return cache_key.key, repr([(bind.key, bind.effective_value)
+                                    for bind in cache_key.bindparams])
+
+    async def _load_by_ids(self,
+                           session: AsyncSession,
+                           include: list[Any],
+                           exclude: list[Any],
+                           ids: list[int]) -> dict[int, Any]:
+        stmt = self._by_ids_stmt(ids, include, exclude)
+        # Loaders with different projections share the session.
+        lock = session.info.setdefault('loader_lock', asyncio.Lock())
+        async with lock:
+            items = await self._read(stmt, session, self._fetch_all,
+                                     include, exclude)
+        return {item.id: item for item in items}
+
+    def _by_ids_stmt(self,
+                     ids: list[int],
+                     include: list[Any] = [],
+                     exclude: list[Any] = []) -> Select:
+        if include and 'id' not in include:
+            include = [*include, 'id']
+        options = self._get_select_options(include, exclude)
+        if backend.SQLITE:
+            # No arrays: the IN list is expanded per call.
+            condition = self.model.id.in_(ids)
+        else:
+            condition = self.model.id == any_(
+                bindparam('ids', ids, type_=ARRAY(Integer)))
+        return select(self.model
+                      ).options(*options.raiseload, options.load_only
+                                ).where(condition)
+
+    def _range_clauses(self,
+                       ranges: dict[str, tuple[Any, Any]]) -> list[Any]:
+        '''
+            Half-open ranges field: (start, end), None is unbounded.
+        '''
+        clauses = []
+        for field, (start, end) in ranges.items():
+            column = getattr(self.model, field)
+            if start is not None:
+                clauses.append(column >= start)
+            if end is not None:
+                clauses.append(column < end)
+        return clauses
+
+    def _written(self,
+                 session: AsyncSession,
+                 operation: str,
+                 ids: Sequence[Any],
+                 changes: Sequence[dict] = ()) -> None:
+        '''
+            Called by every write before its commit: drops loaded items,
+            records the write event for the commit hooks (see
+            write_events, in-flight reads are dropped on commit).
+            changes: written values, one per id.
+        '''
+        written = [(id, change) for id, change
+                   in zip(ids, changes or [{}] * len(ids)) if id is not None]
+        record(session, WriteEvent(
+            model_tables(self.model), operation,
+            tuple(id for id, _ in written),
+            tuple(change for _, change in written) if changes else ()))
+        for key in [key for key in session.info
+                    if isinstance(key, tuple) and key[0] == 'loader']:
+            session.info[key].clear()
+
+    @staticmethod
+    def _fetch_all(result: Result) -> Sequence[Any]:
+        return result.scalars().unique().all()
+
+    @staticmethod
+    def _fetch_one(result: Result) -> Any:
+        return result.unique().one()[0]
+
     def _get_select_options(self,
                             include: list[Any] = [],
                             exclude: list[Any] = [],
@@ -0,0 +1,75 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable, Iterable
+
+from db.write_events import WriteEvent, on_commit
+from metrics import metrics
+
+coalesced_total = metrics.counter(
+    'crud_reads_coalesced_total',
+    'Reads served by an identical in-flight query.')
+executed_total = metrics.counter(
+    'crud_reads_executed_total',
+    'Reads executed against the database.')
+
+
+class SingleFlight:
+    '''
+        Deduplicates identical concurrent calls: while a call for key is
+        in flight, other callers with the same key await its result
+        instead of running their own.
+        The call runs in its own task, so cancelling one waiter does not
+        cancel the query for the others.
+        tables: tables the call reads, table (the metrics label) if not
+        given.
+    '''
+
+    def __init__(self):
+        self._calls: dict[Hashable, asyncio.Task] = {}
+        self._tables: dict[Hashable, frozenset[str]] = {}
+
+    async def do(self,
+                 key: Hashable,
+                 function: Callable[[], Awaitable[Any]],
+                 table: str = '',
+                 tables: Iterable[str] = ()) -> Any:
+        if (task := self._calls.get(key)) is not None:
+            coalesced_total.inc(table=table)
+            return await asyncio.shield(task)
+        executed_total.inc(table=table)
+        task = asyncio.ensure_future(function())
+        self._calls[key] = task
+        self._tables[key] = frozenset(tables or (table,))
+        task.add_done_callback(lambda _: self._discard(key, task))
+        return await asyncio.shield(task)
+
+    def forget(self, tables: Iterable[str] | None = None) -> None:
+        '''
+            Start new calls for keys reading any of tables (every key if
+            None), calls in flight still resolve for their current
+            waiters. Called once a write is committed, so a read issued
+            after it never joins a read started before.
+        '''
+        if tables is None:
+            self._calls.clear()
+            self._tables.clear()
+            return
+        tables = set(tables)
+        for key in [key for key, read in self._tables.items()
+                    if read & tables]:
+            del self._calls[key], self._tables[key]
+
+    def _discard(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key], self._tables[key]
+        if not task.cancelled():
+            # Mark exception as retrieved when every waiter is gone.
+            task.exception()
+
+
+single_flight = SingleFlight()
+
+
+@on_commit
+def _forget_committed(events: list[WriteEvent]) -> None:
+    single_flight.forget({table for write_event in events
+                          for table in write_event.tables})
@@ -0,0 +1,237 @@
+import asyncio
+import hashlib
+import re
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import wraps
+from typing import Any, Callable
+
+from loguru import logger
+from metrics import metrics
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+slow_queries_total = metrics.counter(
+    'slow_queries_total', 'Statements over the slow query threshold.')
+
+current_route: ContextVar[str | None] = ContextVar('current_route',
+                                                   default=None)
+current_method: ContextVar[str | None] = ContextVar('current_method',
+                                                    default=None)
+
+EXPLAINABLE = ('select', 'insert', 'update', 'delete', 'with', 'values')
+REDACTED = '***'
+MAX_VALUE = 64
+MAX_ITEMS = 5
+
+_literals = re.compile(r"'(?:[^']|'')*'|(?<![$\w])\d+(?:\.\d+)?\b")
+_lists = re.compile(r'\((?:\s*(?:\?|\$\d+)\s*,)+\s*(?:\?|\$\d+)\s*\)')
+_spaces = re.compile(r'\s+')
+
+
+def fingerprint(statement: str) -> tuple[str, str]:
+    '''
+        Normalized statement (literals and placeholder lists collapsed)
+        and its hash, statements differing only in values share it.
+    '''
+    normalized = _literals.sub('?', statement)
+    normalized = _lists.sub('(...)', normalized)
+    normalized = _spaces.sub(' ', normalized).strip()
+    return normalized, hashlib.sha1(normalized.encode()).hexdigest()[:16]
+
+
+def redact(parameters: Any, names: list[str] | None,
+           sensitive: list[str]) -> Any:
+    '''
+        Values of parameters named like sensitive are replaced, strings
+        are cut to MAX_VALUE chars. Unnamed strings are replaced too:
+        nothing tells what they hold.
+    '''
+    if isinstance(parameters, dict):
+        return {name: _redact_value(name, value, sensitive)
+                for name, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        names = names or []
+        return [_redact_value(names[index] if index < len(names) else None,
+                              value, sensitive)
+                for index, value in enumerate(parameters)]
+    return parameters
+
+
+def _redact_value(name: str | None, value: Any, sensitive: list[str]) -> Any:
+    if name is None and isinstance(value, str):
+        return REDACTED
+    if name is not None and any(word in name.lower() for word in sensitive):
+        return REDACTED
+    if isinstance(value, str) and len(value) > MAX_VALUE:
+        return value[:MAX_VALUE] + '...'
+    if isinstance(value, (list, tuple)):
+        preview = [_redact_value(name, item, sensitive)
+                   for item in value[:MAX_ITEMS]]
+        return preview + ['...'] if len(value) > MAX_ITEMS else preview
+    if isinstance(value, (int, float, bool)) or value is None:
+        return value
+    return str(value)[:MAX_VALUE]
+
+
+def traced(method: Callable) -> Callable:
+    '''
+        Remember the CRUDSA method running the statements.
+    '''
+    @wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        token = current_method.set(f'{type(self).__name__}.{method.__name__}')
+        try:
+            return await method(self, *args, **kwargs)
+        finally:
+            current_method.reset(token)
+    return wrapper
+
+
+def query_route(route: str) -> Callable:
+    '''
+        Route dependency: statements of the request are attributed to it.
+    '''
+    async def dependency() -> None:
+        current_route.set(route)
+    return dependency
+
+
+@dataclass
+class SlowQuery:
+    fingerprint: str
+    statement: str
+    parameters: Any
+    count: int = 0
+    total: float = 0
+    max: float = 0
+    last: float = 0
+    routes: set[str] = field(default_factory=set)
+    methods: set[str] = field(default_factory=set)
+    plan: Any = None
+
+    def summary(self) -> dict[str, Any]:
+        return {'fingerprint': self.fingerprint,
+                'statement': self.statement,
+                'parameters': self.parameters,
+                'count': self.count,
+                'total': self.total,
+                'mean': self.total / self.count,
+                'max': self.max,
+                'last': self.last,
+                'routes': sorted(self.routes),
+                'methods': sorted(self.methods),
+                'plan': self.plan}
+
+
+class SlowQueryRecorder:
+    '''
+        Engine listener recording statements running threshold seconds
+        or longer, one record per fingerprint. At most size records are
+        kept, the one with the least total time is dropped first.
+        The plan of a new fingerprint is captured in the background by
+        EXPLAIN (FORMAT JSON) on its own connection, the statement is
+        not executed again.
+    '''
+
+    def __init__(self,
+                 threshold: float,
+                 size: int,
+                 sensitive: list[str],
+                 explain: bool = True):
+        self.threshold = threshold
+        self.size = size
+        self.sensitive = sensitive
+        self.explain = explain
+        self.records: OrderedDict[str, SlowQuery] = OrderedDict()
+        self.engine: AsyncEngine | None = None
+        self.tasks: set[asyncio.Task] = set()
+
+    def attach(self, engine: AsyncEngine) -> None:
+        self.engine = engine
+        event.listen(engine.sync_engine, 'before_cursor_execute',
+                     self._before_execute)
+        event.listen(engine.sync_engine, 'after_cursor_execute',
+                     self._after_execute)
+
+    def top(self, limit: int = 20, order: str = 'total'
+            ) -> list[dict[str, Any]]:
+        summaries = [record.summary() for record in self.records.values()]
+        return sorted(summaries, key=lambda summary: summary[order],
+                      reverse=True)[:limit]
+
+    def record(self,
+               statement: str,
+               parameters: Any,
+               duration: float,
+               names: list[str] | None = None,
+               executemany: bool = False) -> SlowQuery:
+        normalized, key = fingerprint(statement)
+        slow_queries_total.inc()
+        if (record := self.records.get(key)) is None:
+            self._evict()
+            record = self.records[key] = SlowQuery(
+                key, normalized, redact(
+                    parameters[0] if executemany and parameters
+                    else parameters, names, self.sensitive))
+            if (self.explain and not executemany
+                    and normalized.lower().startswith(EXPLAINABLE)):
+                self._schedule_explain(record, statement, parameters)
+        record.count += 1
+        record.total += duration
+        record.max = max(record.max, duration)
+        record.last = time.time()
+        if route := current_route.get():
+            record.routes.add(route)
+        if method := current_method.get():
+            record.methods.add(method)
+        return record
+
+    def _before_execute(self, conn, cursor, statement, parameters,
+                        context, executemany) -> None:
+        # Kept on the execution context: a failed statement has no
+        # after_cursor_execute, nothing is left behind on the connection.
+        context.slow_query_started = time.perf_counter()
+
+    def _after_execute(self, conn, cursor, statement, parameters,
+                       context, executemany) -> None:
+        duration = time.perf_counter() - context.slow_query_started
+        if duration < self.threshold or conn.info.get('explaining'):
+            return
+        compiled = getattr(context, 'compiled', None)
+        names = list(compiled.positiontup or []) if compiled else None
+        self.record(statement, parameters, duration, names, executemany)
+
+    def _evict(self) -> None:
+        while self.records and len(self.records) >= self.size:
+            key = min(self.records, key=lambda key: self.records[key].total)
+            del self.records[key]
+
+    def _schedule_explain(self, record: SlowQuery, statement: str,
+                          parameters: Any) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        task = loop.create_task(self._explain(record, statement, parameters))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _explain(self, record: SlowQuery, statement: str,
+                       parameters: Any) -> None:
+        try:
+            async with self.engine.connect() as connection:
+                connection.sync_connection.info['explaining'] = True
+                try:
+                    result = await connection.exec_driver_sql(
+                        f'EXPLAIN (FORMAT JSON) {statement}',
+                        tuple(parameters) if isinstance(parameters, list)
+                        else parameters)
+                    record.plan = result.scalar()
+                finally:
+                    connection.sync_connection.info.pop('explaining', None)
+        except Exception as e:
+            logger.warning('EXPLAIN of slow query {} failed: {}',
+                           record.fingerprint, e)
@@ -0,0 +1,23 @@
+import asyncio
+
+from crud_router.router_generator import RouterGenerator
+from db.db import async_session_maker
+from loguru import logger
+
+
+async def warmup_pool(connections: int) -> None:
+    '''
+        Open connections of the pool at once and prime by-id statements
+        of every registered router on each of them, so the first requests
+        after start do not pay for connect and prepare.
+    '''
+    async def prime() -> None:
+        async with async_session_maker() as session:
+            await session.connection()
+            for router in RouterGenerator.registry.values():
+                await router.db_crud.warmup(
+                    session, include=router.schema_basic_out.model_fields)
+
+    await asyncio.gather(*[prime() for _ in range(connections)])
+    logger.info('Pool warmed up: {} connections, {} routers',
+                connections, len(RouterGenerator.registry))
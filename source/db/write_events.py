@@ -0,0 +1,95 @@
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+WRITE_EVENTS = 'write_events'
+SAVEPOINTS = 'write_events_savepoints'
+
+
+@dataclass(frozen=True)
+class WriteEvent:
+    '''
+        Rows of a model changed in a transaction. tables: every table of
+        the model (joined inheritance maps a model to several tables).
+        changes: values written to each of ids, when the writer has them
+        (empty for deletes), not part of equality.
+    '''
+    tables: tuple[str, ...]
+    operation: str
+    ids: tuple[Any, ...] = ()
+    changes: tuple[dict[str, Any], ...] = field(default=(), compare=False)
+
+
+commit_hooks: list[Callable[[list[WriteEvent]], None]] = []
+transaction_hooks: list[Callable[[Any, list[WriteEvent]], None]] = []
+
+
+def model_tables(model: Any) -> tuple[str, ...]:
+    return tuple(table.name for table in inspect(model).tables)
+
+
+def record(session: Any, write_event: WriteEvent) -> None:
+    '''
+        Remember write_event in the session, hooks are called once the
+        outermost transaction is committed. Rollback discards the events,
+        a savepoint rollback only those recorded within the savepoint.
+    '''
+    session.info.setdefault(WRITE_EVENTS, []).append(write_event)
+
+
+def on_commit(hook: Callable[[list[WriteEvent]], None]) -> Callable:
+    commit_hooks.append(hook)
+    return hook
+
+
+def in_transaction(hook: Callable[[Any, list[WriteEvent]], None]
+                   ) -> Callable:
+    '''
+        Register hook called with the sync session and its events right
+        before commit, statements it executes are part of the transaction.
+    '''
+    transaction_hooks.append(hook)
+    return hook
+
+
+@event.listens_for(Session, 'after_transaction_create')
+def _savepoint_begin(session, transaction) -> None:
+    if transaction.nested:
+        session.info.setdefault(SAVEPOINTS, {})[transaction] = len(
+            session.info.get(WRITE_EVENTS, ()))
+
+
+@event.listens_for(Session, 'before_commit')
+def _before_commit(session) -> None:
+    if session.in_nested_transaction():
+        # Savepoint release, the transaction goes on.
+        return
+    if events := session.info.get(WRITE_EVENTS):
+        for hook in transaction_hooks:
+            hook(session, events)
+
+
+@event.listens_for(Session, 'after_commit')
+def _after_commit(session) -> None:
+    if session.in_nested_transaction():
+        # Released savepoint: its events are the parent's now.
+        session.info.get(SAVEPOINTS, {}).pop(
+            session.get_nested_transaction(), None)
+        return
+    if events := session.info.pop(WRITE_EVENTS, None):
+        for hook in commit_hooks:
+            hook(events)
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def _after_transaction_end(session, transaction) -> None:
+    if transaction.nested:
+        # Still marked: the savepoint was rolled back, so are its events.
+        mark = session.info.get(SAVEPOINTS, {}).pop(transaction, None)
+        if mark is not None:
+            del session.info.get(WRITE_EVENTS, [])[mark:]
+    elif transaction.parent is None:
+        session.info.pop(WRITE_EVENTS, None)
+        session.info.pop(SAVEPOINTS, None)
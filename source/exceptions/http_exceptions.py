@@ -1,4 +1,12 @@
-from exceptions.sa_handler_manager import ItemNotFound, ItemNotUnique
+from asyncio import CancelledError
+
+from config import settings
+from exceptions.sa_handler_manager import (
+    DatabaseBusy,
+    ItemNotFound,
+    ItemNotUnique,
+    QueryCanceled,
+)
 from fastapi import HTTPException, status
 from fastapi_users import exceptions as fast_users_exceptions
 from fastapi_users.exceptions import UserNotExists
@@ -25,6 +33,28 @@ HTTPUserNotExists = HTTPException(
     detail="User not exists."
 )
 
+HTTPJobQueueFull = HTTPException(
+    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+    detail="Job queue is full, try later.",
+    headers={'Retry-After': '30'},
+)
+
+HTTPServiceOverloaded = HTTPException(
+    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+    detail="Service overloaded, try later.",
+    headers={'Retry-After': str(settings.ADMISSION_RETRY_AFTER)},
+)
+
+HTTPDeadlineExceeded = HTTPException(
+    status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+    detail="Request deadline exceeded.",
+)
+
+HTTPClientClosedRequest = HTTPException(
+    status_code=499,
+    detail="Client closed request.",
+)
+
 
 HTTPVerifyBadToken = HTTPException(
     status_code=status.HTTP_400_BAD_REQUEST,
@@ -43,10 +73,16 @@ class HttpExceptionsHandler:
 
     def __exit__(self, ex_type, ex_instance, traceback):
         match ex_instance:
+            case HTTPException() | CancelledError():
+                return
             case ItemNotUnique():
                 raise HTTPUniqueException
             case ItemNotFound():
                 raise HTTPObjectNotExist
+            case QueryCanceled() | TimeoutError():
+                raise HTTPDeadlineExceeded
+            case DatabaseBusy():
+                raise HTTPServiceOverloaded
             case UserNotExists():
                 raise HTTPUserNotExists
             case fast_users_exceptions.InvalidVerifyToken():
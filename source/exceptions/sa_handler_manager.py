@@ -1,7 +1,32 @@
+from asyncio import CancelledError
+
 from loguru import logger
 from psycopg2 import errorcodes
 from psycopg2.errorcodes import FOREIGN_KEY_VIOLATION, UNIQUE_VIOLATION, lookup
 from sqlalchemy.exc import NoResultFound, SQLAlchemyError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+
+# SQLite errors in terms of Postgres SQLSTATE, the codes handlers match.
+SQLITE_CODES = {
+    'SQLITE_CONSTRAINT_UNIQUE': errorcodes.UNIQUE_VIOLATION,
+    'SQLITE_CONSTRAINT_PRIMARYKEY': errorcodes.UNIQUE_VIOLATION,
+    'SQLITE_CONSTRAINT_FOREIGNKEY': errorcodes.FOREIGN_KEY_VIOLATION,
+    'SQLITE_INTERRUPT': errorcodes.QUERY_CANCELED,
+    'SQLITE_BUSY': errorcodes.SERIALIZATION_FAILURE,
+}
+
+
+def error_code(error: BaseException) -> str | None:
+    '''
+        SQLSTATE of the driver error wrapped by error, whatever the
+        backend: asyncpg/psycopg2 carry pgcode, sqlite3 errors are
+        translated by name.
+    '''
+    orig = getattr(error, 'orig', None)
+    if (pgcode := getattr(orig, 'pgcode', None)) is not None:
+        return pgcode
+    return SQLITE_CODES.get(getattr(orig, 'sqlite_errorname', None))
 
 
 class ItemNotFound(SQLAlchemyError):
@@ -12,25 +37,41 @@ class ItemNotUnique(SQLAlchemyError):
     ...
 
 
+class ForeignKeyNotPresent(SQLAlchemyError):
+    ...
+
+
+class QueryCanceled(SQLAlchemyError):
+    ...
+
+
+class DatabaseBusy(SQLAlchemyError):
+    ...
+
+
 class ErrorHandler:
 
     def __enter__(self):
         return self
 
     def __exit__(self, ex_type, ex_instance, traceback):
-        if not ex_instance:
+        if not ex_instance or isinstance(ex_instance, CancelledError):
             return
         logger.error(ex_instance)
         if hasattr(ex_instance, 'orig'):
-            match ex_instance.orig.pgcode:
+            match error_code(ex_instance):
                 case errorcodes.UNIQUE_VIOLATION:
                     raise ItemNotUnique("Not unique")
                 case errorcodes.FOREIGN_KEY_VIOLATION:
-                    raise SQLAlchemyError("Foreign key not present")
+                    raise ForeignKeyNotPresent("Foreign key not present")
+                case errorcodes.QUERY_CANCELED:
+                    raise QueryCanceled("Statement timeout")
                 case _:
                     raise ex_instance
         elif type(ex_instance) == NoResultFound:
             raise ItemNotFound
+        elif type(ex_instance) == PoolTimeoutError:
+            raise DatabaseBusy("Connection pool timeout")
         elif ex_instance:
             raise ex_instance
         else:
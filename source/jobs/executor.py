@@ -0,0 +1,287 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from typing import Any, Callable
+
+from config import settings
+from db import backend
+from db.db import async_session_maker
+from db.models.jobs import Job, JobKind, JobStatus
+from db.retry import is_retryable, retryable
+from db.sa_crud import CRUDSA
+from loguru import logger
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import defer
+
+
+class JobQueueFull(Exception):
+    ...
+
+
+class JobLeaseLost(Exception):
+    '''
+        The job was claimed by another worker, its lease had passed.
+    '''
+
+
+class JobExecutor:
+    '''
+        Executor for large batch operations, one per process.
+        Jobs are stored in the job table together with their payload.
+        Workers of every process claim pending jobs from the table, one
+        job by one worker (FOR UPDATE SKIP LOCKED), for lease seconds.
+        Every chunk is applied in one transaction with the progress
+        checkpoint, which extends the lease. The checkpoint only moves
+        forward from the processed count the chunk started at: after a
+        crash the job is claimed again once its lease passes, continues
+        from the first unprocessed chunk and no row is applied twice.
+        workers - number of jobs running at the same time.
+        db_concurrency - number of chunks talking to the DB at the same time.
+        queue_size - pending jobs at most, submit fails beyond.
+        max_errors - failed rows reported in result['errors'] at most,
+        result['failed'] counts them all.
+    '''
+
+    def __init__(self,
+                 session_maker: Callable[[], AsyncSession],
+                 workers: int,
+                 db_concurrency: int,
+                 chunk_size: int,
+                 queue_size: int,
+                 lease: float,
+                 poll_interval: float,
+                 max_errors: int = 1000):
+        self.session_maker = session_maker
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.queue_size = queue_size
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.max_errors = max_errors
+        self.db_limit = asyncio.Semaphore(db_concurrency)
+        self.wakeup = asyncio.Event()
+        self.cruds: dict[str, CRUDSA] = {}
+        self._tasks: list[asyncio.Task] = []
+
+    def register(self, db_crud: CRUDSA) -> None:
+        self.cruds[db_crud.model.tablename()] = db_crud
+
+    async def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._worker())
+                       for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self,
+                     kind: JobKind,
+                     target: str,
+                     payload: list[Any],
+                     options: dict[str, Any] = {}) -> Job:
+        '''
+            Store the job as pending, a worker of any process claims it.
+            Concurrent submits may pass queue_size by a few jobs.
+        '''
+        pending = select(func.count(Job.id)).where(
+            Job.status == JobStatus.pending.value)
+        job = Job(kind=kind.value, target=target, payload=payload,
+                  options=options, total=len(payload), processed=0,
+                  result={'applied': 0, 'failed': 0, 'errors': []})
+        async with self.session_maker() as session, session.begin():
+            await backend.acquire_writer(session)
+            if await session.scalar(pending) >= self.queue_size:
+                raise JobQueueFull
+            session.add(job)
+        self.wakeup.set()
+        return job
+
+    async def get(self, job_id: int) -> Job | None:
+        '''
+            Job without its payload, for status polls.
+        '''
+        async with self.session_maker() as session:
+            return await session.get(Job, job_id,
+                                     options=[defer(Job.payload)])
+
+    async def claim(self) -> int | None:
+        '''
+            Take the oldest pending job, or a running one whose lease
+            passed, for lease seconds. None if there is none.
+        '''
+        now = _now()
+        claimable = select(Job.id).where(or_(
+            Job.status == JobStatus.pending.value,
+            and_(Job.status == JobStatus.running.value,
+                 or_(Job.lease.is_(None), Job.lease < now)))
+        ).order_by(Job.id).limit(1).with_for_update(skip_locked=True)
+        stmt = update(Job).where(Job.id == claimable.scalar_subquery()
+                                 ).values(status=JobStatus.running.value,
+                                          lease=self._lease(now)
+                                          ).returning(Job.id)
+        async with self.session_maker() as session, session.begin():
+            await backend.acquire_writer(session)
+            return await session.scalar(stmt)
+
+    async def _worker(self) -> None:
+        while True:
+            try:
+                job_id = await self.claim()
+            except Exception as e:
+                logger.warning('Job claim failed: {}', e)
+                job_id = None
+            if job_id is None:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(),
+                                           self.poll_interval)
+                except TimeoutError:
+                    pass
+                self.wakeup.clear()
+                continue
+            try:
+                await self._run(job_id)
+            except JobLeaseLost:
+                logger.warning('Job {} was taken over by another worker',
+                               job_id)
+            except Exception as e:
+                logger.error(f'Job {job_id} failed: {e}')
+                try:
+                    await self._fail(job_id, str(e))
+                except Exception as e:
+                    logger.warning('Job {} failure not saved: {}', job_id, e)
+
+    async def _run(self, job_id: int) -> None:
+        async with self.session_maker() as session:
+            job = await session.get(Job, job_id)
+        db_crud = self.cruds[job.target]
+        processed, result = job.processed, job.result
+        while processed < job.total:
+            async with self.db_limit:
+                processed, result = await self._apply_chunk(
+                    job, db_crud, processed, result)
+        await self._set_status(job_id, JobStatus.done)
+
+    @retryable
+    async def _apply_chunk(self,
+                           job: Job,
+                           db_crud: CRUDSA,
+                           processed: int,
+                           result: dict[str, Any]
+                           ) -> tuple[int, dict[str, Any]]:
+        '''
+            Apply next chunk and save the checkpoint in one transaction.
+            The checkpoint is conditional on processed: if another
+            worker moved the job on, the chunk is rolled back.
+        '''
+        chunk = job.payload[processed:processed + self.chunk_size]
+        async with self.session_maker() as session:
+            async with session.begin():
+                await backend.acquire_writer(session)
+                ids, errors = await self._apply(job, db_crud, chunk, session)
+                reported = result['errors']
+                result = {
+                    'applied': result['applied'] + len(ids),
+                    'failed': (result.get('failed', len(reported))
+                               + len(errors)),
+                    'errors': reported + [
+                        {'index': processed + index, 'error': error}
+                        for index, error in errors
+                    ][:max(self.max_errors - len(reported), 0)]}
+                checkpoint = await session.execute(
+                    update(Job).where(
+                        Job.id == job.id,
+                        Job.status == JobStatus.running.value,
+                        Job.processed == processed
+                    ).values(processed=processed + len(chunk), result=result,
+                             lease=self._lease(_now())))
+                if checkpoint.rowcount != 1:
+                    raise JobLeaseLost
+        return processed + len(chunk), result
+
+    async def _apply(self,
+                     job: Job,
+                     db_crud: CRUDSA,
+                     chunk: list[Any],
+                     session: AsyncSession
+                     ) -> tuple[list[int], list[tuple[int, str]]]:
+        '''
+            Apply the chunk with one statement. If the statement fails,
+            rows are applied one by one in savepoints and failed rows are
+            reported with their index in the chunk.
+        '''
+        index_elements = job.options.get('index_elements')
+        kind = JobKind(job.kind)
+        if kind == JobKind.delete:
+            operation = db_crud.delete_many
+        elif kind == JobKind.upsert or index_elements:
+            operation = partial(db_crud.upsert_many,
+                                index_elements=index_elements)
+        else:
+            operation = db_crud.insert_many
+        try:
+            async with session.begin_nested():
+                return await operation(chunk, session), []
+        except SQLAlchemyError as e:
+            if is_retryable(e):
+                raise
+            logger.debug('Job {} chunk failed, applying by row: {}', job.id, e)
+        ids, errors = [], []
+        for index, row in enumerate(chunk):
+            try:
+                async with session.begin_nested():
+                    ids += await operation([row], session)
+            except SQLAlchemyError as e:
+                if is_retryable(e):
+                    raise
+                errors.append((index, str(getattr(e, 'orig', e))))
+        return ids, errors
+
+    async def _set_status(self,
+                          job_id: int,
+                          status: JobStatus,
+                          error: str | None = None) -> None:
+        stmt = update(Job).where(Job.id == job_id).values(
+            status=status.value, error=error, lease=None)
+        async with self.session_maker() as session, session.begin():
+            await backend.acquire_writer(session)
+            await session.execute(stmt)
+
+    async def _fail(self, job_id: int, error: str) -> None:
+        '''
+            Mark the job failed while this worker holds it: once the lease
+            has passed, the job may run in another worker, or is left to
+            the next claim.
+        '''
+        stmt = update(Job).where(
+            Job.id == job_id,
+            Job.status == JobStatus.running.value,
+            Job.lease > _now()
+        ).values(status=JobStatus.failed.value, error=error, lease=None)
+        async with self.session_maker() as session, session.begin():
+            await backend.acquire_writer(session)
+            if (await session.execute(stmt)).rowcount != 1:
+                logger.warning('Job {} failure not saved, lease lost',
+                               job_id)
+
+    def _lease(self, now: datetime) -> datetime:
+        return now + timedelta(seconds=self.lease)
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+job_executor = JobExecutor(
+    session_maker=async_session_maker,
+    workers=settings.JOBS_WORKERS,
+    db_concurrency=settings.JOBS_DB_CONCURRENCY,
+    chunk_size=settings.JOBS_CHUNK_SIZE,
+    queue_size=settings.JOBS_QUEUE_SIZE,
+    lease=settings.JOBS_LEASE,
+    poll_interval=settings.JOBS_POLL_INTERVAL,
+    max_errors=settings.JOBS_MAX_ERRORS,
+)
@@ -0,0 +1,51 @@
+from contextlib import asynccontextmanager
+
+from config import settings
+from fastapi import FastAPI
+from logger_config import setup_logging
+from loguru import logger
+from offload import loop_lag_monitor, shutdown_pool
+from openapi_cache import build_openapi
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Imported here: the engine is created on import of db.db and the
+    # app itself has to stay importable without database settings.
+    from db.backend import SQLITE, create_schema
+    from db.db import engine
+    from crud_router.change_feed import stop_feeds
+    from crud_router.idempotency import idempotency_store
+    from db.aggregates import aggregate_refresher
+    from db.audit import audit_log
+    from db.notifications import change_listener
+    from db.warmup import warmup_pool
+    from jobs.executor import job_executor
+
+    setup_logging()
+    if SQLITE:
+        await create_schema(engine)
+    if settings.SERVER_WARMUP:
+        await warmup_pool(settings.DB_POOL_SIZE)
+        build_openapi(app)
+    # SQLite: write events reach local hooks only, no aggregates.
+    if settings.NOTIFY_ENABLED and not SQLITE:
+        change_listener.start()
+    await job_executor.start()
+    idempotency_store.start()
+    audit_log.start()
+    if not SQLITE:
+        aggregate_refresher.start()
+    loop_lag_monitor.start()
+    logger.info('Application started')
+    yield
+    await loop_lag_monitor.stop()
+    await aggregate_refresher.stop()
+    await audit_log.stop()
+    await idempotency_store.stop()
+    await job_executor.stop()
+    await change_listener.stop()
+    await stop_feeds()
+    shutdown_pool()
+    await engine.dispose()
+    await logger.complete()
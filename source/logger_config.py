@@ -1,4 +1,6 @@
+import logging
 import sys
+from itertools import count
 
 from config import ENVIRONMENT, settings
 from loguru import logger
@@ -8,20 +10,110 @@ if ENVIRONMENT != 'prod':
     DEBUG_SINK = f'{settings.LOG_DIR}/debug/' + '{time:YYYY_MM_DD}'
     INFO_SINK = f'{settings.LOG_DIR}/info/' + '{time:YYYY_MM_DD}'
     ERROR_SINK = f'{settings.LOG_DIR}/error/' + '{time:YYYY_MM_DD}'
+    # Warnings and errors are shown on the console too.
+    CONSOLE_SINK = sys.stderr
 else:
     DEBUG_SINK = INFO_SINK = ERROR_SINK = sys.stderr
+    CONSOLE_SINK = None
 
+SQL_LOGGER = 'sqlalchemy'
 
-logger.remove()
 
+class InterceptHandler(logging.Handler):
+    '''
+        Pass stdlib records to loguru. Stdlib loggers are gated by the
+        levels from settings, so disabled records are never created.
+        Caller frame is not searched, logger name is bound instead.
+    '''
 
-logger.add(DEBUG_SINK,
-           filter=lambda record: record['level'].name == 'DEBUG', format=format)
+    def emit(self, record):
+        try:
+            level = logger.level(record.levelname).name
+        except ValueError:
+            level = record.levelno
+        logger.bind(logger_name=record.name).opt(
+            exception=record.exc_info).log(level, record.getMessage())
 
-logger.add(INFO_SINK,
-           filter=lambda record: record['level'].name == 'INFO',
-           format=format)
 
-logger.add(ERROR_SINK,
-           filter=lambda record: record['level'].name == 'ERROR',
-           format=format)
+class LevelFilter:
+    '''
+        Per-logger levels, the longest matching logger name prefix wins.
+        levels: {'db': 'DEBUG', 'sqlalchemy.engine': 'INFO'}
+    '''
+
+    def __init__(self, default: str, levels: dict[str, str]):
+        self.default = logger.level(default).no
+        self.levels = sorted(
+            ((name, logger.level(level).no) for name, level in levels.items()),
+            key=lambda item: len(item[0]), reverse=True)
+
+    def level(self, name: str) -> int:
+        for prefix, level in self.levels:
+            if name == prefix or name.startswith(prefix + '.'):
+                return level
+        return self.default
+
+    def min_level(self) -> int:
+        return min([self.default, *(level for _, level in self.levels)])
+
+    def __call__(self, record) -> bool:
+        name = record['extra'].get('logger_name') or record['name'] or ''
+        return record['level'].no >= self.level(name)
+
+
+class Sampler:
+    '''
+        Pass every n-th record of SQL and DEBUG records, others pass always.
+    '''
+
+    def __init__(self, sql_every: int, debug_every: int):
+        self.sql_every = max(sql_every, 1)
+        self.debug_every = max(debug_every, 1)
+        self.sql_counter = count()
+        self.debug_counter = count()
+
+    def __call__(self, record) -> bool:
+        name = record['extra'].get('logger_name') or ''
+        if name.startswith(SQL_LOGGER):
+            return next(self.sql_counter) % self.sql_every == 0
+        if record['level'].name == 'DEBUG':
+            return next(self.debug_counter) % self.debug_every == 0
+        return True
+
+
+def setup_logging() -> None:
+    '''
+        Configure loguru sinks and stdlib interception from settings.
+        File sinks are queue-backed (enqueue), records are written by a
+        background thread instead of the request path.
+    '''
+    level_filter = LevelFilter(settings.LOG_LEVEL, settings.LOG_LEVELS)
+    sampler = Sampler(settings.LOG_SQL_SAMPLE, settings.LOG_DEBUG_SAMPLE)
+    min_level = level_filter.min_level()
+
+    def sink_filter(low: str, high: str | None):
+        # Levels from low up to (not including) high: every record
+        # reaches one of the level sinks.
+        low, high = logger.level(low).no, high and logger.level(high).no
+
+        def _filter(record) -> bool:
+            return (low <= record['level'].no
+                    and (high is None or record['level'].no < high)
+                    and level_filter(record) and sampler(record))
+        return _filter
+
+    logger.remove()
+    for sink, low, high in ((DEBUG_SINK, 'TRACE', 'INFO'),
+                            (INFO_SINK, 'INFO', 'ERROR'),
+                            (ERROR_SINK, 'ERROR', None),
+                            (CONSOLE_SINK, 'WARNING', None)):
+        if sink is None or high and logger.level(high).no <= min_level:
+            continue
+        logger.add(sink, level=min_level, filter=sink_filter(low, high),
+                   format=format, enqueue=settings.LOG_ENQUEUE)
+
+    logging.basicConfig(handlers=[InterceptHandler()],
+                        level=logging.getLevelName(settings.LOG_LEVEL),
+                        force=True)
+    for name, level in settings.LOG_LEVELS.items():
+        logging.getLogger(name).setLevel(logging.getLevelName(level))
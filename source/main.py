@@ -1,8 +1,13 @@
 from api.v1.app import app as app_v1
 from config import settings
 from fastapi import FastAPI
+from lifespan import lifespan
+from openapi_cache import install_openapi_cache
+from profiling import install_profiling
 
-app = FastAPI(title='Catalog4')
+app = FastAPI(title='Catalog4', lifespan=lifespan)
+install_openapi_cache(app)
+install_profiling(app)
 
 app.mount('/v1', app_v1)
 
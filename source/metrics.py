@@ -0,0 +1,94 @@
+from collections import defaultdict
+from typing import Callable
+
+
+class Metric:
+    type = 'untyped'
+
+    def __init__(self, name: str, description: str = ''):
+        self.name = name
+        self.description = description
+        self.values: dict[tuple, float] = defaultdict(float)
+
+    def _key(self, labels: dict[str, str]) -> tuple:
+        return tuple(sorted(labels.items()))
+
+    def get(self, **labels: str) -> float:
+        return self.values.get(self._key(labels), 0)
+
+    def samples(self) -> list[tuple[tuple, float]]:
+        return list(self.values.items())
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        self.values[self._key(labels)] += amount
+
+
+class Gauge(Metric):
+    '''
+        Gauge value is either set directly or read from callback
+        at render time.
+    '''
+    type = 'gauge'
+
+    def __init__(self,
+                 name: str,
+                 description: str = '',
+                 callback: Callable[[], dict[tuple, float]] | None = None):
+        super().__init__(name, description)
+        self.callback = callback
+
+    def set(self, value: float, **labels: str) -> None:
+        self.values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        self.values[self._key(labels)] += amount
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.values[self._key(labels)] -= amount
+
+    def samples(self) -> list[tuple[tuple, float]]:
+        if self.callback:
+            return list(self.callback().items())
+        return super().samples()
+
+
+class MetricsRegistry:
+    '''
+        Process-local metrics, rendered in Prometheus text format.
+    '''
+
+    def __init__(self):
+        self.metrics: dict[str, Metric] = {}
+
+    def counter(self, name: str, description: str = '') -> Counter:
+        return self._register(Counter(name, description))
+
+    def gauge(self,
+              name: str,
+              description: str = '',
+              callback: Callable[[], dict[tuple, float]] | None = None
+              ) -> Gauge:
+        return self._register(Gauge(name, description, callback))
+
+    def _register(self, metric: Metric) -> Metric:
+        return self.metrics.setdefault(metric.name, metric)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.description}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for labels, value in metric.samples():
+                rendered = ','.join(f'{key}="{label}"'
+                                    for key, label in labels)
+                name = f'{metric.name}{{{rendered}}}' if labels \
+                    else metric.name
+                lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,148 @@
+import asyncio
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import cache, partial
+from typing import Any, Callable
+
+from config import settings
+from loguru import logger
+from metrics import metrics
+from pydantic import TypeAdapter
+
+offloaded_total = metrics.counter(
+    'offloaded_calls_total', 'CPU-bound calls run in the offload pool.')
+loop_lag = metrics.gauge(
+    'event_loop_lag_seconds', 'Last measured event loop lag.')
+loop_stalls_total = metrics.counter(
+    'event_loop_stalls_total', 'Event loop lags over the warning threshold.')
+
+_pool: Executor | None = None
+
+
+def get_pool() -> Executor:
+    '''
+        Pool for CPU-bound work, OFFLOAD_POOL: thread or process.
+        Threads keep the loop responsive (GIL is switched every few ms,
+        argon2/bcrypt release it), processes also run pure python work
+        in parallel but arguments and results have to be picklable.
+    '''
+    global _pool
+    if _pool is None:
+        match settings.OFFLOAD_POOL:
+            case 'process':
+                _pool = ProcessPoolExecutor(settings.OFFLOAD_WORKERS)
+            case _:
+                _pool = ThreadPoolExecutor(settings.OFFLOAD_WORKERS,
+                                           thread_name_prefix='offload')
+    return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def offload(function: Callable,
+                  *args: Any,
+                  size: int | None = None,
+                  threshold: int | None = None,
+                  **kwargs: Any) -> Any:
+    '''
+        Run function in the offload pool if size reaches threshold
+        (OFFLOAD_THRESHOLD by default), small inputs run inline because
+        the pool round trip costs more than the work.
+        size None means always offload.
+    '''
+    threshold = settings.OFFLOAD_THRESHOLD if threshold is None else threshold
+    if size is not None and size < threshold:
+        return function(*args, **kwargs)
+    offloaded_total.inc(function=getattr(function, '__name__', ''))
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_pool(), partial(function, *args, **kwargs))
+
+
+@cache
+def type_adapter(schema: Any) -> TypeAdapter:
+    return TypeAdapter(schema)
+
+
+def validate_many(schema: Any, data: list[Any]) -> list[Any]:
+    return type_adapter(list[schema]).validate_python(data)
+
+
+def dump_json(schema: Any, item: Any) -> bytes:
+    '''
+        Body of item as response_model=schema renders it: validated
+        (and filtered) by schema, dumped by alias.
+    '''
+    adapter = type_adapter(schema)
+    return adapter.dump_json(
+        adapter.validate_python(item, from_attributes=True), by_alias=True)
+
+
+def dump_json_many(schema: Any, items: list[Any]) -> bytes:
+    return dump_json(list[schema], items)
+
+
+def json_schema(schema: Any) -> dict[str, Any]:
+    '''
+        JSON schema of schema for OpenAPI fragments (openapi_extra):
+        definitions are inlined, pydantic's #/$defs refs would resolve
+        against the OpenAPI document root.
+    '''
+    document = type_adapter(schema).json_schema()
+    definitions = document.pop('$defs', {})
+
+    def inline(node: Any, seen: frozenset[str]) -> Any:
+        if isinstance(node, list):
+            return [inline(value, seen) for value in node]
+        if not isinstance(node, dict):
+            return node
+        node = {key: inline(value, seen) for key, value in node.items()}
+        if (ref := node.pop('$ref', None)) is None:
+            return node
+        name = ref.removeprefix('#/$defs/')
+        if name in seen:
+            # Recursive model: the inner level is left open.
+            return node
+        return inline(definitions[name], seen | {name}) | node
+
+    return inline(document, frozenset())
+
+
+class LoopLagMonitor:
+    '''
+        Sleeps interval seconds in a loop and measures how late it wakes
+        up. Lag over warning seconds is logged and counted as a stall.
+    '''
+
+    def __init__(self, interval: float, warning: float):
+        self.interval = interval
+        self.warning = warning
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _run(self) -> None:
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = time.perf_counter() - start - self.interval
+            loop_lag.set(lag)
+            if lag > self.warning:
+                loop_stalls_total.inc()
+                logger.warning('Event loop stalled for {:.3f}s', lag)
+
+
+loop_lag_monitor = LoopLagMonitor(
+    interval=settings.OFFLOAD_LAG_INTERVAL,
+    warning=settings.OFFLOAD_LAG_WARNING)
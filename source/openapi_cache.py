@@ -0,0 +1,84 @@
+import gzip
+import hashlib
+import json
+from dataclasses import dataclass
+
+from fastapi import FastAPI, Request, Response
+from starlette.routing import Mount, Route
+
+
+@dataclass
+class SerializedDocument:
+    body: bytes
+    gzipped: bytes
+    etag: str
+
+
+class OpenAPIDocument:
+    '''
+        OpenAPI document of the app, serialized and gzip-compressed once
+        per root path (mounted apps are served under their mount path).
+        Replaces the default openapi_url route, which regenerates the
+        JSON response on every request.
+    '''
+
+    def __init__(self, app: FastAPI):
+        self.app = app
+        self.documents: dict[str, SerializedDocument] = {}
+
+    def get(self, root_path: str = '') -> SerializedDocument:
+        if (document := self.documents.get(root_path)) is None:
+            document = self.documents[root_path] = self._build(root_path)
+        return document
+
+    def _build(self, root_path: str) -> SerializedDocument:
+        schema = self.app.openapi()
+        if root_path and self.app.root_path_in_servers:
+            servers = schema.get('servers', [])
+            if root_path not in {server.get('url') for server in servers}:
+                schema = {**schema,
+                          'servers': [{'url': root_path}, *servers]}
+        body = json.dumps(schema, separators=(',', ':')).encode()
+        etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        return SerializedDocument(body=body,
+                                  gzipped=gzip.compress(body, mtime=0),
+                                  etag=etag)
+
+    async def endpoint(self, request: Request) -> Response:
+        root_path = request.scope.get('root_path', '').rstrip('/')
+        document = self.get(root_path)
+        headers = {'ETag': document.etag,
+                   'Cache-Control': 'no-cache',
+                   'Vary': 'Accept-Encoding'}
+        if request.headers.get('if-none-match') == document.etag:
+            return Response(status_code=304, headers=headers)
+        if 'gzip' in request.headers.get('accept-encoding', ''):
+            return Response(document.gzipped, media_type='application/json',
+                            headers={**headers, 'Content-Encoding': 'gzip'})
+        return Response(document.body, media_type='application/json',
+                        headers=headers)
+
+
+def install_openapi_cache(app: FastAPI) -> None:
+    if not app.openapi_url:
+        return
+    document = OpenAPIDocument(app)
+    app.state.openapi_document = document
+    app.router.routes = [
+        route for route in app.router.routes
+        if not (isinstance(route, Route) and route.path == app.openapi_url)]
+    app.add_route(app.openapi_url, document.endpoint, include_in_schema=False)
+
+
+def build_openapi(app: FastAPI, root_path: str = '') -> None:
+    '''
+        Serialize OpenAPI documents of the app and mounted sub-apps now
+        instead of on the first /openapi.json request.
+    '''
+    if document := getattr(app.state, 'openapi_document', None):
+        document.get(root_path)
+    else:
+        app.openapi()
+    for route in app.routes:
+        if isinstance(route, Mount) and isinstance(route.app, FastAPI):
+            build_openapi(route.app, root_path + route.path)
@@ -0,0 +1,195 @@
+import asyncio
+import cProfile
+import json
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from itertools import count
+from typing import Any, Iterator
+
+from config import settings
+from fastapi import FastAPI
+from loguru import logger
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+PROFILE_HEADER = b'x-profile'
+
+
+@dataclass
+class RequestProfile:
+    '''
+        Time of a profiled request by kind, loop is what remains of the
+        total: python code on the event loop and waiting for it.
+    '''
+    id: str
+    method: str
+    path: str
+    started: float
+    status: int | None = None
+    total: float = 0
+    timings: dict[str, float] = field(default_factory=dict)
+
+    def add(self, kind: str, seconds: float) -> None:
+        self.timings[kind] = self.timings.get(kind, 0) + seconds
+
+    def summary(self) -> dict[str, Any]:
+        timings = {'db': 0, 'serialization': 0} | self.timings
+        loop = self.total - sum(timings.values())
+        return asdict(self) | {'timings': timings | {'loop': loop}}
+
+
+current_profile: ContextVar[RequestProfile | None] = ContextVar(
+    'current_profile', default=None)
+
+
+@contextmanager
+def timed(kind: str) -> Iterator[None]:
+    '''
+        Add the time of the block to the profile of the request, no-op
+        outside of profiled requests.
+    '''
+    if (profile := current_profile.get()) is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add(kind, time.perf_counter() - start)
+
+
+def _before_execute(conn, cursor, statement, parameters, context,
+                    executemany) -> None:
+    if current_profile.get() is not None:
+        conn.info['profile_started'] = time.perf_counter()
+
+
+def _after_execute(conn, cursor, statement, parameters, context,
+                   executemany) -> None:
+    if (profile := current_profile.get()) is None:
+        return
+    if (started := conn.info.pop('profile_started', None)) is not None:
+        profile.add('db', time.perf_counter() - started)
+
+
+class ProfileStore:
+    '''
+        Ring of the last size profiles on disk: <id>.prof (pstats,
+        e.g. for snakeviz) and <id>.json (summary).
+    '''
+
+    def __init__(self, directory: str, size: int):
+        self.directory = directory
+        self.size = size
+
+    def save(self, profile: RequestProfile, profiler: cProfile.Profile
+             ) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        profiler.dump_stats(self.path(profile.id, 'prof'))
+        with open(self.path(profile.id, 'json'), 'w') as file:
+            json.dump(profile.summary(), file)
+        for summary in self.list()[self.size:]:
+            for suffix in ('prof', 'json'):
+                try:
+                    os.remove(self.path(summary['id'], suffix))
+                except FileNotFoundError:
+                    pass
+
+    def list(self) -> list[dict[str, Any]]:
+        '''
+            Summaries, newest first.
+        '''
+        if not os.path.isdir(self.directory):
+            return []
+        summaries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as file:
+                    summaries.append(json.load(file))
+            except (OSError, ValueError):
+                continue
+        return sorted(summaries, key=lambda summary: summary['started'],
+                      reverse=True)
+
+    def path(self, id: str, suffix: str) -> str:
+        return os.path.join(self.directory, f'{id}.{suffix}')
+
+
+profile_store = ProfileStore(settings.PROFILE_DIR, settings.PROFILE_KEEP)
+
+
+class ProfilingMiddleware:
+    '''
+        cProfile a request when it carries the X-Profile: <ADMIN_TOKEN>
+        header or is the sample-th one. Only one request is profiled at a
+        time: cProfile records the whole loop thread, so calls of
+        concurrent requests interleaved with it show up in the profile.
+        Other requests pass through untouched.
+    '''
+    active = False
+
+    def __init__(self, app, token: str, sample: int, store: ProfileStore):
+        self.app = app
+        self.token = token.encode()
+        self.sample = sample
+        self.store = store
+        self.counter = count(1)
+
+    async def __call__(self, scope, receive, send):
+        if (scope['type'] != 'http' or not self._selected(scope)
+                or current_profile.get() is not None
+                or ProfilingMiddleware.active):
+            return await self.app(scope, receive, send)
+        ProfilingMiddleware.active = True
+        profile = RequestProfile(id=uuid.uuid4().hex, method=scope['method'],
+                                 path=scope['path'], started=time.time())
+        token = current_profile.set(profile)
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                profile.status = message['status']
+            await send(message)
+
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profiler.disable()
+            profile.total = time.perf_counter() - start
+            current_profile.reset(token)
+            ProfilingMiddleware.active = False
+            try:
+                await asyncio.to_thread(self.store.save, profile, profiler)
+            except OSError as e:
+                logger.warning('Profile {} not saved: {}', profile.id, e)
+
+    def _selected(self, scope) -> bool:
+        if self.token:
+            for name, value in scope['headers']:
+                if name == PROFILE_HEADER:
+                    return value == self.token
+        return bool(self.sample) and next(self.counter) % self.sample == 0
+
+
+def install_profiling(app: FastAPI) -> None:
+    '''
+        Nothing is installed unless PROFILE_ENABLED: no per-request or
+        per-statement cost.
+    '''
+    if not settings.PROFILE_ENABLED:
+        return
+    if not event.contains(Engine, 'before_cursor_execute', _before_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_execute)
+    app.add_middleware(ProfilingMiddleware,
+                       token=settings.ADMIN_TOKEN,
+                       sample=settings.PROFILE_SAMPLE,
+                       store=profile_store)
@@ -0,0 +1,15 @@
+from datetime import datetime
+from typing import Any
+
+from schemas.base import BaseSchema
+
+
+class AggregateSchemaOut(BaseSchema):
+    name: str
+    refreshed_at: datetime | None = None
+    groups: list[dict[str, Any]]
+
+
+class BucketCountSchemaOut(BaseSchema):
+    bucket: datetime
+    count: int
@@ -0,0 +1,14 @@
+from datetime import datetime
+from typing import Any
+
+from schemas.base import BaseSchema
+
+
+class AuditRecordSchemaOut(BaseSchema):
+    id: int | None
+    table_name: str
+    row_id: int
+    operation: str
+    diff: dict[str, Any]
+    actor: str | None = None
+    time: datetime
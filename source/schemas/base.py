@@ -1,8 +1,11 @@
+from functools import cache
+
 from pydantic import BaseModel, Field, create_model
 
 
 class OptionalFieldsMixin:
     @classmethod
+    @cache
     def optional_fields(cls) -> type[BaseModel]:
         fields = {
             name: (info.annotation | None, Field(default=None))
@@ -15,3 +18,14 @@ class OptionalFieldsMixin:
 
 class BaseSchema(BaseModel, OptionalFieldsMixin):
     ...
+
+
+@cache
+def page_schema(schema: type[BaseModel]) -> type[BaseModel]:
+    '''
+        Keyset page of schema items, next_after is the key to request
+        the next page with (None on the last page).
+    '''
+    return create_model(f'{schema.__name__}Page',
+                        items=(list[schema], ...),
+                        next_after=(int | None, None))
@@ -0,0 +1,33 @@
+from enum import Enum
+from typing import Any
+
+from pydantic import Field
+from schemas.base import BaseSchema
+
+
+class BatchOperationKind(str, Enum):
+    create = 'create'
+    update = 'update'
+    delete = 'delete'
+
+
+class BatchOperationSchemaIn(BaseSchema):
+    '''
+        One operation of a batch. model is the table name of a model
+        served by a RouterGenerator. ref names the id created by a create
+        operation, later operations refer to it by {"$ref": "<name>"} as
+        id or as a value of data.
+    '''
+    op: BatchOperationKind
+    model: str
+    id: int | dict[str, str] | None = None
+    data: dict[str, Any] = Field(default_factory=dict)
+    ref: str | None = None
+
+
+class BatchResultSchemaOut(BaseSchema):
+    index: int
+    op: BatchOperationKind
+    model: str
+    id: int
+    ref: str | None = None
@@ -15,6 +15,10 @@ class DeviceBaseSchemaOut(DeviceBaseSchema):
     id: int
 
 
+class DeviceListSchemaOut(DeviceBaseSchemaOut):
+    created: datetime
+
+
 class DeviceBaseSchemaIn(DeviceBaseSchema):
     ...
 
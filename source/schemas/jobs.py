@@ -0,0 +1,20 @@
+from datetime import datetime
+from typing import Any
+
+from schemas.base import BaseSchema
+
+
+class JobSchemaOut(BaseSchema):
+    id: int
+    kind: str
+    target: str
+    status: str
+    total: int
+    processed: int
+    result: dict[str, Any]
+    error: str | None = None
+    created: datetime
+    updated: datetime
+
+    class Config:
+        from_attributes = True
@@ -1,4 +1,4 @@
-from device_base import DeviceBaseSchemaOut
+from schemas.device_base import DeviceBaseSchemaOut
 from schemas.vendors_base import VendorBaseSchema
 
 
@@ -0,0 +1,31 @@
+'''
+Production entrypoint.
+
+    python source/server.py
+
+Runs SERVER_WORKERS (CPU count by default) uvicorn worker processes with
+uvloop and httptools. Every worker imports the app and creates its own
+engine, warms up in lifespan and on SIGTERM stops accepting connections
+and waits up to SERVER_GRACEFUL_SHUTDOWN seconds for in-flight requests.
+'''
+import os
+
+import uvicorn
+from config import settings
+
+
+def workers_count() -> int:
+    return settings.SERVER_WORKERS or os.cpu_count() or 1
+
+
+if __name__ == '__main__':
+    uvicorn.run('main:app',
+                host=f'{settings.HOST}',
+                port=settings.HTTP_PORT,
+                workers=workers_count(),
+                loop='uvloop',
+                http='httptools',
+                lifespan='on',
+                timeout_graceful_shutdown=settings.SERVER_GRACEFUL_SHUTDOWN,
+                access_log=False,
+                log_level='info')
@@ -1,9 +1,19 @@
 import asyncio
-from typing import AsyncIterator, Generator
+from pathlib import Path
+from typing import AsyncIterator, Callable, Generator
 
+import asyncpg
 import pytest
+from alembic import command
+from alembic.config import Config
+from config import settings
+from db import backend
+from db.models.base import Base
+from db.notifications import dsn
 from httpx import AsyncClient
 from main import app
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
 from starlette.testclient import TestClient
 
 
@@ -28,3 +38,68 @@ def test_client_() -> Generator[TestClient, None, None]:
 async def test_client() -> AsyncIterator[AsyncClient]:
     async with AsyncClient(app=app, base_url='http://testserver') as client:
         yield client
+
+
+@pytest.fixture
+async def postgres() -> AsyncIterator[asyncpg.Connection]:
+    '''Connection to the database from .env, skips the test without it.'''
+    try:
+        connection = await asyncio.wait_for(asyncpg.connect(dsn()), 2)
+    except Exception:
+        pytest.skip('Postgres is not available')
+    yield connection
+    await connection.close()
+
+
+def _upgrade(connection) -> None:
+    config = Config()
+    config.set_main_option(
+        'script_location', str(Path(__file__).parents[1] / 'migrations'))
+    config.attributes['connection'] = connection
+    command.upgrade(config, 'head')
+
+
+@pytest.fixture
+async def migrated() -> AsyncIterator[async_sessionmaker]:
+    '''
+        Sessions on the database from .env with every migration applied
+        to a scratch schema, all of it rolled back after the test.
+        Skips the test without Postgres.
+    '''
+    engine = create_async_engine(settings.DB_URL, poolclass=NullPool)
+    try:
+        connection = await asyncio.wait_for(engine.connect(), 2)
+    except Exception:
+        await engine.dispose()
+        pytest.skip('Postgres is not available')
+    transaction = await connection.begin()
+    await connection.exec_driver_sql('CREATE SCHEMA migrated')
+    await connection.exec_driver_sql('SET LOCAL search_path TO migrated')
+    await connection.run_sync(_upgrade)
+    yield async_sessionmaker(connection, expire_on_commit=False,
+                             join_transaction_mode='create_savepoint')
+    await transaction.rollback()
+    await connection.close()
+    await engine.dispose()
+
+
+@pytest.fixture
+async def sqlite(tmp_path, monkeypatch) -> AsyncIterator[Callable]:
+    '''
+        SQLite mode on a temporary database: await sqlite(*models)
+        creates the tables of models and returns a session maker.
+    '''
+    pytest.importorskip('aiosqlite')
+    monkeypatch.setattr(backend, 'SQLITE', True)
+    engine = create_async_engine(f'sqlite+aiosqlite:///{tmp_path}/test.db')
+    backend.configure(engine)
+
+    async def create(*models) -> async_sessionmaker:
+        async with engine.begin() as connection:
+            await connection.run_sync(
+                Base.metadata.create_all,
+                tables=[model.__table__ for model in models])
+        return async_sessionmaker(engine, expire_on_commit=False)
+
+    yield create
+    await engine.dispose()
@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+from crud_router import admission as admission_module
+from crud_router.admission import (
+    AdmissionController,
+    Priority,
+    RouteClass,
+    admission,
+    admit_stream,
+)
+from exceptions.http_exceptions import HTTPServiceOverloaded
+from fastapi import Depends, FastAPI
+from fastapi.responses import StreamingResponse
+from httpx import ASGITransport, AsyncClient
+
+
+@pytest.fixture
+def controller(monkeypatch) -> AdmissionController:
+    controller = AdmissionController('heavy', limit=1, queue_size=1)
+    monkeypatch.setitem(admission_module.controllers, RouteClass.heavy,
+                        controller)
+    return controller
+
+
+def client(app: FastAPI) -> AsyncClient:
+    return AsyncClient(transport=ASGITransport(app=app),
+                       base_url='http://test')
+
+
+async def test_queueing(controller):
+    await controller.acquire()
+    waiter = asyncio.create_task(controller.acquire())
+    await asyncio.sleep(0)
+    assert controller.queued() == 1
+    assert not waiter.done()
+    controller.release()
+    await waiter
+    assert controller.active == 1
+    assert controller.queued() == 0
+
+
+async def test_overloaded(controller):
+    release = asyncio.Event()
+    app = FastAPI()
+
+    async def slow():
+        await release.wait()
+        return 'done'
+
+    app.add_api_route('/slow', slow, dependencies=[
+        Depends(admission(RouteClass.heavy))])
+    async with client(app) as test_client:
+        running = asyncio.create_task(test_client.get('/slow'))
+        queued = asyncio.create_task(test_client.get('/slow'))
+        while controller.queued() < 1:
+            await asyncio.sleep(0.01)
+        response = await test_client.get('/slow')
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == \
+            HTTPServiceOverloaded.headers['Retry-After']
+        release.set()
+        assert (await running).status_code == 200
+        assert (await queued).status_code == 200
+    assert controller.active == 0
+
+
+async def test_priority(controller):
+    await controller.acquire()
+    order = []
+
+    async def acquire(priority: Priority):
+        await controller.acquire(priority)
+        order.append(priority)
+        controller.release()
+
+    normal = asyncio.create_task(acquire(Priority.normal))
+    await asyncio.sleep(0)
+    high = asyncio.create_task(acquire(Priority.high))
+    await asyncio.sleep(0)
+    controller.release()
+    await asyncio.gather(normal, high)
+    assert order == [Priority.high, Priority.normal]
+
+
+async def test_stream_holds_slot(controller):
+    active = []
+
+    async def chunks():
+        for index in range(3):
+            await asyncio.sleep(0.01)
+            active.append(controller.active)
+            yield f'{index}\n'.encode()
+
+    async def stream():
+        return StreamingResponse(chunks())
+
+    app = FastAPI()
+    app.add_api_route('/stream', admit_stream(stream, RouteClass.heavy))
+    async with client(app) as test_client:
+        response = await test_client.get('/stream')
+    assert response.text == '0\n1\n2\n'
+    assert active == [1, 1, 1]
+    assert controller.active == 0
@@ -0,0 +1,118 @@
+import asyncio
+
+from db.aggregates import AGGREGATES, AggregateRefresher, read
+from db.write_events import WriteEvent
+from sqlalchemy import text
+
+
+class Refresher(AggregateRefresher):
+    '''
+        Records refreshes instead of running them, the first of each
+        aggregate finds it locked when busy is set.
+    '''
+
+    def __init__(self, busy: bool = False):
+        super().__init__(None, AGGREGATES.values(), delay=0.05, interval=60)
+        self.refreshed: list[str] = []
+        self.busy = busy
+
+    async def refresh(self, name: str) -> bool:
+        if self.busy and name not in self.refreshed:
+            self.refreshed.append(name)
+            return False
+        self.refreshed.append(name)
+        return True
+
+
+def written(*tables: str) -> list[WriteEvent]:
+    return [WriteEvent(tables=tables, operation='create', ids=(1,))]
+
+
+def test_mark():
+    refresher = Refresher()
+    refresher.mark(written('vendor'))
+    # Labels are read live, only counted tables matter.
+    assert refresher.dirty == set()
+    refresher.mark(written('device'))
+    assert refresher.dirty == {'device_count_by_vendor',
+                               'device_count_by_type'}
+    assert refresher.wakeup.is_set()
+
+
+async def test_writes_are_debounced():
+    refresher = Refresher()
+    refresher.start()
+    try:
+        for _ in range(3):
+            refresher.mark(written('cartridge'))
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.1)
+        assert refresher.refreshed == ['cartridge_count_by_model']
+    finally:
+        await refresher.stop()
+
+
+async def test_locked_aggregate_is_retried():
+    refresher = Refresher(busy=True)
+    refresher.start()
+    try:
+        refresher.mark(written('cartridge'))
+        await asyncio.sleep(0.2)
+        assert refresher.refreshed == ['cartridge_count_by_model'] * 2
+    finally:
+        await refresher.stop()
+
+
+async def counts(session_maker, name: str) -> list[tuple]:
+    async with session_maker() as session:
+        _, rows = await read(session, AGGREGATES[name])
+    return [tuple(row.values()) for row in rows]
+
+
+async def test_refresh_folds_deltas(migrated):
+    async with migrated() as session, session.begin():
+        await session.execute(text(
+            "INSERT INTO vendor (id, name) VALUES (1, 'a'), (2, 'b')"))
+        await session.execute(text(
+            "INSERT INTO device (serial, type, vendor_id) VALUES "
+            "('s1', 'printer', 1), ('s2', 'printer', 1), "
+            "('s3', 'scanner', 2), ('s4', 'scanner', NULL)"))
+    # Counts as of the last refresh until the next one.
+    assert await counts(migrated, 'device_count_by_vendor') == [
+        (1, 'a', 0), (2, 'b', 0)]
+
+    refresher = AggregateRefresher(migrated, AGGREGATES.values(),
+                                   delay=0, interval=60)
+    assert await refresher.refresh('device_count_by_vendor')
+    assert await refresher.refresh('device_count_by_type')
+    assert await counts(migrated, 'device_count_by_vendor') == [
+        (1, 'a', 2), (2, 'b', 1)]
+    assert await counts(migrated, 'device_count_by_type') == [
+        ('printer', 2), ('scanner', 2)]
+
+    async with migrated() as session, session.begin():
+        await session.execute(text(
+            "UPDATE device SET vendor_id = 2, type = 'copier' "
+            "WHERE serial = 's1'"))
+        await session.execute(text(
+            "DELETE FROM device WHERE type = 'scanner'"))
+    for name in ('device_count_by_vendor', 'device_count_by_type'):
+        assert await refresher.refresh(name)
+    assert await counts(migrated, 'device_count_by_vendor') == [
+        (1, 'a', 1), (2, 'b', 1)]
+    assert await counts(migrated, 'device_count_by_type') == [
+        ('copier', 1), ('printer', 1)]
+    async with migrated() as session:
+        pending = await session.scalar(text(
+            'SELECT count(*) FROM device_count_by_vendor_delta'))
+    assert pending == 0
+
+
+async def test_refresh_in_progress_elsewhere(migrated, postgres):
+    refresher = AggregateRefresher(migrated, AGGREGATES.values(),
+                                   delay=0, interval=60)
+    async with postgres.transaction():
+        await postgres.execute(
+            "SELECT pg_advisory_xact_lock(hashtext('device_count_by_type'))")
+        assert not await refresher.refresh('device_count_by_type')
+    assert await refresher.refresh('device_count_by_type')
@@ -0,0 +1,113 @@
+import pytest
+from db import write_events
+from db.audit import AuditLog, current_actor
+from db.models.audit import AuditRecord
+from db.models.base import BaseCommon
+from db.sa_crud import CRUDSA
+from sqlalchemy import func, select
+from sqlalchemy.orm import Mapped
+
+
+class AuditedShelf(BaseCommon):
+    name: Mapped[str]
+
+
+@pytest.fixture
+async def session_maker(sqlite):
+    return await sqlite(AuditedShelf, AuditRecord)
+
+
+@pytest.fixture
+def audit(session_maker, monkeypatch):
+    def make(durability: str, size: int = 100) -> AuditLog:
+        log = AuditLog(session_maker, durability, size=size, batch_size=2,
+                       interval=1)
+        monkeypatch.setattr(write_events, 'commit_hooks',
+                            [*write_events.commit_hooks, log.capture])
+        monkeypatch.setattr(write_events, 'transaction_hooks',
+                            [*write_events.transaction_hooks,
+                             log.write_in_transaction])
+        return log
+    return make
+
+
+async def test_buffered_history(session_maker, audit):
+    log = audit('buffered')
+    shelves = CRUDSA(AuditedShelf)
+    token = current_actor.set('editor@example.com')
+    try:
+        shelf = await shelves.create({'name': 'a'}, session_maker())
+        await shelves.update(shelf.id, {'name': 'b'}, session_maker())
+    finally:
+        current_actor.reset(token)
+
+    history = await log.history(session_maker(), 'audited_shelf', shelf.id)
+    assert [(record['id'], record['operation'], record['diff'])
+            for record in history] == [
+        (None, 'update', {'name': 'b'}), (None, 'create', {'name': 'a'})]
+    assert history[0]['actor'] == 'editor@example.com'
+
+    assert await log.flush() == 2
+    await shelves.delete(shelf.id, session_maker())
+    first = await log.history(session_maker(), 'audited_shelf', shelf.id,
+                              limit=2)
+    assert [record['operation'] for record in first] == ['delete', 'update']
+    last = first[-1]
+    rest = await log.history(session_maker(), 'audited_shelf', shelf.id,
+                             before=(last['time'], last['id']))
+    assert [record['operation'] for record in rest] == ['create']
+
+
+async def test_transaction_durability(session_maker, audit):
+    log = audit('transaction')
+    ids = []
+    async with session_maker() as session, session.begin():
+        ids = await CRUDSA(AuditedShelf).insert_many(
+            [{'name': 'a'}, {'name': 'b'}], session)
+    assert not log.buffer
+    async with session_maker() as session:
+        records = (await session.scalars(
+            select(AuditRecord).order_by(AuditRecord.row_id))).all()
+    assert [(record.row_id, record.diff) for record in records] == [
+        (ids[0], {'name': 'a'}), (ids[1], {'name': 'b'})]
+
+
+async def test_buffer_is_bounded(session_maker, audit):
+    log = audit('buffered', size=1)
+    async with session_maker() as session, session.begin():
+        await CRUDSA(AuditedShelf).insert_many(
+            [{'name': 'a'}, {'name': 'b'}], session)
+    assert len(log.buffer) == 1
+    await log.flush()
+    async with session_maker() as session:
+        assert await session.scalar(select(func.count(AuditRecord.id))) == 1
+
+
+async def test_records_stay_visible_while_written(session_maker, audit):
+    log = audit('buffered')
+    shelf = await CRUDSA(AuditedShelf).create({'name': 'a'}, session_maker())
+    write = log._write
+    seen = []
+
+    async def checked_write(batch):
+        seen.append(len(await log.history(session_maker(), 'audited_shelf',
+                                          shelf.id)))
+        raise RuntimeError('lost connection')
+
+    log._write = checked_write
+    with pytest.raises(RuntimeError):
+        await log.flush()
+    assert seen == [1]
+    assert len(log.buffer) == 1
+    log._write = write
+    assert await log.flush() == 1
+    assert not log.buffer
+
+
+async def test_sensitive_columns_are_redacted(audit):
+    log = audit('buffered')
+    records = log.records([write_events.WriteEvent(
+        ('user',), 'update', (1,),
+        ({'email': 'a@example.com', 'hashed_password': 'x'},))])
+    assert records[0][3] == {'email': 'a@example.com',
+                             'hashed_password': '***'}
@@ -0,0 +1,233 @@
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+
+import pytest
+from crud_router.batch import Batch, BatchError, batch_router
+from crud_router.router_generator import RouterGenerator
+from db.models.base import BaseCommon
+from db.sa_crud import CRUDSA
+from exceptions.sa_handler_manager import QueryCanceled
+from fastapi import Depends, FastAPI, Header, HTTPException
+from httpx import ASGITransport, AsyncClient
+from psycopg2 import errorcodes
+from schemas.base import BaseSchema
+from schemas.batch import BatchOperationSchemaIn
+from sqlalchemy import ForeignKey, func, select
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Mapped, mapped_column
+
+
+class BatchShelf(BaseCommon):
+    name: Mapped[str] = mapped_column(unique=True)
+
+
+class BatchBook(BaseCommon):
+    title: Mapped[str]
+    shelf_id: Mapped[int] = mapped_column(ForeignKey('batch_shelf.id'))
+
+
+class ShelfIn(BaseSchema):
+    name: str
+
+
+class BookIn(BaseSchema):
+    title: str
+    shelf_id: int
+
+
+calls = []
+
+
+async def member():
+    calls.append('member')
+
+
+async def admin(x_role: str = Header(default='')):
+    calls.append('admin')
+    if x_role != 'admin':
+        raise HTTPException(status_code=403)
+
+
+@dataclass(eq=False)
+class Router:
+    db_crud: CRUDSA
+    schema_create: type
+    schema_update: type
+    batch_operations: dict = field(default_factory=lambda: {
+        'create': [Depends(member)], 'update': [Depends(member)],
+        'delete': [Depends(admin), Depends(member)]})
+
+
+def router(model, schema):
+    return Router(CRUDSA(model), schema, schema)
+
+
+REGISTRY = {'batch_shelf': router(BatchShelf, ShelfIn),
+            'batch_book': router(BatchBook, BookIn)}
+
+
+def batch(*operations) -> Batch:
+    return Batch([BatchOperationSchemaIn(**operation)
+                  for operation in operations], REGISTRY)
+
+
+@pytest.fixture
+async def session_maker(sqlite):
+    return await sqlite(BatchShelf, BatchBook)
+
+
+async def test_operations_with_refs(session_maker):
+    operations = batch(
+        {'op': 'create', 'model': 'batch_shelf', 'data': {'name': 'a'},
+         'ref': 'a'},
+        {'op': 'create', 'model': 'batch_book', 'ref': 'b1',
+         'data': {'title': 'one', 'shelf_id': {'$ref': 'a'}}},
+        {'op': 'create', 'model': 'batch_book',
+         'data': {'title': 'two', 'shelf_id': {'$ref': 'a'}}},
+        {'op': 'update', 'model': 'batch_shelf', 'id': {'$ref': 'a'},
+         'data': {'name': 'renamed'}},
+        {'op': 'delete', 'model': 'batch_book', 'id': {'$ref': 'b1'}})
+    assert [len(group.operations) for group in operations.groups] == [
+        1, 2, 1, 1]
+
+    results = await operations.run(session_maker())
+    assert [(result['index'], result['op'].value) for result in results] == [
+        (0, 'create'), (1, 'create'), (2, 'create'), (3, 'update'),
+        (4, 'delete')]
+    shelf_id = results[0]['id']
+    assert results[3]['id'] == shelf_id
+    assert results[4]['id'] == results[1]['id']
+    async with session_maker() as session:
+        assert await session.scalar(select(BatchShelf.name)) == 'renamed'
+        assert list(await session.scalars(select(BatchBook.title))) == [
+            'two']
+
+
+async def test_failure_rolls_back_everything(session_maker):
+    operations = batch(
+        {'op': 'create', 'model': 'batch_shelf', 'data': {'name': 'a'}},
+        {'op': 'update', 'model': 'batch_shelf', 'id': 42,
+         'data': {'name': 'b'}})
+    with pytest.raises(BatchError) as error:
+        await operations.run(session_maker())
+    assert (error.value.index, error.value.status_code) == (1, 404)
+
+    with pytest.raises(BatchError) as error:
+        await batch(
+            {'op': 'create', 'model': 'batch_shelf', 'data': {'name': 'a'}},
+            {'op': 'create', 'model': 'batch_shelf', 'data': {'name': 'a'}},
+        ).run(session_maker())
+    assert error.value.status_code == 409
+    async with session_maker() as session:
+        assert await session.scalar(select(func.count(BatchShelf.id))) == 0
+
+
+def test_invalid_operations_are_rejected():
+    with pytest.raises(BatchError) as error:
+        batch({'op': 'delete', 'model': 'batch_book', 'id': {'$ref': 'x'}})
+    assert error.value.status_code == 422
+    with pytest.raises(BatchError) as error:
+        batch({'op': 'create', 'model': 'vendor', 'data': {}})
+    assert error.value.index == 0
+
+
+async def test_database_errors(session_maker, monkeypatch):
+    with pytest.raises(BatchError) as error:
+        await batch({'op': 'create', 'model': 'batch_book',
+                     'data': {'title': 'one', 'shelf_id': 42}}
+                    ).run(session_maker())
+    assert (error.value.status_code, error.value.detail) == (
+        422, 'Foreign key not present.')
+
+    # Serialization failures reach retryable instead of becoming a 422.
+    crud = REGISTRY['batch_shelf'].db_crud
+    insert_many = crud.insert_many
+    failures = [DBAPIError('INSERT ...', {}, SimpleNamespace(
+        pgcode=errorcodes.SERIALIZATION_FAILURE))]
+
+    async def flaky(rows, session):
+        if failures:
+            raise failures.pop()
+        return await insert_many(rows, session)
+
+    monkeypatch.setattr(crud, 'insert_many', flaky)
+    results = await batch({'op': 'create', 'model': 'batch_shelf',
+                           'data': {'name': 'a'}}).run(session_maker())
+    assert len(results) == 1 and not failures
+
+    async def canceled(rows, session):
+        raise QueryCanceled('Statement timeout')
+
+    monkeypatch.setattr(crud, 'insert_many', canceled)
+    with pytest.raises(QueryCanceled):
+        await batch({'op': 'create', 'model': 'batch_shelf',
+                     'data': {'name': 'b'}}).run(session_maker())
+
+
+async def test_endpoint_runs_model_dependencies(session_maker, monkeypatch):
+    monkeypatch.setattr(RouterGenerator, 'registry', REGISTRY)
+    app = FastAPI()
+    app.include_router(batch_router(session=lambda: session_maker(),
+                                    idempotency=False))
+    calls.clear()
+    create = [{'op': 'create', 'model': 'batch_shelf', 'data': {'name': 'a'},
+               'ref': 'a'},
+              {'op': 'create', 'model': 'batch_book', 'ref': 'b',
+               'data': {'title': 'one', 'shelf_id': {'$ref': 'a'}}}]
+    delete = [{'op': 'delete', 'model': 'batch_book', 'id': {'$ref': 'b'}}]
+    async with AsyncClient(transport=ASGITransport(app=app),
+                           base_url='http://test') as client:
+        response = await client.post('/batch/', json=create)
+        assert response.status_code == 200
+        # Shared by both models, resolved once.
+        assert calls == ['member']
+
+        response = await client.post('/batch/', json=create + delete)
+        assert response.status_code == 403
+        async with session_maker() as session:
+            assert await session.scalar(select(func.count(BatchShelf.id))
+                                        ) == 1
+
+        response = await client.post('/batch/', json=create[:1])
+        assert response.status_code == 409
+        assert 'INSERT' not in response.text
+
+        response = await client.post(
+            '/batch/', headers={'X-Role': 'admin'},
+            json=[{**create[0], 'data': {'name': 'b'}}, *create[1:],
+                  *delete])
+        assert response.status_code == 200
+
+
+async def test_mounted_batch_router(sqlite):
+    from api.v1.app import app
+    from api.v1.batch import router_batch
+    from auth.users import current_active_user
+    from db.db import get_async_session
+    from db.models.vendors import Vendor
+
+    session_maker = await sqlite(Vendor)
+    assert any(getattr(route, 'path', None) == '/batch/'
+               for route in app.routes)
+    assert RouterGenerator.registry['vendor'].db_crud.model is Vendor
+    test_app = FastAPI()
+    test_app.include_router(router_batch)
+    test_app.dependency_overrides = {
+        get_async_session: lambda: session_maker(),
+        current_active_user: lambda: SimpleNamespace(id=1, email='a@b.c')}
+    async with AsyncClient(transport=ASGITransport(app=test_app),
+                           base_url='http://test') as client:
+        response = await client.post('/batch/', json=[
+            {'op': 'create', 'model': 'vendor', 'data': {'name': 'a'},
+             'ref': 'a'},
+            {'op': 'update', 'model': 'vendor', 'id': {'$ref': 'a'},
+             'data': {'name': 'b'}}])
+        assert response.status_code == 200
+        assert [result['op'] for result in response.json()] == [
+            'create', 'update']
+        test_app.dependency_overrides.pop(current_active_user)
+        response = await client.post('/batch/', json=[
+            {'op': 'create', 'model': 'vendor', 'data': {'name': 'c'}}])
+        assert response.status_code == 401
+    async with session_maker() as session:
+        assert await session.scalar(select(Vendor.name)) == 'b'
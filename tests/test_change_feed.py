@@ -0,0 +1,125 @@
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+from crud_router import change_feed
+from crud_router.change_feed import ChangeFeed
+from db.notifications import change_listener
+from db.write_events import WriteEvent
+from pydantic import BaseModel
+
+
+class Item(BaseModel):
+    id: int
+    name: str
+
+
+class FakeCRUD:
+    model = SimpleNamespace(tablename=lambda: 'item')
+
+    def __init__(self):
+        self.loads = 0
+
+    async def get_many(self, ids, session, include=[], exclude=[]):
+        self.loads += 1
+        return [SimpleNamespace(id=id, name=f'item {id}') for id in ids]
+
+
+@asynccontextmanager
+async def session_maker():
+    yield None
+
+
+def make_feed(db_crud, **kwargs) -> ChangeFeed:
+    options = {'buffer_size': 10, 'queue_size': 10, 'heartbeat': 1} | kwargs
+    return ChangeFeed(db_crud, Item, session_maker, **options)
+
+
+def parse(message: bytes) -> dict:
+    fields = dict(line.split(': ', 1)
+                  for line in message.decode().strip().split('\n'))
+    return fields | {'data': json.loads(fields['data'])}
+
+
+async def test_event_is_loaded_once_for_all_clients():
+    db_crud = FakeCRUD()
+    feed = make_feed(db_crud)
+    clients = [feed.stream(None) for _ in range(3)]
+    reads = [asyncio.ensure_future(anext(client)) for client in clients]
+    await asyncio.sleep(0)
+    feed.publish(WriteEvent(('item',), 'update', (1, 2)))
+    messages = [parse(message) for message in await asyncio.gather(*reads)]
+    assert db_crud.loads == 1
+    assert messages[0] == messages[1] == messages[2]
+    assert messages[0]['data'] == {
+        'operation': 'update', 'ids': [1, 2],
+        'items': [{'id': 1, 'name': 'item 1'}, {'id': 2, 'name': 'item 2'}]}
+    for client in clients:
+        await client.aclose()
+    await feed.stop()
+
+
+async def test_resume_from_last_event_id():
+    feed = make_feed(FakeCRUD())
+    client = feed.stream(None)
+    read = asyncio.ensure_future(anext(client))
+    await asyncio.sleep(0)
+    for id in range(1, 4):
+        feed.publish(WriteEvent(('item',), 'delete', (id,)))
+    first = parse(await read)
+    await client.aclose()
+    while feed.last_id < 3:
+        await asyncio.sleep(0)
+
+    resumed = feed.stream(int(first['id']))
+    replayed = [parse(await anext(resumed)) for _ in range(2)]
+    assert [message['data']['ids'] for message in replayed] == [[2], [3]]
+    await resumed.aclose()
+
+    unknown = feed.stream(100)
+    assert parse(await anext(unknown))['event'] == 'reset'
+    await unknown.aclose()
+    await feed.stop()
+
+
+async def test_slow_client_is_disconnected():
+    feed = make_feed(FakeCRUD(), queue_size=1)
+    client = feed.stream(None)
+    read = asyncio.ensure_future(anext(client))
+    await asyncio.sleep(0)
+    for id in range(1, 4):
+        feed.publish(WriteEvent(('item',), 'delete', (id,)))
+    await read
+    while feed.last_id < 3:
+        await asyncio.sleep(0)
+    assert not feed.subscribers
+    await feed.stop()
+
+
+async def test_whole_table_notification_resets_clients():
+    db_crud = FakeCRUD()
+    feed = make_feed(db_crud)
+    client = feed.stream(None)
+    read = asyncio.ensure_future(anext(client))
+    await asyncio.sleep(0)
+    # Payload too large for NOTIFY: the ids are not sent.
+    feed.publish(WriteEvent(('item',), 'update'))
+    assert parse(await read)['event'] == 'reset'
+    assert db_crud.loads == 0
+    await client.aclose()
+    await feed.stop()
+
+
+async def test_listener_reconnect_resets_clients(monkeypatch):
+    feed = make_feed(FakeCRUD())
+    monkeypatch.setattr(change_feed, 'feeds', {})
+    change_feed.register(feed, ('item',))
+    client = feed.stream(None)
+    read = asyncio.ensure_future(anext(client))
+    await asyncio.sleep(0)
+    change_listener._reset()
+    message = parse(await read)
+    assert (message['event'], message['id']) == ('reset', '1')
+    await client.aclose()
+    await feed.stop()
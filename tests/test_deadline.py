@@ -0,0 +1,147 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from config import settings
+from crud_router.admission import RouteClass
+from crud_router.deadline import STATEMENT_TIMEOUT, deadline, stream_deadline
+from crud_router.router_generator import RouterGenerator
+from db.models.base import BaseCommon
+from db.sa_crud import CRUDSA
+from fastapi import Depends, FastAPI
+from fastapi.responses import StreamingResponse
+from httpx import ASGITransport, AsyncClient
+from schemas.base import BaseSchema
+from sqlalchemy.orm import Mapped
+
+SECONDS = 0.15
+
+
+class DeadlineShelf(BaseCommon):
+    name: Mapped[str]
+
+
+class ShelfOut(BaseSchema):
+    id: int
+    name: str
+
+
+session = SimpleNamespace(info={})
+
+
+def get_session():
+    return session
+
+
+def make_app(delays: list[float]) -> FastAPI:
+    '''
+        /slow sleeps delays[0], /stream yields a chunk after each delay.
+    '''
+    app = FastAPI()
+    dependencies = [Depends(deadline(SECONDS, get_session))]
+
+    async def slow():
+        await asyncio.sleep(delays[0])
+        return {'timeout': session.info.get(STATEMENT_TIMEOUT)}
+
+    async def chunks():
+        for index, delay in enumerate(delays):
+            await asyncio.sleep(delay)
+            assert STATEMENT_TIMEOUT not in session.info
+            yield f'{index}\n'.encode()
+
+    async def stream():
+        return StreamingResponse(chunks())
+
+    app.add_api_route('/slow', slow, dependencies=dependencies)
+    app.add_api_route('/stream', stream_deadline(stream, SECONDS),
+                      dependencies=[Depends(deadline(
+                          SECONDS, get_session, statement_timeout=False))])
+    return app
+
+
+def client(app: FastAPI) -> AsyncClient:
+    return AsyncClient(transport=ASGITransport(app=app),
+                       base_url='http://test')
+
+
+async def test_deadline_exceeded():
+    async with client(make_app([0])) as test_client:
+        response = await test_client.get('/slow')
+        assert response.json() == {'timeout': int(SECONDS * 1000)}
+        assert STATEMENT_TIMEOUT not in session.info
+    async with client(make_app([1])) as test_client:
+        response = await test_client.get('/slow')
+    assert response.status_code == 504
+    assert STATEMENT_TIMEOUT not in session.info
+
+
+async def test_client_disconnect(monkeypatch):
+    monkeypatch.setattr(settings, 'DEADLINE_DISCONNECT_POLL', 0.01)
+    messages = []
+
+    async def receive():
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'method': 'GET',
+             'scheme': 'http', 'path': '/slow', 'raw_path': b'/slow',
+             'query_string': b'', 'root_path': '', 'headers': [],
+             'server': ('test', 80), 'client': ('test', 1)}
+    await make_app([1])(scope, receive, send)
+    assert messages[0]['status'] == 499
+
+
+async def test_stream_outlives_deadline():
+    # Longer than the deadline in total, no chunk late.
+    delays = [0.05] * 6
+    async with client(make_app(delays)) as test_client:
+        response = await test_client.get('/stream')
+    assert response.status_code == 200
+    assert response.text == ''.join(f'{index}\n' for index in range(6))
+
+
+async def test_late_stream():
+    async with client(make_app([1])) as test_client:
+        response = await test_client.get('/stream')
+    # Nothing was sent yet.
+    assert response.status_code == 504
+
+    # Headers are out: the transfer is aborted, not ended short.
+    async with client(make_app([0, 0, 1])) as test_client:
+        with pytest.raises(Exception) as error:
+            await test_client.get('/stream')
+    assert error.group_contains(TimeoutError) if isinstance(
+        error.value, ExceptionGroup) else error.errisinstance(TimeoutError)
+
+
+async def test_export_outlives_deadline(sqlite, monkeypatch):
+    session_maker = await sqlite(DeadlineShelf)
+    db_crud = CRUDSA(DeadlineShelf)
+    async with session_maker() as shelves:
+        await db_crud.insert_many([{'name': f'shelf {index}'}
+                                   for index in range(5)], shelves)
+        await shelves.commit()
+    stream_all = db_crud.stream_all
+
+    async def slow_stream_all(*args, **kwargs):
+        async for rows in stream_all(*args, **kwargs):
+            await asyncio.sleep(0.05)
+            yield rows
+
+    monkeypatch.setattr(db_crud, 'stream_all', slow_stream_all)
+    monkeypatch.setattr(settings, 'EXPORT_CHUNK_SIZE', 1)
+    router = RouterGenerator(
+        db_crud=db_crud, schema_basic_out=ShelfOut, prefix='/shelves',
+        session=lambda: session_maker(), route_export=True,
+        admission_control=False, deadlines={RouteClass.heavy: SECONDS},
+        cache_responses=False)
+    app = FastAPI()
+    app.include_router(router)
+    async with client(app) as test_client:
+        response = await test_client.get('/shelves/export/',
+                                         params={'format': 'ndjson'})
+    assert response.status_code == 200
+    assert len(response.text.splitlines()) == 5
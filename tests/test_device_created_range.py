@@ -0,0 +1,136 @@
+import json
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Iterator
+
+from crud_router.router_generator import RouterGenerator
+from db.models.base import BaseCommon
+from db.models.devices import Device
+from db.sa_crud import CRUDSA
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+from schemas.base import BaseSchema
+from sqlalchemy import DateTime, event, text
+from sqlalchemy.orm import Mapped, mapped_column
+
+ROWS = 2_000_000
+START = datetime(2021, 3, 1, tzinfo=timezone.utc)
+END = datetime(2021, 4, 1, tzinfo=timezone.utc)
+
+
+class CreatedShelf(BaseCommon):
+    name: Mapped[str]
+    created: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+
+
+class CreatedShelfOut(BaseSchema):
+    id: int
+    name: str
+
+
+def nodes(plan: dict) -> list[dict]:
+    return [plan, *(node for child in plan.get('Plans', [])
+                    for node in nodes(child))]
+
+
+@contextmanager
+def explained(session) -> Iterator[list[dict]]:
+    '''
+        Yields the EXPLAIN ANALYZE plans of SELECT statements executed
+        on session.
+    '''
+    plans = []
+    connection = session.bind.sync_connection
+
+    def explain(conn, cursor, statement, parameters, context, executemany):
+        if not statement.startswith('SELECT'):
+            return
+        explain_cursor = conn.connection.cursor()
+        explain_cursor.execute(f'EXPLAIN (ANALYZE, FORMAT JSON) {statement}',
+                               parameters)
+        plan = explain_cursor.fetchone()[0]
+        plans.append(json.loads(plan) if isinstance(plan, str) else plan)
+
+    event.listen(connection, 'after_cursor_execute', explain)
+    try:
+        yield plans
+    finally:
+        event.remove(connection, 'after_cursor_execute', explain)
+
+
+async def test_created_range_scan_is_sub_linear(migrated):
+    '''
+        Statements of the device created range routes on the migrated
+        device table (BRIN index), filled in created order.
+    '''
+    async with migrated() as session:
+        await session.execute(text(
+            "INSERT INTO device (serial, type, created) "
+            "SELECT 'S' || n, 'device', "
+            "timestamptz '2020-01-01 00:00+00' + n * interval '1 minute' "
+            "FROM generate_series(1, :rows) AS n"), {'rows': ROWS})
+        # Done by autovacuum (autosummarize), VACUUM needs no transaction.
+        await session.execute(text(
+            "SELECT brin_summarize_new_values('ix_device_created_brin')"))
+        await session.execute(text('ANALYZE device'))
+        pages = await session.scalar(text(
+            "SELECT relpages FROM pg_class "
+            "WHERE oid = 'device'::regclass"))
+        await session.commit()
+
+    devices = CRUDSA(Device)
+    async with migrated() as session:
+        with explained(session) as plans:
+            await devices.count_by_bucket('created', 'day', session,
+                                          START, END)
+            await devices.get_all(session, ranges={'created': (START, END)})
+    assert len(plans) == 2
+
+    for explain in plans:
+        plan = nodes(explain[0]['Plan'])
+        types = [node['Node Type'] for node in plan]
+        assert 'Bitmap Index Scan' in types
+        assert 'Seq Scan' not in types
+        heap = next(node for node in plan
+                    if node['Node Type'] == 'Bitmap Heap Scan')
+        read = (heap.get('Exact Heap Blocks', 0)
+                + heap.get('Lossy Heap Blocks', 0))
+        # One month of ~46 months of rows: a few percent of the table.
+        assert read < pages * 0.05
+        assert heap.get('Rows Removed by Index Recheck', 0) < ROWS * 0.01
+
+
+async def test_export_takes_created_range(sqlite):
+    session_maker = await sqlite(CreatedShelf)
+    db_crud = CRUDSA(CreatedShelf)
+    async with session_maker() as session:
+        await db_crud.insert_many(
+            [{'name': name, 'created': created} for name, created in (
+                ('before', datetime(2021, 2, 28, tzinfo=timezone.utc)),
+                ('first', START),
+                ('end', END))], session)
+        await session.commit()
+    router = RouterGenerator(
+        db_crud=db_crud, schema_basic_out=CreatedShelfOut, prefix='/shelves',
+        session=lambda: session_maker(), route_export=True,
+        range_filters=['created'], admission_control=False,
+        cache_responses=False)
+    app = FastAPI()
+    app.include_router(router)
+    async with AsyncClient(transport=ASGITransport(app=app),
+                           base_url='http://t') as client:
+        response = await client.get('/shelves/export/', params={
+            'fields': 'name', 'created_from': START.isoformat(),
+            'created_to': END.isoformat()})
+        assert response.status_code == 200
+        assert response.text.splitlines() == ['name', 'first']
+
+        invalid = await client.get('/shelves/export/',
+                                   params={'created_from': 'soon'})
+        assert invalid.status_code == 422
+        assert invalid.json()['detail'][0]['loc'] == ['query',
+                                                      'created_from']
+    parameters = app.openapi()['paths']['/shelves/export/']['get'][
+        'parameters']
+    assert {'created_from', 'created_to'} <= {
+        parameter['name'] for parameter in parameters}
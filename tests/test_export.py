@@ -0,0 +1,43 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from crud_router.export import ExportEngine, Exporter
+
+
+async def test_closed_stream_stops_the_copy(monkeypatch):
+    monkeypatch.setattr('db.backend.SQLITE', False)
+    copies = []
+
+    async def copy_to(session, output, **kwargs):
+        copies.append('started')
+        try:
+            while True:
+                await output(b'row\n')
+        finally:
+            copies.append('stopped')
+
+    exporter = Exporter(SimpleNamespace(copy_to=copy_to), session=None,
+                        fields=['id'], engine=ExportEngine.copy,
+                        queue_size=1)
+    chunks = exporter.stream()
+    assert await anext(chunks) == b'row\n'
+    async with asyncio.timeout(1):
+        await chunks.aclose()
+    assert copies == ['started', 'stopped']
+
+
+async def test_copy_error_reaches_the_stream(monkeypatch):
+    monkeypatch.setattr('db.backend.SQLITE', False)
+
+    async def copy_to(session, output, **kwargs):
+        await output(b'row\n')
+        raise RuntimeError('copy failed')
+
+    exporter = Exporter(SimpleNamespace(copy_to=copy_to), session=None,
+                        fields=['id'], engine=ExportEngine.copy)
+    chunks = []
+    with pytest.raises(RuntimeError, match='copy failed'):
+        async for chunk in exporter.stream():
+            chunks.append(chunk)
+    assert chunks == [b'row\n']
@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+from crud_router.idempotency import IdempotencyStore, idempotent
+from db.models.idempotency import IdempotencyKey
+from fastapi import Body, FastAPI, HTTPException
+from httpx import ASGITransport, AsyncClient
+from pydantic import BaseModel
+
+
+class ItemOut(BaseModel):
+    id: int
+    name: str
+
+
+@pytest.fixture
+async def store(sqlite):
+    return IdempotencyStore(await sqlite(IdempotencyKey), ttl=60, lease=5,
+                            wait=2, poll=0.01, purge_interval=60)
+
+
+def make_app(store: IdempotencyStore, calls: list) -> FastAPI:
+    app = FastAPI()
+
+    async def create(data: dict = Body()):
+        calls.append(data)
+        await asyncio.sleep(0.05)
+        if data['name'] == 'taken':
+            raise HTTPException(status_code=409, detail='Unique')
+        return {'id': len(calls), 'name': data['name'], 'secret': 'x'}
+
+    app.add_api_route('/items', idempotent(create, ItemOut, store=store),
+                      methods=['POST'], response_model=ItemOut)
+    return app
+
+
+async def test_repeated_key_replays_response(store):
+    calls = []
+    transport = ASGITransport(app=make_app(store, calls))
+    async with AsyncClient(transport=transport, base_url='http://t') as client:
+        headers = {'Idempotency-Key': 'k1'}
+        first, second = await asyncio.gather(
+            client.post('/items', json={'name': 'a'}, headers=headers),
+            client.post('/items', json={'name': 'a'}, headers=headers))
+        third = await client.post('/items', json={'name': 'a'},
+                                  headers=headers)
+        assert len(calls) == 1
+        assert first.json() == second.json() == third.json() == {
+            'id': 1, 'name': 'a'}
+        assert third.headers['Idempotent-Replayed'] == 'true'
+
+        reused = await client.post('/items', json={'name': 'b'},
+                                   headers=headers)
+        assert reused.status_code == 422
+
+        await client.post('/items', json={'name': 'a'})
+        assert len(calls) == 2
+
+
+async def test_client_errors_are_stored(store):
+    calls = []
+    transport = ASGITransport(app=make_app(store, calls))
+    async with AsyncClient(transport=transport, base_url='http://t') as client:
+        headers = {'Idempotency-Key': 'k2'}
+        for _ in range(2):
+            response = await client.post('/items', json={'name': 'taken'},
+                                         headers=headers)
+            assert response.status_code == 409
+            assert response.json() == {'detail': 'Unique'}
+        assert len(calls) == 1
+    assert await store.purge() == 0
+
+
+async def test_keys_are_scoped_by_principal(store):
+    calls = []
+    transport = ASGITransport(app=make_app(store, calls))
+    async with AsyncClient(transport=transport, base_url='http://t') as client:
+        responses = [
+            await client.post('/items', json={'name': 'a'}, headers={
+                'Idempotency-Key': 'k3', 'Authorization': f'Bearer {user}'})
+            for user in ('alice', 'bob', 'alice')]
+    assert len(calls) == 2
+    assert [response.json()['id'] for response in responses] == [1, 2, 1]
+    assert 'Idempotent-Replayed' not in responses[1].headers
+    assert responses[2].headers['Idempotent-Replayed'] == 'true'
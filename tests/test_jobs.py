@@ -0,0 +1,141 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from db.models.base import BaseCommon
+from db.models.jobs import Job, JobKind, JobStatus
+from db.sa_crud import CRUDSA
+from jobs.executor import JobExecutor, JobLeaseLost, JobQueueFull
+from sqlalchemy import func, inspect, select, update
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Mapped
+
+
+class JobShelf(BaseCommon):
+    name: Mapped[str]
+
+
+@pytest.fixture
+async def session_maker(sqlite):
+    return await sqlite(JobShelf, Job)
+
+
+def executor(session_maker, **options) -> JobExecutor:
+    job_executor = JobExecutor(session_maker, **{
+        'workers': 2, 'db_concurrency': 2, 'chunk_size': 2,
+        'queue_size': 10, 'lease': 60, 'poll_interval': 0.01} | options)
+    job_executor.register(CRUDSA(JobShelf))
+    return job_executor
+
+
+def rows(count: int, prefix: str = 'shelf') -> list[dict]:
+    return [{'name': f'{prefix}{index}'} for index in range(count)]
+
+
+async def test_processes_share_jobs_without_duplicates(session_maker):
+    # Two executors stand for two worker processes on one database.
+    first, second = executor(session_maker), executor(session_maker)
+    jobs = [await first.submit(JobKind.create, 'job_shelf', rows(5, str(n)))
+            for n in range(4)]
+    await first.start()
+    await second.start()
+    try:
+        async with asyncio.timeout(5):
+            while True:
+                statuses = [(await first.get(job.id)).status for job in jobs]
+                if set(statuses) == {JobStatus.done.value}:
+                    break
+                await asyncio.sleep(0.01)
+    finally:
+        await first.stop()
+        await second.stop()
+    async with session_maker() as session:
+        assert await session.scalar(select(func.count(JobShelf.id))) == 20
+    job = await first.get(jobs[0].id)
+    assert (job.processed, job.result['applied'], job.lease) == (5, 5, None)
+    assert 'payload' not in inspect(job).dict
+
+
+async def test_claim_respects_leases(session_maker):
+    job_executor = executor(session_maker)
+    job = await job_executor.submit(JobKind.create, 'job_shelf', rows(1))
+    assert await job_executor.claim() == job.id
+    # Claimed and leased: no other worker gets it.
+    assert await job_executor.claim() is None
+    async with session_maker() as session, session.begin():
+        await session.execute(update(Job).values(
+            lease=datetime.now(timezone.utc) - timedelta(seconds=1)))
+    assert await job_executor.claim() == job.id
+
+    stmt = str(select(Job.id).with_for_update(skip_locked=True).compile(
+        dialect=postgresql.dialect()))
+    assert 'FOR UPDATE SKIP LOCKED' in stmt
+
+
+async def test_stale_checkpoint_rolls_back_chunk(session_maker):
+    job_executor = executor(session_maker)
+    submitted = await job_executor.submit(JobKind.create, 'job_shelf',
+                                          rows(4))
+    await job_executor.claim()
+    async with session_maker() as session:
+        job = await session.get(Job, submitted.id)
+    db_crud = job_executor.cruds['job_shelf']
+    processed, result = await job_executor._apply_chunk(
+        job, db_crud, 0, job.result)
+    assert processed == 2
+    # Another worker already checkpointed the chunk starting at 0.
+    with pytest.raises(JobLeaseLost):
+        await job_executor._apply_chunk(job, db_crud, 0, job.result)
+    async with session_maker() as session:
+        assert await session.scalar(select(func.count(JobShelf.id))) == 2
+
+
+async def test_submit_limits_pending_jobs(session_maker):
+    job_executor = executor(session_maker, queue_size=2)
+    await asyncio.gather(*[
+        job_executor.submit(JobKind.create, 'job_shelf', rows(1))
+        for _ in range(2)])
+    with pytest.raises(JobQueueFull):
+        await job_executor.submit(JobKind.create, 'job_shelf', rows(1))
+    async with session_maker() as session:
+        assert await session.scalar(select(func.count(Job.id))) == 2
+
+
+async def wait_done(job_executor: JobExecutor, job_id: int) -> Job:
+    await job_executor.start()
+    try:
+        async with asyncio.timeout(5):
+            while (job := await job_executor.get(job_id)
+                   ).status == JobStatus.running.value or (
+                       job.status == JobStatus.pending.value):
+                await asyncio.sleep(0.01)
+    finally:
+        await job_executor.stop()
+    return job
+
+
+async def test_reported_errors_are_capped(session_maker):
+    job_executor = executor(session_maker, max_errors=2)
+    job = await job_executor.submit(
+        JobKind.create, 'job_shelf', [{'name': None}] * 3 + rows(1))
+    job = await wait_done(job_executor, job.id)
+    assert job.status == JobStatus.done.value
+    assert (job.result['applied'], job.result['failed']) == (1, 3)
+    assert [error['index'] for error in job.result['errors']] == [0, 1]
+
+
+async def test_failure_needs_the_lease(session_maker):
+    job_executor = executor(session_maker)
+    job = await job_executor.submit(JobKind.create, 'job_shelf', rows(1))
+    await job_executor.claim()
+    async with session_maker() as session, session.begin():
+        await session.execute(update(Job).values(
+            lease=datetime.now(timezone.utc) - timedelta(seconds=1)))
+    # Lease passed: the job may be another worker's now.
+    await job_executor._fail(job.id, 'boom')
+    assert (await job_executor.get(job.id)).status == JobStatus.running.value
+
+    await job_executor.claim()
+    await job_executor._fail(job.id, 'boom')
+    job = await job_executor.get(job.id)
+    assert (job.status, job.error) == (JobStatus.failed.value, 'boom')
@@ -0,0 +1,41 @@
+from db.json_select import json_rows
+from db.models.base import BaseCommon
+from pydantic import BaseModel
+from sqlalchemy import ForeignKey
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Mapped, mapped_column, relationship
+
+
+class JsonShelf(BaseCommon):
+    name: Mapped[str]
+    books: Mapped[list['JsonBook']] = relationship(back_populates='shelf')
+
+
+class JsonBook(BaseCommon):
+    title: Mapped[str]
+    shelf_id: Mapped[int] = mapped_column(ForeignKey('json_shelf.id'))
+    shelf: Mapped[JsonShelf] = relationship(back_populates='books')
+
+
+class BookOut(BaseModel):
+    id: int
+    title: str
+    isbn: str | None = None
+
+
+class ShelfOut(BaseModel):
+    id: int
+    name: str
+    books: list[BookOut]
+
+
+def test_nested_schema_is_rendered_by_json_agg():
+    sql = str(json_rows(JsonShelf, ShelfOut).compile(
+        dialect=postgresql.dialect(),
+        compile_kwargs={'literal_binds': True}))
+    assert sql.count('json_build_object(') == 2
+    assert "'books', (SELECT coalesce(json_agg(" in sql
+    assert 'ORDER BY json_book_1.id' in sql
+    assert 'json_shelf.id = json_book_1.shelf_id' in sql
+    assert "'isbn', NULL" in sql
+    assert sql.endswith('ORDER BY json_shelf.id')
@@ -0,0 +1,38 @@
+import asyncio
+
+import pytest
+from db.loader import BatchLoader
+
+
+async def test_loads_in_one_tick_are_batched():
+    batches = []
+
+    async def load_many(ids):
+        batches.append(ids)
+        return {id: f'item {id}' for id in ids if id != 3}
+
+    loader = BatchLoader(load_many)
+    items = await asyncio.gather(*[loader.load(id) for id in (1, 2, 3, 1)])
+    assert items == ['item 1', 'item 2', None, 'item 1']
+    assert batches == [[1, 2, 3]]
+
+    assert await loader.load(2) == 'item 2'
+    assert batches == [[1, 2, 3]]
+
+
+async def test_cancelled_load_cancels_waiters():
+    started = asyncio.Event()
+
+    async def load_many(ids):
+        started.set()
+        await asyncio.sleep(10)
+
+    loader = BatchLoader(load_many)
+    waiters = asyncio.gather(loader.load(1), loader.load(2))
+    await started.wait()
+    for task in loader.tasks:
+        task.cancel()
+    async with asyncio.timeout(1):
+        with pytest.raises(asyncio.CancelledError):
+            await waiters
+    assert loader.cache == {} and loader.tasks == set()
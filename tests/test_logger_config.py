@@ -0,0 +1,25 @@
+import logger_config
+from config import settings
+from loguru import logger
+
+
+def test_sinks_route_by_threshold(monkeypatch):
+    sinks = {name: [] for name in ('debug', 'info', 'error', 'console')}
+    for name, records in sinks.items():
+        monkeypatch.setattr(logger_config, f'{name.upper()}_SINK',
+                            lambda message, records=records: records.append(
+                                message.record['level'].name))
+    monkeypatch.setattr(settings, 'LOG_LEVEL', 'DEBUG')
+    monkeypatch.setattr(settings, 'LOG_LEVELS', {})
+    monkeypatch.setattr(settings, 'LOG_ENQUEUE', False)
+    logger_config.setup_logging()
+    try:
+        for level in ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'):
+            logger.log(level, 'message')
+    finally:
+        logger.remove()
+        logger.add(logger_config.sys.stderr)
+    assert sinks == {'debug': ['DEBUG'],
+                     'info': ['INFO', 'WARNING'],
+                     'error': ['ERROR', 'CRITICAL'],
+                     'console': ['WARNING', 'ERROR', 'CRITICAL']}
@@ -0,0 +1,39 @@
+import asyncio
+import json
+
+from db.notifications import ChangeListener, decode, encode, origin
+from db.write_events import WriteEvent
+
+
+def test_payload_roundtrip():
+    event = WriteEvent(('device', 'cartridge'), 'update', (1, 2))
+    sender, decoded = decode(encode(event))
+    assert sender == origin()
+    assert decoded == event
+
+
+def test_too_many_ids_mean_whole_table():
+    event = WriteEvent(('device',), 'delete', tuple(range(10000)))
+    payload = encode(event)
+    assert len(payload) < 8000
+    assert decode(payload)[1].ids == ()
+
+
+async def test_listener_receives_other_workers_events(postgres):
+    listener = ChangeListener('test_changes', reconnect_delay=0.1,
+                              healthcheck_interval=1)
+    received = asyncio.Queue()
+    listener.subscribe(received.put_nowait)
+    listener.start()
+    try:
+        while listener.connection is None:
+            await asyncio.sleep(0.01)
+        own = encode(WriteEvent(('vendor',), 'create', (1,)))
+        other = json.dumps({**json.loads(own), 'origin': 'other:1'})
+        await postgres.execute("SELECT pg_notify('test_changes', $1)", own)
+        await postgres.execute("SELECT pg_notify('test_changes', $1)", other)
+        event = await asyncio.wait_for(received.get(), 2)
+        assert event == WriteEvent(('vendor',), 'create', (1,))
+        assert received.empty()
+    finally:
+        await listener.stop()
@@ -0,0 +1,119 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from auth.users import UserManager
+from crud_router.router_generator import RouterGenerator
+from db.models.base import BaseCommon
+from db.models.users import User
+from db.sa_crud import CRUDSA
+from fastapi import FastAPI
+from fastapi.exceptions import ResponseValidationError
+from fastapi_users import schemas
+from fastapi_users_db_sqlalchemy import SQLAlchemyUserDatabase
+from httpx import ASGITransport, AsyncClient
+from offload import (
+    LoopLagMonitor,
+    json_schema,
+    loop_stalls_total,
+    offload,
+    offloaded_total,
+)
+from pydantic import Field
+from schemas.base import BaseSchema
+from sqlalchemy.orm import Mapped
+
+
+class OffloadShelf(BaseCommon):
+    name: Mapped[str]
+
+
+class ShelfIn(BaseSchema):
+    name: str
+
+
+class ShelfOut(BaseSchema):
+    id: int
+    name: str = Field(serialization_alias='label')
+
+
+class Book(BaseSchema):
+    title: str
+    shelf: ShelfIn
+
+
+async def test_small_inputs_run_inline():
+    assert await offload(threading.current_thread, size=1, threshold=2
+                         ) is threading.current_thread()
+    thread = await offload(threading.current_thread, size=2, threshold=2)
+    assert thread.name.startswith('offload')
+    assert offloaded_total.get(function='current_thread') >= 1
+
+
+async def test_loop_stalls_are_counted():
+    monitor = LoopLagMonitor(interval=0.01, warning=0.05)
+    before = loop_stalls_total.get()
+    monitor.start()
+    await asyncio.sleep(0.02)
+    time.sleep(0.1)
+    await asyncio.sleep(0.02)
+    await monitor.stop()
+    assert loop_stalls_total.get() - before >= 1
+
+
+def test_json_schema_has_no_local_refs():
+    schema = json_schema(list[Book])
+    assert '$defs' not in str(schema)
+    assert schema['items']['properties']['shelf']['properties'] == {
+        'name': {'title': 'Name', 'type': 'string'}}
+
+
+@pytest.fixture
+async def client(sqlite):
+    session_maker = await sqlite(OffloadShelf)
+    router = RouterGenerator(
+        db_crud=CRUDSA(OffloadShelf), schema_basic_out=ShelfOut,
+        schema_create=ShelfIn, prefix='/shelves',
+        session=lambda: session_maker(), route_get_all=True,
+        route_create_batch=True, range_filters=['id'],
+        admission_control=False, cache_responses=False, idempotency=False)
+    app = FastAPI()
+    app.include_router(router)
+    async with AsyncClient(transport=ASGITransport(app=app),
+                           base_url='http://test') as test_client:
+        yield test_client
+
+
+async def test_errors_and_bodies_as_fastapi_renders_them(client):
+    response = await client.post('/shelves/batch/', json=[{'name': 'a'}, {}])
+    assert response.status_code == 422
+    assert [error['loc'] for error in response.json()['detail']] == [
+        ['body', 1, 'name']]
+    response = await client.get('/shelves', params={'id_from': 'x'})
+    assert [error['loc'] for error in response.json()['detail']] == [
+        ['query', 'id_from']]
+
+    await client.post('/shelves/batch/', json=[{'name': 'a'}])
+    response = await client.get('/shelves')
+    assert response.json() == [{'id': 1, 'label': 'a'}]
+    with pytest.raises(ResponseValidationError) as error:
+        RouterGenerator._dump(ShelfOut, {'id': 'x', 'name': 'a'})
+    assert error.value.errors()[0]['loc'] == ('response', 'id')
+
+
+async def test_passwords_are_checked_in_the_pool(sqlite):
+    session_maker = await sqlite(User)
+    async with session_maker() as session:
+        manager = UserManager(SQLAlchemyUserDatabase(session, User))
+        await manager.create(schemas.BaseUserCreate(
+            email='reader@example.com', password='secret'))
+        before = offloaded_total.get(function='verify_and_update')
+        credentials = SimpleNamespace(username='reader@example.com',
+                                      password='secret')
+        assert (await manager.authenticate(credentials)).email == (
+            'reader@example.com')
+        credentials.password = 'wrong'
+        assert await manager.authenticate(credentials) is None
+    assert offloaded_total.get(function='verify_and_update') - before == 2
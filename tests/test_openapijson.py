@@ -4,3 +4,13 @@ from httpx import AsyncClient
 async def test_check_openapijson(test_client: AsyncClient):
     response = await test_client.get("/openapi.json")
     assert response.status_code == 200
+
+
+async def test_openapijson_etag(test_client: AsyncClient):
+    response = await test_client.get("/openapi.json")
+    assert response.status_code == 200
+
+    response = await test_client.get(
+        "/openapi.json",
+        headers={'If-None-Match': response.headers['etag']})
+    assert response.status_code == 304
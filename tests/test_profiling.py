@@ -0,0 +1,58 @@
+import pstats
+
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+from profiling import ProfileStore, ProfilingMiddleware, timed
+
+
+def make_app(store: ProfileStore, sample: int = 0) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(ProfilingMiddleware, token='secret', sample=sample,
+                       store=store)
+
+    @app.get('/items')
+    async def items():
+        with timed('serialization'):
+            return [1, 2, 3]
+    return app
+
+
+async def test_header_triggers_profile(tmp_path):
+    store = ProfileStore(str(tmp_path), size=2)
+    transport = ASGITransport(app=make_app(store))
+    async with AsyncClient(transport=transport, base_url='http://t') as client:
+        assert (await client.get('/items')).status_code == 200
+        assert store.list() == []
+        for _ in range(3):
+            await client.get('/items', headers={'X-Profile': 'secret'})
+
+    profiles = store.list()
+    assert len(profiles) == 2
+    summary = profiles[0]
+    assert summary['path'] == '/items'
+    assert summary['status'] == 200
+    assert summary['timings']['serialization'] > 0
+    assert set(summary['timings']) == {'db', 'serialization', 'loop'}
+    pstats.Stats(store.path(summary['id'], 'prof'))
+
+
+async def test_sampling(tmp_path):
+    store = ProfileStore(str(tmp_path), size=10)
+    transport = ASGITransport(app=make_app(store, sample=3))
+    async with AsyncClient(transport=transport, base_url='http://t') as client:
+        for _ in range(6):
+            await client.get('/items')
+    assert len(store.list()) == 2
+
+
+async def test_profiles_route_needs_admin_token(monkeypatch):
+    from api.v1.app import app
+    from config import settings
+
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url='http://t') as client:
+        assert (await client.get('/profiles/')).status_code == 403
+        monkeypatch.setattr(settings, 'ADMIN_TOKEN', 'secret')
+        response = await client.get('/profiles/',
+                                    headers={'X-Admin-Token': 'secret'})
+    assert response.status_code == 200
@@ -0,0 +1,103 @@
+import pytest
+from crud_router.router_generator import RouterGenerator
+from db.models.base import BaseCommon
+from db.sa_crud import CRUDSA
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+from schemas.base import BaseSchema
+from sqlalchemy import ForeignKey
+from sqlalchemy.orm import Mapped, mapped_column, relationship
+
+
+class PagedShelf(BaseCommon):
+    name: Mapped[str]
+    books: Mapped[list['PagedBook']] = relationship(lazy='raise')
+
+
+class PagedBook(BaseCommon):
+    title: Mapped[str]
+    genre: Mapped[str]
+    shelf_id: Mapped[int] = mapped_column(ForeignKey('paged_shelf.id'))
+
+
+class ShelfOut(BaseSchema):
+    id: int
+    name: str
+
+
+class BookOut(BaseSchema):
+    id: int
+    title: str
+
+
+@pytest.fixture
+async def session_maker(sqlite):
+    session_maker = await sqlite(PagedShelf, PagedBook)
+    async with session_maker() as session, session.begin():
+        await CRUDSA(PagedShelf).insert_many(
+            [{'name': 'a'}, {'name': 'b'}], session)
+        await CRUDSA(PagedBook).insert_many(
+            [{'title': f'book {index}', 'shelf_id': 1,
+              'genre': 'poetry' if index % 2 else 'prose'}
+             for index in range(5)] + [
+                {'title': 'other', 'shelf_id': 2, 'genre': 'prose'}],
+            session)
+    return session_maker
+
+
+@pytest.fixture
+async def client(session_maker):
+    router = RouterGenerator(
+        db_crud=CRUDSA(PagedShelf), schema_basic_out=ShelfOut,
+        prefix='/shelves', session=lambda: session_maker(),
+        route_relations=True, relation_schemas={'books': BookOut},
+        admission_control=False, cache_responses=False)
+    app = FastAPI()
+    app.include_router(router)
+    async with AsyncClient(transport=ASGITransport(app=app),
+                           base_url='http://test') as test_client:
+        yield test_client
+
+
+async def test_pages_follow_the_key(client):
+    pages, after = [], None
+    while True:
+        response = await client.get('/shelves/1/books/', params={
+            'limit': 2} | ({'after': after} if after else {}))
+        page = response.json()
+        pages.append([item['title'] for item in page['items']])
+        if (after := page['next_after']) is None:
+            break
+    assert pages == [['book 0', 'book 1'], ['book 2', 'book 3'], ['book 4']]
+
+
+async def test_missing_parent(client):
+    response = await client.get('/shelves/9/books/')
+    assert response.status_code == 404
+    # An existing parent without items is an empty page.
+    response = await client.get('/shelves/2/books/',
+                                params={'genre': 'poetry'})
+    assert response.json() == {'items': [], 'next_after': None}
+
+
+async def test_filters(client):
+    response = await client.get('/shelves/1/books/',
+                                params={'genre': 'poetry'})
+    assert [item['title'] for item in response.json()['items']] == [
+        'book 1', 'book 3']
+    response = await client.get('/shelves/1/books/', params={'color': 'x'})
+    assert response.status_code == 422
+    response = await client.get('/shelves/1/books/', params={'id': 'x'})
+    assert response.json()['detail'][0]['loc'] == ['query', 'id']
+
+
+async def test_with_related_loads_included_only(session_maker):
+    shelves = CRUDSA(PagedShelf)
+    async with session_maker() as session:
+        found = await shelves.get_all_with_related(session, ['id', 'name'])
+    assert [shelf.name for shelf in found] == ['a', 'b']
+    assert 'books' not in found[0].__dict__
+    async with session_maker() as session:
+        found = await shelves.get_all_with_related(
+            session, ['id', 'name', 'books'])
+    assert [len(shelf.books) for shelf in found] == [5, 1]
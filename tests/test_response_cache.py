@@ -0,0 +1,65 @@
+import gzip
+
+from cache.backends import MemoryBackend, evictions_total
+from cache.response_cache import ResponseCache
+from db.write_events import WriteEvent
+from starlette.requests import Request
+
+
+def make_request(path: str, query: str = '', gzip: bool = False) -> Request:
+    headers = [(b'accept-encoding', b'gzip')] if gzip else []
+    return Request({'type': 'http', 'method': 'GET', 'path': path,
+                    'query_string': query.encode(), 'headers': headers})
+
+
+async def test_memory_backend_evicts_least_recently_used():
+    backend = MemoryBackend(max_bytes=20)
+    before = evictions_total.get()
+    await backend.set('a', b'1' * 8)
+    await backend.set('b', b'2' * 8)
+    await backend.get('a')
+    await backend.set('c', b'3' * 8)
+    assert await backend.get('b') is None
+    assert await backend.get('a') == b'1' * 8
+    assert backend.size == 18
+    assert evictions_total.get() - before == 1
+
+
+async def test_write_invalidates_cached_response():
+    cache = ResponseCache(MemoryBackend(1024), gzip_min_size=1024,
+                          gzip_level=6)
+    renders = 0
+
+    async def render() -> bytes:
+        nonlocal renders
+        renders += 1
+        return b'[%d]' % renders
+
+    request = make_request('/vendor', 'b=2&a=1')
+    first = await cache.respond(request, ['vendor'], render)
+    second = await cache.respond(request, ['vendor'], render)
+    assert first.body == second.body == b'[1]'
+    assert second.headers['x-cache'] == 'HIT'
+
+    cache.invalidate([WriteEvent(('vendor',), 'update', (1,))])
+    third = await cache.respond(request, ['vendor'], render)
+    assert third.body == b'[2]'
+    assert third.headers['x-cache'] == 'MISS'
+
+
+async def test_big_bodies_are_stored_gzipped():
+    cache = ResponseCache(MemoryBackend(1 << 20), gzip_min_size=10,
+                          gzip_level=6)
+    body = b'[' + b'1,' * 100 + b'1]'
+
+    async def render() -> bytes:
+        return body
+
+    await cache.respond(make_request('/vendor'), ['vendor'], render)
+    zipped = await cache.respond(make_request('/vendor', gzip=True),
+                                 ['vendor'], render)
+    plain = await cache.respond(make_request('/vendor'), ['vendor'], render)
+    assert zipped.headers['content-encoding'] == 'gzip'
+    assert gzip.decompress(zipped.body) == body
+    assert plain.body == body
+    assert 'content-encoding' not in plain.headers
@@ -0,0 +1,41 @@
+from types import SimpleNamespace
+
+import pytest
+from db.retry import retries_total, retryable
+from sqlalchemy.exc import DBAPIError
+
+
+def db_error(pgcode: str) -> DBAPIError:
+    return DBAPIError('statement', {}, SimpleNamespace(pgcode=pgcode))
+
+
+async def test_retries_deadlock_until_success(mocker):
+    mocker.patch('db.retry.backoff', return_value=0)
+    attempts = []
+
+    @retryable
+    async def write():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise db_error('40P01')
+        return 'done'
+
+    before = retries_total.get(method=write.__qualname__, pgcode='40P01')
+    assert await write() == 'done'
+    assert len(attempts) == 3
+    assert retries_total.get(
+        method=write.__qualname__, pgcode='40P01') - before == 2
+
+
+async def test_other_errors_are_not_retried(mocker):
+    mocker.patch('db.retry.backoff', return_value=0)
+    attempts = []
+
+    @retryable
+    async def write():
+        attempts.append(1)
+        raise db_error('23505')
+
+    with pytest.raises(DBAPIError):
+        await write()
+    assert len(attempts) == 1
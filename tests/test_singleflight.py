@@ -0,0 +1,83 @@
+import asyncio
+
+from db.models.base import BaseCommon
+from db.sa_crud import CRUDSA
+from db.singleflight import SingleFlight, coalesced_total, executed_total
+from sqlalchemy.orm import Mapped
+
+
+class FlightShelf(BaseCommon):
+    name: Mapped[str]
+
+
+async def test_identical_reads_share_one_call():
+    flight = SingleFlight()
+    calls = 0
+
+    async def query():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return calls
+
+    before = coalesced_total.get(table='test')
+    results = await asyncio.gather(
+        *[flight.do('key', query, table='test') for _ in range(10)])
+    assert calls == 1
+    assert results == [1] * 10
+    assert coalesced_total.get(table='test') - before == 9
+
+
+async def test_forget_starts_new_call():
+    flight = SingleFlight()
+    calls = 0
+
+    async def query():
+        nonlocal calls
+        calls += 1
+        call = calls
+        await asyncio.sleep(0.01)
+        return call
+
+    first = asyncio.ensure_future(flight.do('key', query))
+    await asyncio.sleep(0)
+    flight.forget()
+    second = await flight.do('key', query)
+    assert await first == 1
+    assert second == 2
+
+
+async def test_forget_written_tables_only():
+    flight = SingleFlight()
+    calls = []
+
+    async def query(table: str):
+        calls.append(table)
+        await asyncio.sleep(0.01)
+
+    shelves = asyncio.ensure_future(
+        flight.do('shelves', lambda: query('shelf'), table='shelf'))
+    books = asyncio.ensure_future(
+        flight.do('books', lambda: query('book'),
+                  table='book', tables=['book', 'shelf']))
+    authors = asyncio.ensure_future(
+        flight.do('authors', lambda: query('author'), table='author'))
+    await asyncio.sleep(0)
+    flight.forget(['shelf'])
+    await asyncio.gather(
+        flight.do('shelves', lambda: query('shelf'), table='shelf'),
+        flight.do('books', lambda: query('book'), table='book'),
+        flight.do('authors', lambda: query('author'), table='author'),
+        shelves, books, authors)
+    assert sorted(calls) == ['author', 'book', 'book', 'shelf', 'shelf']
+
+
+async def test_reads_after_write_in_transaction_not_shared(sqlite):
+    session_maker = await sqlite(FlightShelf)
+    shelves = CRUDSA(FlightShelf)
+    before = executed_total.get(table='flight_shelf')
+    async with session_maker() as session, session.begin():
+        await shelves.insert_many([{'name': 'a'}], session)
+        found = await shelves.get_all(session)
+        assert [shelf.name for shelf in found] == ['a']
+    assert executed_total.get(table='flight_shelf') == before
@@ -0,0 +1,86 @@
+import pytest
+from db.slow_queries import (
+    REDACTED,
+    SlowQueryRecorder,
+    current_method,
+    current_route,
+    fingerprint,
+    redact,
+    traced,
+)
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import create_async_engine
+
+
+def test_fingerprint_ignores_values():
+    first, key = fingerprint(
+        "SELECT * FROM device WHERE serial = 'a''b' AND id IN ($1, $2, $3)")
+    second, other = fingerprint(
+        "SELECT *  FROM device\n WHERE serial = 'x' AND id IN ($1, $2)")
+    assert first == second == 'SELECT * FROM device WHERE serial = ? AND id IN (...)'
+    assert key == other
+    assert fingerprint('SELECT * FROM vendor')[1] != key
+
+
+def test_redact():
+    assert redact({'hashed_password': 'x', 'name': 'n', 'id': 1},
+                  None, ['password']) == {
+        'hashed_password': REDACTED, 'name': 'n', 'id': 1}
+    assert redact(('abc', 2, 'def'), ['token_1', 'id_1'], ['token']) == [
+        REDACTED, 2, REDACTED]
+    assert redact({'ids': list(range(10))}, None, []) == {
+        'ids': [0, 1, 2, 3, 4, '...']}
+
+
+async def test_recorder_groups_and_evicts():
+    class Crud:
+        @traced
+        async def get_all(self, recorder, duration):
+            return recorder.record("SELECT 1 FROM device WHERE id = 5",
+                                   {'id_1': 5}, duration)
+
+    recorder = SlowQueryRecorder(threshold=0.1, size=2, sensitive=[],
+                                 explain=False)
+    token = current_route.set('GET /devices')
+    try:
+        await Crud().get_all(recorder, 0.2)
+        await Crud().get_all(recorder, 0.4)
+    finally:
+        current_route.reset(token)
+    assert current_method.get() is None
+    recorder.record('SELECT 2 FROM vendor', None, 0.1)
+    recorder.record('SELECT 3', None, 0.3)
+
+    top = recorder.top()
+    assert [summary['statement'] for summary in top] == [
+        'SELECT ? FROM device WHERE id = ?', 'SELECT ?']
+    summary = top[0]
+    assert summary['count'] == 2
+    assert summary['max'] == 0.4
+    assert summary['routes'] == ['GET /devices']
+    assert summary['methods'] == ['Crud.get_all']
+
+
+async def test_failed_statement_leaves_nothing_behind(tmp_path):
+    pytest.importorskip('aiosqlite')
+    engine = create_async_engine(f'sqlite+aiosqlite:///{tmp_path}/slow.db')
+    recorder = SlowQueryRecorder(threshold=0, size=10, sensitive=[],
+                                 explain=False)
+    recorder.attach(engine)
+    async with engine.connect() as connection:
+        with pytest.raises(DBAPIError):
+            await connection.exec_driver_sql('SELECT * FROM missing')
+        await connection.exec_driver_sql('SELECT 1')
+        assert 'query_started' not in connection.sync_connection.info
+    await engine.dispose()
+    assert [summary['statement'] for summary in recorder.top()] == [
+        'SELECT ?']
+
+
+async def test_route_needs_admin_token():
+    from api.v1.app import app
+
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url='http://t') as client:
+        assert (await client.get('/slow-queries/')).status_code == 403
@@ -0,0 +1,119 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from db import backend
+from db.models.base import BaseCommon
+from db.sa_crud import CRUDSA
+from exceptions.sa_handler_manager import ErrorHandler, ItemNotUnique
+from sqlalchemy import DateTime, ForeignKey
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Mapped, mapped_column
+
+
+class LiteShelf(BaseCommon):
+    name: Mapped[str] = mapped_column(unique=True)
+
+
+class LiteBook(BaseCommon):
+    title: Mapped[str]
+    added = mapped_column(DateTime(), nullable=False)
+    shelf_id: Mapped[int] = mapped_column(ForeignKey('lite_shelf.id'))
+
+
+@pytest.fixture
+async def session_maker(sqlite):
+    return await sqlite(LiteShelf, LiteBook)
+
+
+async def test_bulk_paths(session_maker):
+    shelves = CRUDSA(LiteShelf)
+    books = CRUDSA(LiteBook)
+    async with session_maker() as session, session.begin():
+        ids = await shelves.insert_many([{'name': 'a'}, {'name': 'b'}],
+                                        session)
+        await books.insert_many([
+            {'title': 't1', 'shelf_id': ids[0],
+             'added': datetime(2026, 1, 5, 10)},
+            {'title': 't2', 'shelf_id': ids[0],
+             'added': datetime(2026, 1, 5, 12)},
+            {'title': 't3', 'shelf_id': ids[1],
+             'added': datetime(2026, 2, 1)}], session)
+        await shelves.upsert_many([{'id': ids[1], 'name': 'c'}], session)
+
+    async with session_maker() as session:
+        found = await shelves.get_many([ids[1], 99, ids[0]], session)
+        assert [shelf.name for shelf in found] == ['c', 'a']
+
+    async with session_maker() as session:
+        counts = await books.count_by_bucket('added', 'month', session)
+        assert [(row['bucket'], row['count']) for row in counts] == [
+            ('2026-01-01 00:00:00', 2), ('2026-02-01 00:00:00', 1)]
+
+
+async def test_errors_are_translated(session_maker):
+    shelves = CRUDSA(LiteShelf)
+    await shelves.create({'name': 'a'}, session_maker())
+    with pytest.raises(ItemNotUnique):
+        await shelves.create({'name': 'a'}, session_maker())
+    with pytest.raises(SQLAlchemyError, match='Foreign key'):
+        async with session_maker() as session:
+            with ErrorHandler():
+                await CRUDSA(LiteBook).insert_many(
+                    [{'title': 't', 'shelf_id': 42,
+                      'added': datetime(2026, 1, 1)}], session)
+                await session.commit()
+    assert not backend._writer.locked()
+
+
+async def test_writers_take_turns(session_maker):
+    shelves = CRUDSA(LiteShelf)
+    order = []
+
+    async def write(name: str, hold: float):
+        async with session_maker() as session, session.begin():
+            await shelves.insert_many([{'name': name}], session)
+            assert backend._writer.locked()
+            order.append(f'{name} started')
+            await asyncio.sleep(hold)
+            order.append(f'{name} done')
+
+    await asyncio.gather(write('first', 0.05), write('second', 0))
+    assert order == ['first started', 'first done',
+                     'second started', 'second done']
+    assert not backend._writer.locked()
+
+
+async def test_savepoint_release_keeps_transaction_open(session_maker):
+    shelves = CRUDSA(LiteShelf)
+    async with session_maker() as session:
+        await session.begin()
+        async with session.begin_nested():
+            await shelves.insert_many([{'name': 'a'}], session)
+        await session.rollback()
+    async with session_maker() as session:
+        assert await shelves.get_all(session) == []
+
+
+async def test_abandoned_writer_is_released(session_maker, monkeypatch):
+    monkeypatch.setattr(backend, '_ABANDONED_CHECK', 0.01)
+    shelves = CRUDSA(LiteShelf)
+    session = session_maker()
+    await session.begin()
+    await shelves.insert_many([{'name': 'a'}], session)
+
+    async def write():
+        async with session_maker() as other, other.begin():
+            await shelves.insert_many([{'name': 'b'}], other)
+
+    queued = asyncio.ensure_future(write())
+    await asyncio.sleep(0.05)
+    assert not queued.done()
+    # As if cancelled while closing: after_transaction_end never fires.
+    release = backend._release
+    monkeypatch.setattr(backend, '_release', lambda transaction: None)
+    await session.close()
+    monkeypatch.setattr(backend, '_release', release)
+    async with asyncio.timeout(1):
+        await queued
+    assert not backend._writer.locked()
@@ -0,0 +1,123 @@
+import time
+import uuid
+from types import SimpleNamespace
+
+import jwt
+from auth import user_cache as user_cache_module
+from auth.user_cache import (
+    USERS_TABLE,
+    UserCache,
+    _token_ttl,
+    cached_current_user,
+)
+from db.write_events import WriteEvent
+from fastapi import Depends, FastAPI
+from fastapi_users.authentication import AuthenticationBackend, BearerTransport
+from httpx import ASGITransport, AsyncClient
+
+
+def user(active: bool = True):
+    return SimpleNamespace(id=uuid.uuid4(), is_active=active,
+                           is_verified=True)
+
+
+def test_ttl_and_lru(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(time, 'monotonic', lambda: now[0])
+    cache = UserCache(ttl=10, maxsize=2)
+    first, second, third = user(), user(), user()
+    cache.set('a', first)
+    cache.set('b', second, ttl=2)
+    assert cache.get('a') is first
+    now[0] += 3
+    assert cache.get('b') is None
+    cache.set('b', second)
+    cache.get('a')
+    cache.set('c', third)
+    assert cache.get('b') is None
+    assert cache.get('a') is first and cache.get('c') is third
+    now[0] += 11
+    assert cache.get('a') is None
+    cache.set('d', first, ttl=-1)
+    assert cache.get('d') is None
+
+
+def test_invalidation_local_and_remote():
+    cache = UserCache(ttl=60, maxsize=10)
+    first, second = user(), user()
+    cache.set('a1', first)
+    cache.set('a2', first)
+    cache.set('b', second)
+    cache.invalidate_user(first.id)
+    assert cache.get('a1') is None and cache.get('a2') is None
+    assert cache.get('b') is second
+
+    cache.invalidate_remote(WriteEvent(tables=('vendor',), operation='update',
+                                       ids=(str(second.id),)))
+    assert cache.get('b') is second
+    # Ids of notifications are str, cached ids are UUID.
+    cache.invalidate_remote(WriteEvent(tables=(USERS_TABLE,),
+                                       operation='update',
+                                       ids=(str(second.id),)))
+    assert cache.get('b') is None
+    assert not cache.tokens
+
+
+def test_token_ttl():
+    expires = int(time.time()) + 30
+    token = jwt.encode({'sub': '1', 'exp': expires}, 'secret',
+                       algorithm='HS256')
+    assert 25 < _token_ttl(token) <= 30
+    assert _token_ttl(jwt.encode({'sub': '1'}, 'secret',
+                                 algorithm='HS256')) is None
+    assert _token_ttl('opaque-database-token') is None
+    assert _token_ttl('a.b.c') is None
+
+
+async def test_dependency_caches_tokens(monkeypatch):
+    users = {'token-1': user(), 'inactive': user(active=False)}
+    reads = []
+
+    class Strategy:
+        async def read_token(self, token, user_manager):
+            reads.append(token)
+            return users.get(token)
+
+    backend = AuthenticationBackend(
+        name='test', transport=BearerTransport(tokenUrl='login'),
+        get_strategy=lambda: Strategy())
+    cache = UserCache(ttl=60, maxsize=10)
+    sent = []
+
+    async def notify(write_event):
+        sent.append(write_event)
+        return True
+
+    monkeypatch.setattr(user_cache_module.change_listener, 'notify', notify)
+    current_user = cached_current_user(backend, lambda: None, cache=cache)
+    app = FastAPI()
+
+    @app.get('/me')
+    async def me(found=Depends(current_user)):
+        return {'id': str(found.id)}
+
+    async with AsyncClient(transport=ASGITransport(app=app),
+                           base_url='http://test') as client:
+        def get(token):
+            return client.get('/me',
+                              headers={'Authorization': f'Bearer {token}'})
+
+        # Not a JWT: cached with the default TTL instead of failing.
+        assert (await get('token-1')).status_code == 200
+        assert (await get('token-1')).status_code == 200
+        assert reads == ['token-1']
+        assert (await get('inactive')).status_code == 401
+        assert (await get('unknown')).status_code == 401
+        assert (await client.get('/me')).status_code == 401
+
+        users['token-1'].is_active = False
+        await user_cache_module.invalidate_user(users['token-1'].id, cache)
+        assert (await get('token-1')).status_code == 401
+        assert reads.count('token-1') == 2
+        assert [write_event.ids for write_event in sent] == [
+            (users['token-1'].id,)]
@@ -0,0 +1,50 @@
+import pytest
+from db import write_events
+from db.models.base import BaseCommon
+from db.sa_crud import CRUDSA
+from exceptions.sa_handler_manager import ErrorHandler, ItemNotUnique
+from sqlalchemy.orm import Mapped, mapped_column
+
+
+class EventShelf(BaseCommon):
+    name: Mapped[str] = mapped_column(unique=True)
+
+
+@pytest.fixture
+def hooks(monkeypatch) -> dict[str, list]:
+    calls = {'in_transaction': [], 'commit': []}
+    monkeypatch.setattr(write_events, 'transaction_hooks', [
+        lambda session, events: calls['in_transaction'].append(
+            list(events))])
+    monkeypatch.setattr(write_events, 'commit_hooks', [
+        lambda events: calls['commit'].append(list(events))])
+    return calls
+
+
+async def test_savepoint_rollback_keeps_earlier_events(sqlite, hooks):
+    session_maker = await sqlite(EventShelf)
+    shelves = CRUDSA(EventShelf)
+    async with session_maker() as session, session.begin():
+        async with session.begin_nested():
+            first = await shelves.insert_many([{'name': 'a'}], session)
+        with pytest.raises(ItemNotUnique):
+            async with session.begin_nested():
+                with ErrorHandler():
+                    await shelves.insert_many([{'name': 'b'}], session)
+                    await shelves.insert_many([{'name': 'a'}], session)
+        # Released savepoint fires no hooks of its own.
+        assert hooks == {'in_transaction': [], 'commit': []}
+    assert [[event.ids for event in events]
+            for events in hooks['commit']] == [[tuple(first)]]
+    assert hooks['in_transaction'] == hooks['commit']
+    assert write_events.WRITE_EVENTS not in session.info
+
+
+async def test_rollback_discards_events(sqlite, hooks):
+    session_maker = await sqlite(EventShelf)
+    async with session_maker() as session:
+        async with session.begin():
+            await CRUDSA(EventShelf).insert_many([{'name': 'a'}], session)
+            await session.rollback()
+    assert hooks == {'in_transaction': [], 'commit': []}
+    assert write_events.WRITE_EVENTS not in session.info